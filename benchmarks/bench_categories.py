@@ -0,0 +1,108 @@
+"""Benchmark crawling several vessel categories under one request rate.
+
+Serves a few overlapping categories from the local stand-in server and crawls
+them with crawl_engine, once with every category planned in one shard queue
+(the categories take turns) and once one category after another. Like the
+sharded crawl, --processes worker processes share --rate, each capped at its
+share. For each schedule it reports wall time, requests made, the time those
+requests take at the allowed rate (requests / rate), the request rate
+achieved, and how many vessels were stored against the number of distinct
+vessels listed.
+
+    python benchmarks/bench_categories.py --vessels 300 --rate 20 --workers 4 --processes 2
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from requests.cookies import RequestsCookieJar
+
+from common import REPO_ROOT  # noqa: F401 (puts the repo root on sys.path)
+from checkpoint_store import CheckpointStore
+from crawl_engine import ShardQueue, crawl_shards
+from magicport_scraper import SORT_ORDERS, MagicPortScraper
+from stand_in_server import StandInServer, load_vessels
+
+
+def make_categories(vessels):
+    """Three categories over the vessels, each sharing a fifth of its vessels with another"""
+    fifth = len(vessels) // 5
+    return {
+        'fishing': vessels[:3 * fifth],
+        'tug': vessels[2 * fifth:4 * fifth],
+        'passenger': vessels[3 * fifth:] + vessels[:fifth],
+    }
+
+
+def crawl_worker(base_url, store_path, worker, rate, workers):
+    """Worker process: crawl shards at no more than rate requests/sec until none are left"""
+    scraper = MagicPortScraper(base_url=base_url, cookies=RequestsCookieJar(), max_workers=workers,
+                               request_rate=rate, max_rate=rate, cache_path=None, checkpoint_path=store_path)
+    queue = ShardQueue(store_path)
+    try:
+        crawl_shards(scraper, queue, worker)
+    finally:
+        queue.close()
+        scraper.close()
+
+
+def crawl(server, plans, rate, workers, shard_size, processes):
+    """Crawl each {category: pages} plan in turn into one store; (seconds, requests, vessels stored)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, 'store.sqlite')
+        queue = ShardQueue(store_path)
+        served = server.requests_served
+        start = time.perf_counter()
+        for depths in plans:
+            queue.plan(depths, SORT_ORDERS, shard_size)
+            workers_running = [multiprocessing.Process(target=crawl_worker,
+                                                       args=(server.base_url, store_path, f'bench-{i}',
+                                                             rate / processes, workers))
+                               for i in range(processes)]
+            for process in workers_running:
+                process.start()
+            for process in workers_running:
+                process.join()
+        elapsed = time.perf_counter() - start
+        requests = server.requests_served - served
+        queue.close()
+        store = CheckpointStore(store_path)
+        stored = store.vessel_count()
+        store.close()
+    return elapsed, requests, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vessels', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=20.0, help='requests/sec allowed')
+    parser.add_argument('--workers', type=int, default=4, help='detail requests in flight per process')
+    parser.add_argument('--processes', type=int, default=2, help='worker processes sharing --rate')
+    parser.add_argument('--shard-size', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds the stand-in server waits before each response')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    categories = make_categories(load_vessels(limit=args.vessels))
+    with StandInServer(latency=args.latency, categories=categories) as server:
+        depths = dict(server.total_pages)
+        distinct = len(server.vessels)
+        print(f"categories: {', '.join(f'{name} ({len(listed)} vessels)' for name, listed in categories.items())}; "
+              f"{distinct} distinct vessels, {args.rate:g} requests/s, {args.processes} processes "
+              f"of {args.workers} workers")
+        print(f"{'schedule':>12} {'seconds':>8} {'requests':>9} {'requests/rate':>14} {'requests/s':>11} "
+              f"{'stored':>7}")
+        for name, plans in (('interleaved', [depths]),
+                            ('sequential', [{category: pages} for category, pages in depths.items()])):
+            elapsed, requests, stored = crawl(server, plans, args.rate, args.workers, args.shard_size,
+                                              args.processes)
+            print(f"{name:>12} {elapsed:>8.2f} {requests:>9} {requests / args.rate:>14.2f} "
+                  f"{requests / elapsed:>11.2f} {stored:>7}/{distinct}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the typed columnar model against plain string records.
+
+Builds a fleet by repeating the vessels in magicport_fishing_vessels_full_v2.csv
+and compares, for the same records:
+- memory of a DataFrame of strings vs the typed DataFrame from vessel_records
+- size on disk of the CSV export vs the Parquet export
+- time to load each file back into a DataFrame
+
+    python benchmarks/bench_columnar.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from record_sink import export_csv  # noqa: E402
+from vessel_records import read_parquet, to_frame, write_parquet  # noqa: E402
+
+SOURCE = Path(__file__).resolve().parent.parent / 'magicport_fishing_vessels_full_v2.csv'
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    vessels = pd.read_csv(SOURCE, dtype=str, keep_default_na=False).to_dict('records')
+    records = (vessels * (args.rows // len(vessels) + 1))[:args.rows]
+
+    strings = pd.DataFrame(records, dtype=object)
+    typed = to_frame(records)
+    string_mb = strings.memory_usage(deep=True).sum() / 1e6
+    typed_mb = typed.memory_usage(deep=True).sum() / 1e6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'vessels.csv')
+        parquet_path = os.path.join(tmp, 'vessels.parquet')
+        export_csv(records, csv_path)
+        write_parquet(records, parquet_path)
+        csv_mb = os.path.getsize(csv_path) / 1e6
+        parquet_mb = os.path.getsize(parquet_path) / 1e6
+        csv_load = best_time(lambda: pd.read_csv(csv_path, dtype=str, keep_default_na=False), args.repeat)
+        typed_csv_load = best_time(
+            lambda: to_frame(pd.read_csv(csv_path, dtype=str, keep_default_na=False).to_dict('records')),
+            args.repeat)
+        parquet_load = best_time(lambda: read_parquet(parquet_path), args.repeat)
+
+    print(f"{len(records)} records ({len(vessels)} distinct vessels)")
+    print(f"{'':<28} {'strings/CSV':>12} {'typed/Parquet':>14} {'ratio':>7}")
+    print(f"{'memory (MB)':<28} {string_mb:>12.1f} {typed_mb:>14.1f} {string_mb / typed_mb:>6.1f}x")
+    print(f"{'file size (MB)':<28} {csv_mb:>12.1f} {parquet_mb:>14.1f} {csv_mb / parquet_mb:>6.1f}x")
+    print(f"{'load, strings (s)':<28} {csv_load:>12.3f} {parquet_load:>14.3f} {csv_load / parquet_load:>6.1f}x")
+    print(f"{'load, typed (s)':<28} {typed_csv_load:>12.3f} {parquet_load:>14.3f} "
+          f"{typed_csv_load / parquet_load:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark serial vs concurrent vessel-detail fetching in scrape_page.
+
+Runs MagicPortScraper.scrape_page against the local stand-in server with
+different max_workers settings and checks that every setting produces the
+same records in the same order.
+
+    python benchmarks/bench_concurrent_details.py --pages 5 --latency 0.1
+"""
+import argparse
+import time
+
+from requests.cookies import RequestsCookieJar
+
+from common import load_scraper_module
+from stand_in_server import StandInServer, load_vessels
+
+
+def run_once(module, base_url, pages, max_workers):
+    # Effectively unthrottled, so the numbers show the effect of concurrency alone
+    scraper = module.MagicPortScraper(max_workers=max_workers, base_url=base_url,
+                                      cookies=RequestsCookieJar(), request_rate=1000,
+                                      cache_path=None, checkpoint_path=None)
+    start = time.perf_counter()
+    for page in range(1, pages + 1):
+        scraper.scrape_page(page)
+    elapsed = time.perf_counter() - start
+    return elapsed, scraper.vessels_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='seconds the stand-in server waits before each response')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    module = load_scraper_module('ascending')
+    vessels = load_vessels(limit=args.pages * 10)
+
+    with StandInServer(vessels, latency=args.latency) as server:
+        print(f"{args.pages} listing pages, {len(vessels)} vessels, {args.latency * 1000:.0f} ms latency")
+        print(f"{'workers':>8} {'seconds':>9} {'vessels/s':>10} {'speedup':>8}")
+        baseline_time = baseline_records = None
+        for workers in args.workers:
+            elapsed, records = run_once(module, server.base_url, args.pages, workers)
+            if baseline_time is None:
+                baseline_time, baseline_records = elapsed, records
+            elif records != baseline_records:
+                raise SystemExit(f"max_workers={workers} produced different records than max_workers={args.workers[0]}")
+            print(f"{workers:>8} {elapsed:>9.2f} {len(records) / elapsed:>10.1f} {baseline_time / elapsed:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark parsing vessel pages in a process pool against parsing in the fetch threads.
+
+Crawls the same listing pages from the stand-in server (run in its own
+process, so serving pages doesn't compete with the scraper for the GIL) with
+MagicPortScraper's parse_processes set to each of --processes; 0 parses in
+the detail worker threads as before. Reports pages per second, the CPU time
+the scraper process itself used, the pool's mean batch size, and whether
+the records match those of the first setting. The pool's processes are
+started before the clock starts.
+
+Parsing only gets faster with more processes if the machine has the cores
+for them; the number of CPUs is printed with the results.
+
+    python benchmarks/bench_parse_pool.py --pages 20 --workers 16 --processes 0 1 2 4 --backend html.parser
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from requests.cookies import RequestsCookieJar
+
+from common import load_scraper_module
+from stand_in_server import StandInServer, load_vessels
+
+
+def serve(conn, vessel_count, latency):
+    """Child process: run the stand-in server until told to stop"""
+    with StandInServer(load_vessels(limit=vessel_count), latency=latency) as server:
+        conn.send(server.base_url)
+        conn.recv()
+
+
+def run_once(module, base_url, pages, workers, processes, backend):
+    scraper = module.MagicPortScraper(max_workers=workers, base_url=base_url, cookies=RequestsCookieJar(),
+                                      request_rate=10000, cache_path=None, checkpoint_path=None,
+                                      parser_backend=backend, parse_processes=processes)
+    scraper.log_every = 10 ** 9
+    if scraper.parse_pool:
+        # Keep every process busy at once so that all of them get started
+        list(scraper.parse_pool.executor.map(time.sleep, [0.2] * processes))
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    scraper.crawl_pipelined(range(1, pages + 1))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    stats = scraper.parse_pool.stats() if scraper.parse_pool else None
+    records = scraper.vessels_data
+    scraper.close()
+    return elapsed, cpu, records, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=16, help='detail requests in flight')
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--backend', default='html.parser', help='parser backend (see vessel_parsers)')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds the stand-in server waits before each response')
+    args = parser.parse_args()
+
+    module = load_scraper_module('ascending')
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child_conn, args.pages * 10, args.latency), daemon=True)
+    server.start()
+    base_url = conn.recv()
+    try:
+        print(f"{args.pages * 10} vessel pages, {args.workers} workers, {args.backend}, "
+              f"{args.latency * 1000:.0f} ms latency, {os.cpu_count()} CPUs")
+        print(f"{'processes':>9} {'seconds':>8} {'pages/s':>8} {'main CPU s':>11} {'mean batch':>11} "
+              f"{'vessels':>8} {'same':>5}")
+        reference = None
+        for processes in args.processes:
+            elapsed, cpu, records, stats = run_once(module, base_url, args.pages, args.workers, processes,
+                                                    args.backend)
+            reference = records if reference is None else reference
+            batch = stats['mean_batch'] if stats and stats['mean_batch'] else '-'
+            print(f"{processes:>9} {elapsed:>8.2f} {len(records) / elapsed:>8.1f} {cpu:>11.2f} {batch:>11} "
+                  f"{len(records):>8} {'yes' if records == reference else 'NO':>5}")
+    finally:
+        conn.send('stop')
+        server.join(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
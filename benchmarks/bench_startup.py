@@ -0,0 +1,80 @@
+"""Measure scraper startup time in fresh interpreter processes.
+
+Reports, best of --repeat runs:
+- python: starting an empty interpreter (the floor)
+- import: importing magicport_scraper
+- cached cookies: importing it and constructing a MagicPortScraper whose
+  cookies come from the cookie cache
+- chrome cookies: the same, reading the cookies from Chrome (skipped when
+  Chrome's cookie database can't be read on this machine)
+
+Also lists which heavy modules the import pulled in.
+
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_ROOT
+
+HEAVY_MODULES = ('pandas', 'pyarrow', 'numpy', 'httpx', 'browser_cookie3')
+
+CONSTRUCT = '''
+import magicport_scraper
+scraper = magicport_scraper.MagicPortScraper(cache_path=None, checkpoint_path=None, cookie_cache_path={cache!r})
+print(scraper.metrics.startup_seconds)
+'''
+
+
+def run(code, repeat):
+    """Best wall time of running code in a new interpreter, and its last output line"""
+    best = None
+    output = ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode:
+            return None, result.stderr.strip().splitlines()[-1]
+        best = elapsed if best is None else min(best, elapsed)
+        output = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'cookies.json')
+        with open(cache, 'w') as f:
+            json.dump({'saved_at': time.time(), 'cookies': [{
+                'name': 'session', 'value': 'x', 'domain': '.magicport.ai', 'path': '/', 'secure': True,
+                'expires': int(time.time()) + 86400}]}, f)
+        chrome_cache = os.path.join(tmp, 'missing.json')
+
+        floor, _ = run('pass', args.repeat)
+        imported, loaded = run('import sys, magicport_scraper; '
+                               f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))', args.repeat)
+        cached, cached_init = run(CONSTRUCT.format(cache=cache), args.repeat)
+        chrome, chrome_init = run(CONSTRUCT.format(cache=chrome_cache), 1)
+
+    print(f"{'':<16} {'process s':>10} {'__init__ s':>11}")
+    print(f"{'python':<16} {floor:>10.3f}")
+    print(f"{'import':<16} {imported:>10.3f}")
+    print(f"{'cached cookies':<16} {cached:>10.3f} {float(cached_init):>11.4f}")
+    if chrome is None:
+        print(f"{'chrome cookies':<16} {'-':>10} {'-':>11}  (unavailable: {chrome_init})")
+    else:
+        print(f"{'chrome cookies':<16} {chrome:>10.3f} {float(chrome_init):>11.4f}")
+    print(f"heavy modules loaded by the import: {loaded or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark the HTTP transports against the local stand-in server.
+
+Crawls the same listing pages with each transport and reports wall time,
+connections opened (each one costs a simulated handshake), mean detail
+request latency and bytes received:
+
+- close: a new connection per request (Connection: close)
+- default: requests' stock HTTPAdapter, whose keep-alive pool holds 10
+  connections, so with more workers the extra connections are discarded
+- pooled: http_transport.PooledAdapter sized to the worker count
+- http2: http_transport.Http2Adapter (httpx); the stand-in server only speaks
+  HTTP/1.1, so this measures httpx's keep-alive pool rather than multiplexing
+
+    python benchmarks/bench_transport.py --pages 10 --workers 16 --handshake 0.03
+"""
+import argparse
+import logging
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
+
+from common import load_scraper_module
+from stand_in_server import StandInServer, load_vessels
+
+TRANSPORTS = ('close', 'default', 'pooled', 'http2')
+
+
+def run_once(module, server, transport, pages, workers):
+    scraper = module.MagicPortScraper(max_workers=workers, base_url=server.base_url, cookies=RequestsCookieJar(),
+                                      request_rate=1000, cache_path=None, checkpoint_path=None,
+                                      http2=transport == 'http2')
+    if transport in ('close', 'default'):
+        scraper.session.mount('http://', HTTPAdapter())
+    if transport == 'close':
+        scraper.session.headers['Connection'] = 'close'
+    scraper.log_every = 10 ** 9
+
+    connections, sent = server.connections_opened, server.bytes_sent
+    start = time.perf_counter()
+    scraper.crawl_pipelined(range(1, pages + 1))
+    elapsed = time.perf_counter() - start
+    latency = scraper.metrics.summary()['detail']['latency_seconds']['mean']
+    records = len(scraper.vessels_data)
+    scraper.close()
+    return elapsed, server.connections_opened - connections, latency, server.bytes_sent - sent, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds the stand-in server waits before each response')
+    parser.add_argument('--handshake', type=float, default=0.03,
+                        help='seconds the stand-in server waits on each new connection')
+    parser.add_argument('--transports', nargs='+', choices=TRANSPORTS, default=list(TRANSPORTS))
+    args = parser.parse_args()
+
+    module = load_scraper_module('ascending')
+    # The default pool warns about every connection it discards
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+    vessels = load_vessels(limit=args.pages * 10)
+
+    with StandInServer(vessels, latency=args.latency, handshake_latency=args.handshake) as server:
+        print(f"{args.pages} listing pages, {len(vessels)} vessels, {args.workers} workers, "
+              f"{args.latency * 1000:.0f} ms latency, {args.handshake * 1000:.0f} ms handshake")
+        print(f"{'transport':>10} {'seconds':>8} {'connections':>12} {'latency ms':>11} {'KiB':>8} {'vessels':>8}")
+        for transport in args.transports:
+            elapsed, connections, latency, received, records = run_once(
+                module, server, transport, args.pages, args.workers)
+            print(f"{transport:>10} {elapsed:>8.2f} {connections:>12} {latency * 1000:>11.1f} "
+                  f"{received / 1024:>8.0f} {records:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark vessel_query.VesselIndex against filtering a DataFrame with pandas.
+
+Builds a fleet of --vessels records from the scraped CSV (repeated with new
+MMSIs as needed, each given a deterministic position as on the stand-in
+server's pages) and runs the same random bounding box, country and vessel
+type queries both ways:
+
+- pandas: what downstream scripts do, parsing the "lat / lon" strings and
+  scanning every row for each query
+- index: VesselIndex.match
+
+Reports the index build time, the time to apply a batch of position updates,
+median and worst query times, and checks that both give the same vessels.
+
+    python benchmarks/bench_vessel_query.py --vessels 200000 --queries 50
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import REPO_ROOT  # noqa: F401 (puts the repo root on sys.path)
+from stand_in_server import load_vessels, synthetic_voyage
+from vessel_query import VesselIndex, vessel_id
+
+
+def make_fleet(count):
+    """count records with unique MMSIs and URLs and a position each"""
+    # The index keeps one record per vessel, so the DataFrame must too
+    base = list({vessel_id(record): record for record in load_vessels()}.values())
+    fleet = []
+    for i in range(count):
+        record = dict(base[i % len(base)])
+        copy = i // len(base)
+        if copy:
+            record['mmsi'] = f"{record['mmsi']}{copy:03d}"
+            record['url'] = f"{record['url']}-{copy}"
+        record['position'] = synthetic_voyage(record)['position']
+        fleet.append(record)
+    return fleet
+
+
+def pandas_query(df, bbox, countries, types):
+    """Boolean-mask filter the way it is done without an index, positions parsed per query"""
+    south, west, north, east = bbox
+    parts = df['position'].str.split('/', n=1, expand=True)
+    lat = pd.to_numeric(parts[0], errors='coerce')
+    lon = pd.to_numeric(parts[1], errors='coerce')
+    mask = lat.between(south, north) & lon.between(west, east)
+    if countries:
+        mask &= df['country'].isin(countries)
+    if types:
+        mask &= df['vessel_type__sub_type'].isin(types)
+    return np.flatnonzero(mask.to_numpy())
+
+
+def random_queries(fleet, count, seed=0):
+    rng = random.Random(seed)
+    countries = [c for c in {r['country'] for r in fleet} if c != '-']
+    types = sorted({r['vessel_type__sub_type'] for r in fleet})
+    queries = []
+    for _ in range(count):
+        size = rng.choice((2, 5, 10, 30, 90))
+        south = rng.uniform(-80, 80 - size)
+        west = rng.uniform(-180, 180 - size)
+        bbox = (south, west, south + size, west + size)
+        kind = rng.random()
+        query_countries = rng.sample(countries, rng.choice((1, 2, 3))) if kind < 0.6 else None
+        query_types = [rng.choice(types)] if 0.3 < kind < 0.8 else None
+        queries.append((bbox, query_countries, query_types))
+    return queries
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vessels', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=10000, help='position updates in the incremental batch')
+    parser.add_argument('--cell-size', type=float, default=1.0)
+    args = parser.parse_args()
+
+    fleet = make_fleet(args.vessels)
+    index = VesselIndex(cell_size=args.cell_size)
+    build, _ = timed(index.add, fleet)
+
+    # A refresh batch: the same vessels with new positions
+    rng = random.Random(1)
+    updates = []
+    for record in rng.sample(fleet, min(args.updates, len(fleet))):
+        moved = dict(record, position=f'{rng.uniform(-80, 80):.5f} / {rng.uniform(-180, 180):.5f}')
+        updates.append(moved)
+        fleet[index.ids[vessel_id(record)]] = moved
+    update, _ = timed(index.add, updates)
+    df = pd.DataFrame(fleet)
+
+    pandas_times, index_times, mismatches = [], [], 0
+    for bbox, countries, types in random_queries(fleet, args.queries):
+        pandas_time, expected = timed(pandas_query, df, bbox, countries, types)
+        index_time, rows = timed(index.match, bbox, countries, types)
+        pandas_times.append(pandas_time)
+        index_times.append(index_time)
+        mismatches += not np.array_equal(expected, rows)
+
+    print(f"{len(index)} vessels; index built in {build:.2f} s, "
+          f"{len(updates)} position updates applied in {update * 1000:.0f} ms")
+    print(f"{'':>8} {'median ms':>10} {'max ms':>8}")
+    for name, times in (('pandas', pandas_times), ('index', index_times)):
+        print(f"{name:>8} {statistics.median(times) * 1000:>10.2f} {max(times) * 1000:>8.2f}")
+    print(f"{args.queries - mismatches}/{args.queries} queries returned the same vessels")
+
+
+if __name__ == '__main__':
+    main()
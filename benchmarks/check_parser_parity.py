@@ -0,0 +1,51 @@
+"""Check that every parser backend extracts the same data from the fixtures.
+
+Runs parse_vessel_details, parse_vessel_urls, parse_vessel_cards and
+parse_total_pages over the recorded pages in benchmarks/fixtures with each
+installed backend and compares the results with the html.parser reference. Exits non-zero on any mismatch.
+
+    python benchmarks/check_parser_parity.py
+"""
+import sys
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo root on sys.path)
+from record_fixtures import FIXTURES_DIR, load_manifest
+from vessel_parsers import (available_backends, parse_total_pages, parse_vessel_cards, parse_vessel_details,
+                            parse_vessel_urls)
+
+BASE_URL = 'https://magicport.ai'
+
+
+def main():
+    manifest = load_manifest()
+    backends = [b for b in available_backends() if b != 'html.parser']
+    print(f"Comparing {', '.join(backends)} against html.parser")
+    mismatches = 0
+    checks = 0
+
+    def compare(label, extract):
+        nonlocal mismatches, checks
+        expected = extract('html.parser')
+        for backend in backends:
+            checks += 1
+            actual = extract(backend)
+            if actual != expected:
+                mismatches += 1
+                print(f"MISMATCH {label} [{backend}]\n  expected: {expected}\n  actual:   {actual}")
+
+    for filename, path in sorted(manifest['vessels'].items()):
+        html = (FIXTURES_DIR / filename).read_text(encoding='utf-8')
+        compare(filename, lambda backend: parse_vessel_details(html, BASE_URL + path, backend))
+
+    for filename in sorted(manifest['listings']):
+        html = (FIXTURES_DIR / filename).read_text(encoding='utf-8')
+        compare(filename, lambda backend: parse_vessel_urls(html, BASE_URL, backend))
+        compare(filename + ' (cards)', lambda backend: parse_vessel_cards(html, BASE_URL, backend))
+        compare(filename + ' (pagination)', lambda backend: parse_total_pages(html, backend))
+
+    print(f"{checks - mismatches}/{checks} checks matched")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
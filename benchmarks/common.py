@@ -0,0 +1,76 @@
+"""Shared helpers for the benchmark scripts"""
+import importlib.util
+import logging
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# The scraper scripts import their helper modules from the repo root
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+SCRAPER_SCRIPTS = {
+    'ascending': 'magicport-vessel-scraper-ascending.py',
+    'descending': 'magicport-vessel-scraper-descending.py',
+}
+
+
+def load_scraper_module(variant='ascending'):
+    """Import one of the scraper scripts (their file names aren't importable)"""
+    path = REPO_ROOT / SCRAPER_SCRIPTS[variant]
+    spec = importlib.util.spec_from_file_location(f'magicport_scraper_{variant}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # The scripts log every vessel at INFO, which would swamp the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    return module
+
+
+def offline_scraper(module, fixtures_dir, manifest, **kwargs):
+    """A MagicPortScraper whose session serves recorded fixtures instead of the network"""
+    from requests.cookies import RequestsCookieJar
+
+    options = dict(cookies=RequestsCookieJar(), request_rate=1e6, cache_path=None, checkpoint_path=None)
+    options.update(kwargs)
+    scraper = module.MagicPortScraper(**options)
+    adapter = FixtureAdapter(fixtures_dir, manifest)
+    scraper.session.mount('https://', adapter)
+    scraper.session.mount('http://', adapter)
+    return scraper
+
+
+class FixtureAdapter:
+    """requests transport adapter answering from recorded fixture files.
+
+    Requests are matched on path and query; the bare listing URL is served
+    page 1, like the site does.
+    """
+
+    def __init__(self, fixtures_dir, manifest):
+        self.pages = {}
+        for section in ('listings', 'vessels'):
+            for filename, path in manifest[section].items():
+                self.pages[path] = (Path(fixtures_dir) / filename).read_bytes()
+        if '/vessels/fishing?page=1' in self.pages:
+            self.pages.setdefault('/vessels/fishing', self.pages['/vessels/fishing?page=1'])
+
+    def send(self, request, **kwargs):
+        from urllib.parse import urlparse
+
+        import requests
+
+        parsed = urlparse(request.url)
+        path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+        body = self.pages.get(path)
+        response = requests.Response()
+        response.status_code = 200 if body is not None else 404
+        response._content = body if body is not None else b'<html><body>Not found</body></html>'
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
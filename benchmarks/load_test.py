@@ -0,0 +1,142 @@
+"""Load-test a full scraper run against the local stand-in server.
+
+Runs MagicPortScraper.run() from magicport-vessel-scraper-ascending.py (or
+the descending script) end to end against the stand-in server, with
+injected latency, 429 bursts, server errors and login redirects (see
+stand_in_server.Faults). No network access or login is needed.
+
+Reports:
+- throughput: wall time, requests made, vessels and requests per second
+- error recovery: faults injected by kind, failed requests the scraper
+  counted, and URLs still in the dead-letter table after the retry passes
+- correctness: the exported CSV against the records the reference parser
+  (html.parser) reads from the undisturbed pages: vessels missing,
+  duplicated, unexpected or with different field values
+
+Exits non-zero when the output is not exactly the expected records.
+
+    python benchmarks/load_test.py --vessels 300 --error-rate 0.05 --login-rate 0.02 --throttle-every 5
+    python benchmarks/load_test.py --recorded
+"""
+import argparse
+import csv
+import glob
+import logging
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from requests.cookies import RequestsCookieJar
+
+from common import load_scraper_module
+from stand_in_server import Faults, StandInServer, load_vessels
+from vessel_parsers import parse_vessel_details, parse_vessel_urls
+
+
+def expected_records(server, sort_type):
+    """{url: record} the run should export, read from the pages without faults"""
+    records = {}
+    for page in range(1, server.total_pages['fishing'] + 1):
+        path = f'/vessels/fishing?page={page}' + (f'&sort_type={sort_type}' if sort_type != 'asc' else '')
+        _, listing = server.render(path)
+        for vessel_url in parse_vessel_urls(listing, server.base_url):
+            _, page_html = server.render(urlparse(vessel_url).path)
+            records[vessel_url] = parse_vessel_details(page_html, vessel_url)
+    return records
+
+
+def check_output(csv_path, expected):
+    """(missing, duplicated, unexpected, mismatched) vessel URLs of an exported CSV"""
+    seen = {}
+    mismatched = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            url = row['url']
+            seen[url] = seen.get(url, 0) + 1
+            record = expected.get(url)
+            if record and any(row.get(field, '') != (value or '') for field, value in record.items()):
+                mismatched.append(url)
+    missing = [url for url in expected if url not in seen]
+    duplicated = [url for url, count in seen.items() if count > 1]
+    unexpected = [url for url in seen if url not in expected]
+    return missing, duplicated, unexpected, mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--variant', choices=('ascending', 'descending'), default='ascending')
+    parser.add_argument('--vessels', type=int, default=300, help='vessels the stand-in server lists')
+    parser.add_argument('--recorded', action='store_true',
+                        help='serve the recorded pages in benchmarks/fixtures instead of rendered ones')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50.0, help='requests/sec the scraper starts at')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds the stand-in server waits before each response')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='share of requests answered 500/502/504')
+    parser.add_argument('--login-rate', type=float, default=0.02,
+                        help='share of requests redirected to the login page')
+    parser.add_argument('--throttle-every', type=float, default=5.0,
+                        help='seconds between bursts of 429 answers (0 for none)')
+    parser.add_argument('--throttle-for', type=float, default=0.5, help='seconds each 429 burst lasts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the scraper's log")
+    args = parser.parse_args()
+
+    if args.recorded and args.variant == 'descending':
+        parser.error('only the ascending listing is recorded')
+    module = load_scraper_module(args.variant)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    sort_type = 'asc' if args.variant == 'ascending' else 'desc'
+
+    faults = Faults(error_rate=args.error_rate, login_rate=args.login_rate, throttle_every=args.throttle_every,
+                    throttle_for=args.throttle_for, seed=args.seed)
+    server = StandInServer(vessels=None if args.recorded else load_vessels(limit=args.vessels),
+                           latency=args.latency, recorded=args.recorded, faults=faults)
+    cwd = os.getcwd()
+    with server, tempfile.TemporaryDirectory() as tmp:
+        expected = expected_records(server, sort_type)
+        # run() writes its CSV to the working directory
+        os.chdir(tmp)
+        try:
+            scraper = module.MagicPortScraper(
+                base_url=server.base_url, cookies=RequestsCookieJar(), max_workers=args.workers,
+                request_rate=args.rate, cache_path=None, checkpoint_path=os.path.join(tmp, 'checkpoint.sqlite'))
+            scraper.log_every = 10 ** 9
+            start = time.perf_counter()
+            scraper.run()
+            elapsed = time.perf_counter() - start
+            summary = scraper.metrics.summary()
+            dead_letters = scraper.checkpoint.dead_letter_count()
+            trips = sum(breaker.trips for breaker in scraper.session.breakers.values())
+            scraper.close()
+            outputs = glob.glob(os.path.join(tmp, '*.csv'))
+            missing, duplicated, unexpected, mismatched = (
+                check_output(outputs[0], expected) if outputs else (list(expected), [], [], []))
+        finally:
+            os.chdir(cwd)
+
+    requests_made = server.requests_served
+    stored = len(expected) - len(missing)
+    source = 'recorded pages' if args.recorded else f'{args.vessels} rendered vessels'
+    print(f"{args.variant} run over {source}: {args.workers} workers, {args.latency * 1000:.0f} ms latency, "
+          f"{args.error_rate:.0%} errors, {args.login_rate:.0%} login redirects, "
+          f"429 bursts of {args.throttle_for:g}s every {args.throttle_every:g}s")
+    print(f"throughput:  {elapsed:.2f} s, {requests_made} requests ({requests_made / elapsed:.1f}/s), "
+          f"{stored / elapsed:.1f} vessels/s")
+    failed = summary['listing']['errors'] + summary['detail']['errors']
+    print(f"recovery:    injected {dict(faults.injected)}; {failed} requests failed after retries, "
+          f"{trips} breaker trips, {dead_letters} URLs still dead-lettered")
+    print(f"correctness: {stored}/{len(expected)} vessels, {len(duplicated)} duplicated, "
+          f"{len(unexpected)} unexpected, {len(mismatched)} with different fields")
+    for label, urls in (('missing', missing), ('duplicated', duplicated), ('unexpected', unexpected),
+                        ('different', mismatched)):
+        for url in urls[:5]:
+            print(f"  {label}: {url}")
+    if missing or duplicated or unexpected or mismatched:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Record listing and vessel pages as offline fixtures.
+
+Saves the first few listing pages and every vessel page they link to under
+benchmarks/fixtures, with a manifest mapping each file to the site path it
+came from. Records from magicport.ai using your Chrome login by default, or
+from the local stand-in server with --stand-in.
+
+    python benchmarks/record_fixtures.py --pages 3
+    python benchmarks/record_fixtures.py --stand-in --pages 3
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo root on sys.path)
+from stand_in_server import StandInServer
+from vessel_parsers import parse_vessel_urls
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+MANIFEST = FIXTURES_DIR / 'manifest.json'
+
+
+def load_manifest():
+    """Manifest of recorded fixtures: {'listings': {file: path}, 'vessels': {file: path}}"""
+    if MANIFEST.exists():
+        return json.loads(MANIFEST.read_text())
+    return {'listings': {}, 'vessels': {}}
+
+
+def save_manifest(manifest):
+    MANIFEST.write_text(json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+
+
+def record(session, base_url, pages):
+    manifest = load_manifest()
+    (FIXTURES_DIR / 'listings').mkdir(parents=True, exist_ok=True)
+    (FIXTURES_DIR / 'vessels').mkdir(parents=True, exist_ok=True)
+
+    for page in range(1, pages + 1):
+        path = f'/vessels/fishing?page={page}'
+        response = session.get(base_url + path)
+        response.raise_for_status()
+        filename = f'listings/page{page}.html'
+        (FIXTURES_DIR / filename).write_text(response.text, encoding='utf-8')
+        manifest['listings'][filename] = path
+        print(f"Recorded {path}")
+
+        for vessel_url in parse_vessel_urls(response.text, base_url):
+            vessel_path = urlparse(vessel_url).path
+            slug = re.sub(r'[^a-z0-9-]+', '-', vessel_path.rsplit('/', 1)[-1].lower())
+            vessel_response = session.get(vessel_url)
+            vessel_response.raise_for_status()
+            filename = f'vessels/{slug}.html'
+            (FIXTURES_DIR / filename).write_text(vessel_response.text, encoding='utf-8')
+            manifest['vessels'][filename] = vessel_path
+            print(f"Recorded {vessel_path}")
+
+    save_manifest(manifest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--base-url', default='https://magicport.ai')
+    parser.add_argument('--stand-in', action='store_true', help='record from the local stand-in server')
+    args = parser.parse_args()
+
+    session = requests.Session()
+    if args.stand_in:
+        with StandInServer(latency=0) as server:
+            record(session, server.base_url, args.pages)
+    else:
+        import browser_cookie3
+        session.cookies.update(browser_cookie3.chrome(domain_name='magicport.ai'))
+        record(session, args.base_url, args.pages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Offline benchmark suite for the parsing and export hot paths.
+
+Runs against the recorded pages in benchmarks/fixtures (no network) and
+reports throughput separately for:
+
+- get_vessel_details   (vessel pages, per parser backend)
+- get_vessel_urls      (listing-card extraction used by scrape_page, per backend)
+- get_total_pages      (pagination lookup, per backend)
+- save_to_csv          (CSV export of a synthetic fleet built from the fixtures)
+
+Each sample repeats a benchmark for at least --sample-seconds and times the
+mean call, and a benchmark's result is the median of --repeat samples, so
+single calls of a few milliseconds don't turn timer and scheduler noise into
+results.
+
+On shared or virtual machines the CPU speed a process gets drifts by tens of
+percent from one run to the next. Every sample is therefore followed by a
+sample of a fixed reference workload (the standard library's HTMLParser over
+a recorded listing page), and the gate compares the benchmark's time relative
+to that reference, which such drift scales alike. A metric is flagged as a
+regression (non-zero exit) when its relative time is more than --tolerance
+above the baseline's, plus the spread between its fastest and median
+samples, since a slowdown within that spread is noise on this run.
+
+Baselines are still machine-specific, as a change of CPU or Python version
+moves the code and the reference differently. The baseline records the
+machine it was taken on, the suite warns when run elsewhere, and it should be
+refreshed with --update-baseline on the machine that gates changes.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --update-baseline
+"""
+import argparse
+import html.parser
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import load_scraper_module, offline_scraper
+from record_fixtures import FIXTURES_DIR, load_manifest
+from vessel_parsers import available_backends
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+BASE_URL = 'https://magicport.ai'
+
+
+def machine():
+    """What a baseline's timings depend on: CPU, OS and Python version"""
+    cpu = platform.processor() or platform.machine()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    return f"{cpu} x{os.cpu_count()}, {platform.system()}, Python {platform.python_version()}"
+
+
+def reference_workload(page=sorted((FIXTURES_DIR / 'listings').glob('*.html'))[0].read_text(encoding='utf-8')):
+    """Fixed pure-Python work the benchmarks are timed against"""
+    parser = html.parser.HTMLParser()
+    parser.feed(page)
+    parser.close()
+
+
+def timed(func, iterations):
+    """Mean seconds per func() call over iterations calls"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def iterations_for(func, seconds):
+    """How many func() calls take about seconds, measured on a warm-up call"""
+    return max(1, round(seconds / max(timed(func, 1), 1e-9)))
+
+
+def sample_times(func, repeat, sample_seconds):
+    """`repeat` (seconds per func() call, seconds per reference_workload() call)
+    pairs, each timed over about sample_seconds and sample_seconds / 4"""
+    iterations = iterations_for(func, sample_seconds)
+    reference_iterations = iterations_for(reference_workload, sample_seconds / 4)
+    return [(timed(func, iterations), timed(reference_workload, reference_iterations)) for _ in range(repeat)]
+
+
+def measure(name, func, pages, vessels, repeat, sample_seconds):
+    samples = sample_times(func, repeat, sample_seconds)
+    seconds = statistics.median(call for call, _ in samples)
+    relative = [call / reference for call, reference in samples]
+    return {
+        'name': name,
+        'pages_per_sec': pages / seconds if pages else None,
+        'us_per_vessel': seconds / vessels * 1e6 if vessels else None,
+        'us_per_call': seconds / max(pages, 1) * 1e6,
+        # Time per call in reference workloads, which is what is gated on
+        'relative': statistics.median(relative) / max(pages, 1),
+        # How far the median is above the fastest sample, as a share of the fastest
+        'noise': statistics.median(relative) / min(relative) - 1,
+    }
+
+
+def run_suite(repeat, fleet_size, sample_seconds):
+    module = load_scraper_module('ascending')
+    # The edge-case fixtures log expected warnings on every pass
+    logging.getLogger().setLevel(logging.ERROR)
+    manifest = load_manifest()
+    vessel_paths = [path for _, path in sorted(manifest['vessels'].items())]
+    listing_pages = sorted(int(path.rsplit('=', 1)[1]) for path in manifest['listings'].values())
+    results = []
+
+    for backend in available_backends():
+        scraper = offline_scraper(module, FIXTURES_DIR, manifest, base_url=BASE_URL, parser_backend=backend)
+
+        def details():
+            for path in vessel_paths:
+                scraper.get_vessel_details(BASE_URL + path)
+        results.append(measure(f'get_vessel_details[{backend}]', details,
+                               len(vessel_paths), len(vessel_paths), repeat, sample_seconds))
+
+        card_count = sum(len(scraper.get_vessel_urls(page)) for page in listing_pages)
+
+        def listings():
+            for page in listing_pages:
+                scraper.get_vessel_urls(page)
+        results.append(measure(f'get_vessel_urls[{backend}]', listings,
+                               len(listing_pages), card_count, repeat, sample_seconds))
+
+        results.append(measure(f'get_total_pages[{backend}]', scraper.get_total_pages, 1, 0,
+                               repeat, sample_seconds))
+
+    # save_to_csv on a fleet-sized dataset built by repeating the fixture records
+    scraper = offline_scraper(module, FIXTURES_DIR, manifest, base_url=BASE_URL)
+    records = [r for r in (scraper.get_vessel_details(BASE_URL + path) for path in vessel_paths) if r]
+    scraper.vessels_data = [dict(records[i % len(records)], name=f"{records[i % len(records)]['name']} {i}")
+                            for i in range(fleet_size)]
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'vessels.csv')
+        results.append(measure('save_to_csv', lambda: scraper.save_to_csv(output), 0, fleet_size,
+                               repeat, sample_seconds))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the results table; return the names of regressed metrics"""
+    regressions = []
+    print(f"{'benchmark':<32} {'pages/s':>10} {'us/vessel':>11} {'us/call':>11} {'noise':>7} "
+          f"{'baseline':>11} {'change':>8}")
+    for result in results:
+        pages = f"{result['pages_per_sec']:.1f}" if result['pages_per_sec'] else '-'
+        per_vessel = f"{result['us_per_vessel']:.1f}" if result['us_per_vessel'] else '-'
+        reference = baseline.get(result['name'])
+        change = ''
+        base_text = '-'
+        # Baselines written before relative times were recorded can't be compared with
+        if isinstance(reference, dict):
+            base_text = f"{reference['us_per_call']:.1f}"
+            ratio = result['relative'] / reference['relative'] - 1
+            change = f"{ratio * 100:+.0f}%"
+            if ratio > tolerance + result['noise']:
+                regressions.append(result['name'])
+                change += ' !'
+        print(f"{result['name']:<32} {pages:>10} {per_vessel:>11} {result['us_per_call']:>11.1f} "
+              f"{result['noise'] * 100:>6.0f}% {base_text:>11} {change:>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7, help='samples per benchmark (the median is kept)')
+    parser.add_argument('--sample-seconds', type=float, default=0.2,
+                        help='time each sample repeats its benchmark for')
+    parser.add_argument('--fleet-size', type=int, default=5000, help='records written by the save_to_csv benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline, on top of the run\'s own noise, '
+                             'before flagging (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat, args.fleet_size, args.sample_seconds)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    baseline_machine = baseline.pop('machine', None)
+    if baseline and baseline_machine != machine() and not args.update_baseline:
+        print(f"Warning: the baseline was recorded on {baseline_machine or 'another machine'}, not on this one "
+              f"({machine()}); refresh it with --update-baseline before gating on it here")
+    # The baseline holds microseconds and reference workloads per call (per listing page, vessel page or export)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.update_baseline:
+        timings = {r['name']: {'us_per_call': round(r['us_per_call'], 1), 'relative': round(r['relative'], 3)}
+                   for r in results}
+        BASELINE.write_text(json.dumps({'machine': machine(), **timings}, indent=2, sort_keys=True) + '\n')
+        print(f"Baseline written to {BASELINE}")
+        return 0
+    if regressions:
+        print(f"Regressions (> {args.tolerance * 100:.0f}% slower than baseline): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
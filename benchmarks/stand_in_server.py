@@ -0,0 +1,405 @@
+"""Local stand-in for magicport.ai used by the benchmarks.
+
+Serves listing pages and vessel pages rendered from one of the scraped CSVs,
+using the same markup the scraper looks for, or the pages recorded under
+benchmarks/fixtures (see record_fixtures.py). Listing pages link the first
+few pages and the last one, followed by the locked pages, like the site.
+
+Responses can be delayed to mimic network latency, new connections can be
+delayed to mimic a TCP/TLS handshake, and clients that ask get
+gzip-compressed responses. Faults adds 429 bursts, server errors and
+redirects to the login page.
+"""
+import collections
+import csv
+import gzip
+import hashlib
+import html
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+from common import REPO_ROOT
+
+DEFAULT_CSV = REPO_ROOT / 'magicport_fishing_vessels_full_v2.csv'
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+VESSELS_PER_PAGE = 10
+ERROR_STATUSES = (500, 502, 504)
+PAGE_LINK = re.compile(r'(href="\?page=)(\d+)(">)(\d+)(<)')
+
+# Table headers as they appear on the site, keyed by the scraper's field names
+TABLE_HEADERS = {
+    'mmsi': 'MMSI',
+    'imo': 'IMO',
+    'call_sign': 'Call Sign',
+    'vessel_type__sub_type': 'Vessel Type /Sub Type',
+    'gross_tonnage': 'Gross Tonnage',
+    'deadweight': 'Deadweight',
+    'length': 'Length',
+    'year_built': 'Year Built',
+    'built_at_(shipyard)': 'Built At (Shipyard)',
+}
+
+
+def load_vessels(csv_path=DEFAULT_CSV, limit=None):
+    """Load vessel rows from a scraped CSV"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    return rows[:limit] if limit else rows
+
+
+def vessel_path(vessel):
+    """Site-relative path of a vessel page, taken from its scraped URL"""
+    return urlparse(vessel['url']).path
+
+
+def synthetic_voyage(vessel):
+    """Deterministic voyage information for a vessel (the CSVs don't carry it)"""
+    digest = hashlib.md5(vessel['mmsi'].encode()).digest()
+    lat = (digest[0] * 256 + digest[1]) / 65535 * 160 - 80
+    lon = (digest[2] * 256 + digest[3]) / 65535 * 360 - 180
+    hours = digest[4] % 72
+    return {
+        'reported_destination': ['FISHING GROUND', 'BUSAN', 'LAS PALMAS', '-'][digest[5] % 4],
+        'position': f'{lat:.5f} / {lon:.5f}',
+        'position_received': f'{hours} hours ago' if hours else 'just now',
+    }
+
+
+def _page_chrome():
+    """Navigation, footer and inline script blocks that pad pages to a realistic size"""
+    nav = ''.join(f'<li class="nav__item"><a class="nav__link" href="/vessels/type-{i}">Vessel type {i}</a></li>'
+                  for i in range(120))
+    footer = ''.join(f'<li class="footer__item"><a href="/ports/port-{i}">Port {i}</a></li>' for i in range(150))
+    state = ','.join(f'{{"id":{i},"label":"filter {i}","enabled":{str(i % 2 == 0).lower()}}}' for i in range(200))
+    head = f"""<link rel="stylesheet" href="/static/app.css">
+<script src="/static/app.js"></script>
+<script>window.__STATE__ = {{"filters":[{state}]}};</script>"""
+    header = f"""<header class="header"><nav class="nav"><ul class="nav__list">{nav}</ul>
+<a href="/account">Account</a></nav></header>"""
+    return head, header, f'<footer class="footer"><ul class="footer__list">{footer}</ul></footer>'
+
+
+PAGE_HEAD, PAGE_HEADER, PAGE_FOOTER = _page_chrome()
+
+
+def _page_shell(title, main):
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{title} - MagicPort</title>
+{PAGE_HEAD}</head>
+<body>
+  {PAGE_HEADER}
+  <main class="main">{main}
+  </main>
+  {PAGE_FOOTER}
+</body>
+</html>"""
+
+
+def render_listing_page(vessels, page, total_pages, category='fishing'):
+    """Render one /vessels/<category> listing page"""
+    start = (page - 1) * VESSELS_PER_PAGE
+    cards = []
+    for vessel in vessels[start:start + VESSELS_PER_PAGE]:
+        name = html.escape(vessel['name'])
+        vessel_type = html.escape(vessel['vessel_type__sub_type'])
+        cards.append(f'''
+      <div class="card card--vessel">
+        <div class="card__header"><span class="card__title">{name}</span></div>
+        <div class="card__body">
+          <span class="card__type">{vessel_type}</span>
+          <span class="card__flag">{html.escape(vessel['country'])}</span>
+        </div>
+        <a class="button" title=" Vessel" href="{vessel_path(vessel)}">Show vessel</a>
+      </div>''')
+
+    # Only the first few pages are reachable, the rest are shown locked
+    links = []
+    for num in range(1, min(total_pages, 5) + 1):
+        links.append(f'<li class="pagination__item"><a class="pagination__item-link" href="?page={num}">{num}</a></li>')
+    if total_pages > 5:
+        links.append('<li class="pagination__item"><a class="pagination__item-link" href="#">...</a></li>')
+        links.append(f'<li class="pagination__item"><a class="pagination__item-link" href="?page={total_pages}">{total_pages}</a></li>')
+        links.append('<li class="pagination__item pagination__item--locked"><a class="pagination__item-link" href="#"><i class="icon-lock"></i></a></li>')
+
+    title = f'{category.capitalize()} vessels'
+    main = f'''
+    <h1>{title}</h1>
+    <div class="vessels">{''.join(cards)}
+    </div>
+    <ul class="pagination">
+      {''.join(links)}
+    </ul>'''
+    return _page_shell(title, main)
+
+
+def render_login_page():
+    """The page the site redirects to once the session has expired"""
+    main = '''
+    <h1>Log in</h1>
+    <form class="form" method="post" action="/login">
+      <input type="email" name="email"><input type="password" name="password">
+      <button type="submit">Log in</button>
+    </form>'''
+    return _page_shell('Log in', main)
+
+
+def load_recorded_pages(fixtures_dir=FIXTURES_DIR):
+    """{path: html} of the recorded fixtures, and the number of recorded listing pages.
+
+    Pagination links past the recorded listing pages are pointed at the last
+    recorded one, so get_total_pages finds only pages that can be served.
+    """
+    fixtures_dir = Path(fixtures_dir)
+    manifest = json.loads((fixtures_dir / 'manifest.json').read_text())
+    total_pages = len(manifest['listings'])
+
+    def clamp(match):
+        page = min(int(match.group(2)), total_pages)
+        return f'{match.group(1)}{page}{match.group(3)}{min(int(match.group(4)), total_pages)}{match.group(5)}'
+
+    pages = {}
+    for filename, path in manifest['listings'].items():
+        pages[path] = PAGE_LINK.sub(clamp, (fixtures_dir / filename).read_text(encoding='utf-8'))
+        # The bare listing URL is page 1, like on the site
+        if path.endswith('?page=1'):
+            pages.setdefault(path[:-len('?page=1')], pages[path])
+    for filename, path in manifest['vessels'].items():
+        pages[path] = (fixtures_dir / filename).read_text(encoding='utf-8')
+    return pages, total_pages
+
+
+class Faults:
+    """Failures the stand-in server injects, drawn from a seeded random generator.
+
+    - error_rate: share of requests answered with HTTP 500, 502 or 504
+    - login_rate: share of requests redirected to the login page, as when the
+      session cookie has run out
+    - throttle_every, throttle_for: every throttle_every seconds, a burst of
+      throttle_for seconds in which every request is answered with HTTP 429
+      and a Retry-After of retry_after seconds
+
+    The bare listing page, which the scraper checks its login on and reads
+    the page count from, is never failed, so that a run can always start.
+    """
+
+    def __init__(self, error_rate=0.0, login_rate=0.0, throttle_every=0.0, throttle_for=0.0, retry_after=1,
+                 seed=0):
+        self.error_rate = error_rate
+        self.login_rate = login_rate
+        self.throttle_every = throttle_every
+        self.throttle_for = throttle_for
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        # Injected faults by kind: 'throttled', 'error', 'login'
+        self.injected = collections.Counter()
+
+    def pick(self):
+        """The fault for the next request: 'throttled', 'error', 'login' or None.
+        Callers hold the server's lock."""
+        fault = None
+        if self.throttle_every and (time.monotonic() - self.started) % self.throttle_every < self.throttle_for:
+            fault = 'throttled'
+        else:
+            roll = self.random.random()
+            if roll < self.error_rate:
+                fault = 'error'
+            elif roll < self.error_rate + self.login_rate:
+                fault = 'login'
+        if fault:
+            self.injected[fault] += 1
+        return fault
+
+
+def render_vessel_page(vessel):
+    """Render one vessel detail page"""
+    rows = ''.join(
+        f'<tr><th>{header}</th><td>{html.escape(vessel.get(field, "-"))}</td></tr>'
+        for field, header in TABLE_HEADERS.items()
+    )
+    name = html.escape(vessel['name'])
+    country = vessel['country'].upper() if vessel['country'] != '-' else '-'
+    voyage = synthetic_voyage(vessel)
+    main = f'''
+    <h1>{name}</h1>
+    <div class="section">
+      <div class="section__title">General Information</div>
+      <table class="table table--prop"><tbody>{rows}</tbody></table>
+    </div>
+    <div class="section">
+      <div class="section__title">Voyage Information</div>
+      <div class="prop"><div class="prop__label">Reported Destination</div><div class="prop__value">{html.escape(voyage['reported_destination'])}</div></div>
+      <div class="prop"><div class="prop__label">Latitude / Longitude</div><div class="prop__value">{voyage['position']}</div></div>
+      <div class="prop"><div class="prop__label">Position Received</div><div class="prop__value">{voyage['position_received']}</div></div>
+    </div>
+    <div class="questions">
+      <div class="questions__item">
+        <p class="text-style questions__item-title">Where is {name} now?</p>
+        <p class="text-style questions__item-content-message">{name} was last reported at {voyage['position']}.</p>
+      </div>
+      <div class="questions__item">
+        <p class="text-style questions__item-title">What flag does {name} sail under?</p>
+        <p class="text-style questions__item-content-message">{name} is sailing under the flag of {html.escape(country)}.</p>
+      </div>
+    </div>'''
+    return _page_shell(name, main)
+
+
+class StandInServer:
+    """Threaded HTTP server serving MagicPort-like pages on localhost.
+
+    Use as a context manager; base_url is available once it has started.
+    vessels are listed as the fishing category unless categories maps
+    category names to their vessels (a vessel may be listed in several).
+    With recorded=True the recorded fixtures are served instead.
+    """
+
+    def __init__(self, vessels=None, latency=0.05, port=0, etags=True, handshake_latency=0.0, compress=True,
+                 categories=None, recorded=False, faults=None):
+        self.recorded_pages = {}
+        if recorded:
+            self.recorded_pages, recorded_total = load_recorded_pages()
+            categories = {}
+        elif categories is None:
+            categories = {'fishing': vessels if vessels is not None else load_vessels()}
+        self.categories = categories
+        self.faults = faults
+        self.vessels = list({vessel_path(v): v for listed in categories.values() for v in listed}.values())
+        self.latency = latency
+        self.etags = etags
+        self.handshake_latency = handshake_latency
+        self.compress = compress
+        self.connections_opened = 0
+        self.bytes_sent = 0
+        self.total_pages = {category: max(1, -(-len(listed) // VESSELS_PER_PAGE))
+                            for category, listed in categories.items()}
+        if recorded:
+            self.total_pages['fishing'] = recorded_total
+        self.by_path = {vessel_path(v): v for v in self.vessels}
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections_opened += 1
+                if server.handshake_latency:
+                    time.sleep(server.handshake_latency)
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests_served += 1
+                    fault = server.pick_fault(self.path)
+                if server.latency:
+                    time.sleep(server.latency)
+                if fault == 'throttled':
+                    self.send_empty(429, {'Retry-After': str(server.faults.retry_after)})
+                    return
+                if fault == 'error':
+                    with server._lock:
+                        status = server.faults.random.choice(ERROR_STATUSES)
+                    self.send_empty(status)
+                    return
+                if fault == 'login':
+                    self.send_empty(302, {'Location': f'/login?next={quote(self.path)}'})
+                    return
+                status, body = server.render(self.path)
+                payload = body.encode('utf-8')
+                etag = f'"{hashlib.md5(payload).hexdigest()}"' if server.etags else None
+                if etag and status == 200 and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                if server.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    payload = gzip.compress(payload, compresslevel=5)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(payload)))
+                if etag:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.bytes_sent += len(payload)
+
+            def send_empty(self, status, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def pick_fault(self, raw_path):
+        """The fault to inject into a request for raw_path, if any (see Faults)"""
+        if self.faults is None or urlparse(raw_path).path == '/login':
+            return None
+        if raw_path.rstrip('/').rpartition('/vessels/')[2] in self.total_pages:
+            return None
+        return self.faults.pick()
+
+    def render(self, raw_path):
+        """Return (status, html) for a request path"""
+        parsed = urlparse(raw_path)
+        if parsed.path == '/login':
+            return 200, render_login_page()
+        if self.recorded_pages:
+            body = self.recorded_pages.get(raw_path)
+            if body is None:
+                return 404, '<html><body><h1>Not found</h1></body></html>'
+            return 200, body
+        category = parsed.path.rstrip('/').rpartition('/vessels/')[2]
+        if category in self.categories:
+            query = parse_qs(parsed.query)
+            page = int(query.get('page', ['1'])[0])
+            vessels = self.categories[category]
+            if query.get('sort_type', [''])[0] == 'desc':
+                vessels = vessels[::-1]
+            return 200, render_listing_page(vessels, page, self.total_pages[category], category)
+        vessel = self.by_path.get(parsed.path)
+        if vessel is None:
+            return 404, '<html><body><h1>Not found</h1></body></html>'
+        return 200, render_vessel_page(vessel)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
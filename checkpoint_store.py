@@ -0,0 +1,232 @@
+"""Resumable checkpoint store for the MagicPort scrapers.
+
+Scraped vessels are appended to a SQLite file as they arrive, keyed by their
+URL (with the MMSI indexed alongside) and written in batches, and every
+listing page is marked once all of its vessels are stored. A crashed run can
+then pick up after the last finished page without fetching any vessel it
+already has, and the CSV is written once from the store at the end of the run.
+
+Vessel and listing pages that still fail after the session's retries are
+kept in a dead-letter table, so a later pass can retry just those URLs.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class CheckpointStore:
+    """SQLite-backed store of scraped vessels and completed listing pages"""
+
+    def __init__(self, path='vessels_checkpoint.sqlite', batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = {}
+        self._pending_mmsis = set()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS vessels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                mmsi TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS vessels_mmsi ON vessels (mmsi);
+            CREATE TABLE IF NOT EXISTS positions (
+                url TEXT PRIMARY KEY,
+                observed_at REAL,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                crawl TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                vessel_count INTEGER NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (crawl, page)
+            );
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                crawl TEXT,
+                page INTEGER,
+                error TEXT,
+                attempts INTEGER NOT NULL,
+                failed_at TEXT NOT NULL,
+                fields TEXT
+            );
+        ''')
+        # Stores created before listing-only crawls recorded no fields with their failures
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(dead_letters)')]
+        if 'fields' not in columns:
+            self.conn.execute('ALTER TABLE dead_letters ADD COLUMN fields TEXT')
+        self.conn.commit()
+
+    def add_vessel(self, record):
+        """Store a scraped vessel, replacing any earlier copy of the same URL.
+
+        Records are written in batches of batch_size; flush() (or marking a
+        page done) writes the rest.
+        """
+        with self._lock:
+            self._pending[record['url']] = record
+            self._pending_mmsis.add(record.get('mmsi'))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self.conn.executemany(
+            'INSERT INTO vessels (url, mmsi, data) VALUES (?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET mmsi = excluded.mmsi, data = excluded.data',
+            [(url, record.get('mmsi'), json.dumps(record)) for url, record in self._pending.items()])
+        self.conn.commit()
+        self._pending = {}
+        self._pending_mmsis = set()
+
+    def flush(self):
+        """Write any buffered vessels"""
+        with self._lock:
+            self._flush()
+
+    def has_vessel(self, url=None, mmsi=None):
+        """Check whether a vessel is already stored, by URL or MMSI"""
+        with self._lock:
+            if url in self._pending or (mmsi not in (None, '', '-') and mmsi in self._pending_mmsis):
+                return True
+            if url is not None:
+                row = self.conn.execute('SELECT 1 FROM vessels WHERE url = ?', (url,)).fetchone()
+                if row:
+                    return True
+            if mmsi not in (None, '', '-'):
+                row = self.conn.execute('SELECT 1 FROM vessels WHERE mmsi = ?', (mmsi,)).fetchone()
+                if row:
+                    return True
+            return False
+
+    def vessel_count(self):
+        """Number of vessels stored"""
+        with self._lock:
+            self._flush()
+            return self.conn.execute('SELECT COUNT(*) FROM vessels').fetchone()[0]
+
+    def iter_vessels(self, batch_size=1000):
+        """Yield stored vessel records in the order they were first scraped"""
+        self.flush()
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute('SELECT id, data FROM vessels WHERE id > ? ORDER BY id LIMIT ?',
+                                         (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for last_id, data in rows:
+                yield json.loads(data)
+
+    def position_state(self):
+        """(url, position_received, observed_at, checked_at) for every stored vessel.
+
+        observed_at and checked_at are None for vessels whose position was
+        never refreshed.
+        """
+        self.flush()
+        with self._lock:
+            return self.conn.execute(
+                "SELECT v.url, json_extract(v.data, '$.position_received'), p.observed_at, p.checked_at "
+                'FROM vessels v LEFT JOIN positions p ON p.url = v.url').fetchall()
+
+    def get_vessel(self, url):
+        """The stored record for a vessel URL, or None"""
+        self.flush()
+        with self._lock:
+            row = self.conn.execute('SELECT data FROM vessels WHERE url = ?', (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_positions(self, updates):
+        """Apply refreshed fields to stored vessels.
+
+        updates is a list of (url, fields, observed_at, checked_at); only the
+        given fields of each record are replaced.
+        """
+        self.flush()
+        with self._lock:
+            for url, fields, _, _ in updates:
+                row = self.conn.execute('SELECT data FROM vessels WHERE url = ?', (url,)).fetchone()
+                if row:
+                    record = json.loads(row[0])
+                    record.update(fields)
+                    self.conn.execute('UPDATE vessels SET data = ? WHERE url = ?', (json.dumps(record), url))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO positions (url, observed_at, checked_at) VALUES (?, ?, ?)',
+                [(url, observed_at, checked_at) for url, _, observed_at, checked_at in updates])
+            self.conn.commit()
+
+    def mark_page_done(self, crawl, page, vessel_count):
+        """Record that every vessel on a listing page has been stored"""
+        with self._lock:
+            self._flush()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (crawl, page, vessel_count, completed_at) VALUES (?, ?, ?, ?)',
+                (crawl, page, vessel_count, datetime.now().isoformat(timespec='seconds')))
+            self.conn.commit()
+
+    def completed_pages(self, crawl):
+        """Set of listing pages already finished for a crawl (e.g. 'asc' or 'desc')"""
+        with self._lock:
+            rows = self.conn.execute('SELECT page FROM pages WHERE crawl = ?', (crawl,)).fetchall()
+        return {page for (page,) in rows}
+
+    def last_completed_page(self, crawl):
+        """Highest listing page finished for a crawl, 0 if none"""
+        with self._lock:
+            row = self.conn.execute('SELECT MAX(page) FROM pages WHERE crawl = ?', (crawl,)).fetchone()
+        return row[0] or 0
+
+    def add_dead_letter(self, kind, url, error, crawl=None, page=None, fields=None):
+        """Record a vessel ('vessel') or listing page ('page') that could not be scraped.
+
+        crawl is the name the page's crawl is checkpointed under, and fields
+        the fields a listing-only crawl wanted from the vessel pages.
+        """
+        with self._lock:
+            self.conn.execute(
+                'INSERT INTO dead_letters (url, kind, crawl, page, error, attempts, failed_at, fields) '
+                'VALUES (?, ?, ?, ?, ?, 1, ?, ?) '
+                'ON CONFLICT (url) DO UPDATE SET error = excluded.error, attempts = attempts + 1, '
+                'failed_at = excluded.failed_at, fields = COALESCE(excluded.fields, fields)',
+                (url, kind, crawl, page, error, datetime.now().isoformat(timespec='seconds'),
+                 ','.join(fields) if fields else None))
+            self.conn.commit()
+
+    def dead_letters(self, kind=None, max_attempts=None):
+        """(url, kind, crawl, page, attempts, fields) of failed URLs, oldest failure first;
+        fields is a tuple, empty unless a listing-only crawl asked for some"""
+        sql = 'SELECT url, kind, crawl, page, attempts, fields FROM dead_letters WHERE 1'
+        params = []
+        if kind:
+            sql += ' AND kind = ?'
+            params.append(kind)
+        if max_attempts:
+            sql += ' AND attempts < ?'
+            params.append(max_attempts)
+        with self._lock:
+            rows = self.conn.execute(sql + ' ORDER BY failed_at', params).fetchall()
+        return [(*row[:5], tuple(row[5].split(',')) if row[5] else ()) for row in rows]
+
+    def dead_letter_count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+
+    def resolve_dead_letters(self, urls):
+        """Drop URLs that have been scraped since they failed"""
+        with self._lock:
+            self.conn.executemany('DELETE FROM dead_letters WHERE url = ?', [(url,) for url in urls])
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.conn.close()
@@ -0,0 +1,73 @@
+"""Persisted cache of the magicport.ai login cookies.
+
+Reading cookies from Chrome means decrypting its cookie database, which is a
+large share of a short run's startup. CookieCache keeps the cookies loaded
+from Chrome in a small JSON file (readable only by its owner) and hands them
+back on later runs while none of them has expired. MagicPortScraper goes back
+to Chrome when the cache is empty or stale, or when the site turns the cached
+cookies away (see MagicPortScraper.test_access).
+"""
+import json
+import logging
+import os
+import time
+
+from requests.cookies import RequestsCookieJar, create_cookie
+
+COOKIE_DOMAIN = 'magicport.ai'
+
+
+def chrome_cookies(domain_name=COOKIE_DOMAIN):
+    """Chrome's cookies for domain_name, in a jar that can be pickled for worker processes"""
+    # Imported here: only runs that actually read Chrome's database pay for it
+    import browser_cookie3
+
+    cookies = RequestsCookieJar()
+    cookies.update(browser_cookie3.chrome(domain_name=domain_name))
+    return cookies
+
+
+class CookieCache:
+    """JSON file of cookies, dropped as a whole once any cookie in it has expired"""
+
+    def __init__(self, path='magicport_cookies.json'):
+        self.path = path
+
+    def load(self, now=None):
+        """The cached cookies as a RequestsCookieJar, or None if missing or stale"""
+        now = time.time() if now is None else now
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)['cookies']
+        except (OSError, ValueError, KeyError):
+            return None
+        # A login is a set of cookies; once one has expired the rest won't do
+        if not entries or any(entry['expires'] and entry['expires'] <= now for entry in entries):
+            logging.info("Cached cookies have expired")
+            return None
+        cookies = RequestsCookieJar()
+        for entry in entries:
+            cookies.set_cookie(create_cookie(**entry))
+        return cookies
+
+    def save(self, cookies):
+        """Store a cookie jar, replacing what was cached"""
+        entries = [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': cookie.secure,
+            'expires': cookie.expires,
+        } for cookie in cookies]
+        tmp_path = f'{self.path}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'saved_at': time.time(), 'cookies': entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
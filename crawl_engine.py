@@ -0,0 +1,314 @@
+"""Sharded crawl engine for the MagicPort scrapers.
+
+The site only lets a listing be paged so deep, which is why the fleet used to
+be collected by two scrapers, one walking the listing in ascending order and
+one in descending order, with their CSVs merged by hand. The engine plans
+both walks as shards (a sort order and a range of listing pages) in a SQLite
+work queue that any number of worker processes, on this machine or on others
+sharing the file, claim shards from.
+
+Every vessel a shard finds is claimed in the same file, keyed by MMSI, before
+its page is fetched, so no vessel is fetched twice. Once a listing page
+contains vessels claimed by the other sort order the two walks have met: the
+shard stops after that page, and shards of its own order that are deeper and
+not yet started are skipped, since the other order has covered their pages.
+
+Several vessel categories can be crawled in one queue: each category's
+listing is planned as its own pair of walks, and a vessel listed in more than
+one category is claimed, and fetched, only by the first walk to reach it.
+
+Shards are handed out shallowest first, so the pages each sort order has
+started always form a prefix of its walk, and the categories take turns:
+every category's first pages are handed out before any category's deeper
+ones. All workers draw on the same request rate, so a crawl of several
+categories takes about as long as its total number of requests at that rate.
+A worker renews the lease on its shard every few minutes for as long as it
+crawls it, including while requests are held back by a Retry-After or the
+circuit breaker. A shard whose worker died is handed out again, from the page
+after the last one it finished, once its lease expires.
+"""
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+
+from crawl_pipeline import PipelinedCrawl
+from magicport_scraper import DEFAULT_CATEGORY, SORT_ORDERS, mmsi_from_url
+
+# Shard states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+OVERLAPPED = 'overlapped'  # stopped where it met the other sort order
+EXHAUSTED = 'exhausted'    # stopped at an empty listing page
+FAILED = 'failed'          # a listing page could not be fetched; retried on the next run
+SKIPPED = 'skipped'        # never started, covered by the other sort order
+
+
+def plan_shards(total_pages, sort_orders=SORT_ORDERS, shard_size=10, category=DEFAULT_CATEGORY):
+    """(category, sort_type, first_page, last_page) for every shard, shallowest first"""
+    shards = []
+    for first_page in range(1, total_pages + 1, shard_size):
+        last_page = min(first_page + shard_size - 1, total_pages)
+        for sort_type in sort_orders:
+            shards.append((category, sort_type, first_page, last_page))
+    return shards
+
+
+def vessel_key(vessel_url):
+    """Identity of a vessel across sort orders: its MMSI, or the URL if there is none"""
+    return mmsi_from_url(vessel_url) or vessel_url
+
+
+class ShardQueue:
+    """SQLite work queue of crawl shards and the vessels claimed by them"""
+
+    def __init__(self, path='vessels_sharded.sqlite', lease_seconds=600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        # Autocommit; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY,
+                category TEXT NOT NULL,
+                sort_type TEXT NOT NULL,
+                first_page INTEGER NOT NULL,
+                last_page INTEGER NOT NULL,
+                next_page INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                stop_page INTEGER,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS claims (
+                vessel_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                category TEXT NOT NULL,
+                sort_type TEXT NOT NULL,
+                shard_id INTEGER NOT NULL
+            );
+        ''')
+        # Queues created before categories were crawled hold only fishing vessels
+        for table in ('shards', 'claims'):
+            columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+            if 'category' not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN category TEXT NOT NULL "
+                                  f"DEFAULT '{DEFAULT_CATEGORY}'")
+
+    def _transaction(self, statements):
+        """Run statements(conn) in one write transaction, returns its result"""
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self.conn)
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def plan(self, depths, sort_orders=SORT_ORDERS, shard_size=10):
+        """Create the shards for a crawl of {category: listing pages}, returns how many were created.
+
+        Categories that already have shards are left as they are, apart from
+        failed shards being put back in line, so every machine can call this.
+        """
+        def statements(conn):
+            conn.execute('UPDATE shards SET status = ?, worker = NULL WHERE status = ?', (PENDING, FAILED))
+            planned = {category for category, in conn.execute('SELECT DISTINCT category FROM shards')}
+            now = time.time()
+            shards = [shard for category, total_pages in depths.items() if category not in planned
+                      for shard in plan_shards(total_pages, sort_orders, shard_size, category)]
+            conn.executemany(
+                'INSERT INTO shards (category, sort_type, first_page, last_page, next_page, status, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(category, sort_type, first, last, first, PENDING, now)
+                 for category, sort_type, first, last in shards])
+            return len(shards)
+        return self._transaction(statements)
+
+    def claim(self, worker):
+        """Take the shallowest shard that is pending or whose lease ran out, or None.
+
+        Shards at the same depth go in the order they were planned, so the
+        categories' walks take turns.
+        """
+        def statements(conn):
+            now = time.time()
+            row = conn.execute(
+                'SELECT id, category, sort_type, first_page, last_page, next_page FROM shards '
+                'WHERE status = ? OR (status = ? AND updated_at < ?) '
+                'ORDER BY first_page, id LIMIT 1',
+                (PENDING, RUNNING, now - self.lease_seconds)).fetchone()
+            if row:
+                conn.execute('UPDATE shards SET status = ?, worker = ?, updated_at = ? WHERE id = ?',
+                             (RUNNING, worker, now, row[0]))
+            return row
+
+        row = self._transaction(statements)
+        if row is None:
+            return None
+        shard_id, category, sort_type, first_page, last_page, next_page = row
+        return {'id': shard_id, 'category': category, 'sort_type': sort_type, 'first_page': first_page,
+                'last_page': last_page, 'next_page': next_page, 'worker': worker}
+
+    def claim_vessels(self, shard, vessel_urls):
+        """Claim the vessels on a listing page for a shard.
+
+        Returns (urls, overlap): the URLs this shard should fetch, and whether
+        any vessel on the page was already claimed by the other sort order of
+        the same category. Vessels claimed by another category are left out
+        without counting as an overlap, since that category's listing says
+        nothing about how far this one has been walked.
+        """
+        keys = {vessel_key(url): url for url in vessel_urls}
+
+        def statements(conn):
+            conn.executemany(
+                'INSERT OR IGNORE INTO claims (vessel_key, url, category, sort_type, shard_id) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(key, url, shard['category'], shard['sort_type'], shard['id']) for key, url in keys.items()])
+            return {key: conn.execute('SELECT category, sort_type, shard_id FROM claims WHERE vessel_key = ?',
+                                      (key,)).fetchone()
+                    for key in keys}
+
+        owners = self._transaction(statements)
+        # A shard picked up again after a crash owns the claims it made before
+        urls = [url for key, url in keys.items() if owners[key][2] == shard['id']]
+        overlap = any(category == shard['category'] and sort_type != shard['sort_type']
+                      for category, sort_type, _ in owners.values())
+        return urls, overlap
+
+    def owns(self, shard):
+        """Whether the shard is still running under this worker (its lease may have been taken over)"""
+        rows = self._query('SELECT status, worker FROM shards WHERE id = ?', (shard['id'],))
+        return rows == [(RUNNING, shard['worker'])]
+
+    def renew(self, shard):
+        """Renew the shard's lease, if this worker still holds it"""
+        self._query('UPDATE shards SET updated_at = ? WHERE id = ? AND worker = ? AND status = ?',
+                    (time.time(), shard['id'], shard['worker'], RUNNING))
+
+    def page_done(self, shard, page):
+        """Record a finished page, which also renews the shard's lease"""
+        self._query('UPDATE shards SET next_page = ?, updated_at = ? WHERE id = ? AND worker = ?',
+                    (page + 1, time.time(), shard['id'], shard['worker']))
+
+    def finish(self, shard, status, stop_page=None):
+        """Close a shard; a shard that met the other order or the end skips deeper pending shards"""
+        def statements(conn):
+            conn.execute('UPDATE shards SET status = ?, stop_page = ?, updated_at = ? WHERE id = ? AND worker = ?',
+                         (status, stop_page, time.time(), shard['id'], shard['worker']))
+            if status not in (OVERLAPPED, EXHAUSTED):
+                return 0
+            return conn.execute(
+                'UPDATE shards SET status = ? '
+                'WHERE category = ? AND sort_type = ? AND status = ? AND first_page > ?',
+                (SKIPPED, shard['category'], shard['sort_type'], PENDING, stop_page)).rowcount
+
+        skipped = self._transaction(statements)
+        if skipped:
+            logging.info(f"Skipping {skipped} deeper {shard['category']} {shard['sort_type']} shards")
+
+    def summary(self):
+        """Number of shards in each state"""
+        return dict(self._query('SELECT status, COUNT(*) FROM shards GROUP BY status'))
+
+    def unfinished(self):
+        """Number of shards still pending or running"""
+        return self._query('SELECT COUNT(*) FROM shards WHERE status IN (?, ?)', (PENDING, RUNNING))[0][0]
+
+    def failed(self):
+        """Number of shards that stopped at a listing page they could not fetch"""
+        return self._query('SELECT COUNT(*) FROM shards WHERE status = ?', (FAILED,))[0][0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def crawl_shard(scraper, queue, shard):
+    """Crawl one shard with the scraper's pipelined fetch; returns the shard's final state"""
+    category, sort_type = shard['category'], shard['sort_type']
+    walk = f"{category} {sort_type}"
+    stop = {}
+
+    def get_vessel_urls(page):
+        vessel_urls = scraper.get_vessel_urls(page, sort_type, category)
+        if vessel_urls is None:
+            return None
+        if not vessel_urls:
+            # Walked past the last listing page
+            stop.update(status=EXHAUSTED, page=page)
+            return []
+        claimed, overlap = queue.claim_vessels(shard, vessel_urls)
+        if overlap:
+            stop.update(status=OVERLAPPED, page=page)
+        return [url for url in claimed if not scraper.checkpoint.has_vessel(url, mmsi_from_url(url))]
+
+    def on_page_done(page, vessel_count):
+        # Vessels are written before the page counts as finished
+        scraper.checkpoint.flush()
+        queue.page_done(shard, page)
+        logging.info(f"{walk} page {page}: {vessel_count} new vessels "
+                     f"(shard {shard['first_page']}-{shard['last_page']})")
+
+    def on_page_failed(page):
+        stop.update(status=FAILED, page=page)
+        logging.error(f"Failed to scrape {walk} page {page}")
+
+    pages = itertools.takewhile(lambda page: not stop and queue.owns(shard),
+                                range(shard['next_page'], shard['last_page'] + 1))
+    crawl = PipelinedCrawl(get_vessel_urls, scraper.get_vessel_details,
+                           max_workers=scraper.max_workers, stop_on_failure=True)
+
+    # A page can take longer than the lease while the host is paused (the
+    # circuit breaker alone pauses for up to 10 minutes), so the lease is
+    # renewed on a timer rather than only as pages finish
+    finished = threading.Event()
+
+    def keep_lease():
+        while not finished.wait(queue.lease_seconds / 4):
+            queue.renew(shard)
+
+    heartbeat = threading.Thread(target=keep_lease, name='lease-heartbeat', daemon=True)
+    heartbeat.start()
+    try:
+        crawl.run(pages, scraper.add_vessel, on_page_done, on_page_failed)
+    except Exception as e:
+        # The pages after the last one finished are crawled when the shard is planned again
+        logging.error(f"Crawling {walk} shard {shard['first_page']}-{shard['last_page']} failed: {str(e)}")
+        stop.update(status=FAILED, page=stop.get('page'))
+    finally:
+        finished.set()
+        heartbeat.join()
+
+    if not queue.owns(shard):
+        logging.warning(f"Lost the lease on {walk} shard {shard['first_page']}-{shard['last_page']}")
+        return None
+    status = stop.get('status', DONE)
+    queue.finish(shard, status, stop.get('page'))
+    return status
+
+
+def crawl_shards(scraper, queue, worker):
+    """Claim and crawl shards until the queue has none left.
+
+    The scraper must have a checkpoint, which is where vessels are stored.
+    """
+    while True:
+        shard = queue.claim(worker)
+        if shard is None:
+            return
+        walk = f"{shard['category']} {shard['sort_type']}"
+        logging.info(f"{worker}: crawling {walk} pages {shard['next_page']}-{shard['last_page']}")
+        status = crawl_shard(scraper, queue, shard)
+        logging.info(f"{worker}: {walk} shard {shard['first_page']}-{shard['last_page']} {status}")
@@ -0,0 +1,190 @@
+"""Hot-path metrics for the MagicPort crawlers.
+
+CrawlMetrics records, separately for listing and detail requests:
+- request latency (a histogram with fixed buckets)
+- response bytes downloaded, and bytes of bodies served from the response
+  cache after a 304, which were not downloaded again
+- parse time (a histogram)
+- records produced (vessel URLs for listing pages, vessels for detail pages)
+  and how many requests failed
+
+Recording is a few additions under a lock, cheap enough to leave on in every
+run. At the end of a run the metrics can be logged as a one-line summary or
+written to a file: Prometheus text exposition format for .prom/.txt paths
+(e.g. for node_exporter's textfile collector), a JSON summary otherwise.
+"""
+import bisect
+import json
+import threading
+import time
+
+KINDS = ('listing', 'detail')
+
+# Upper bounds in seconds, as in Prometheus histograms (plus an implicit +Inf)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations, with count and sum"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def summary(self):
+        quantiles = {name: self.quantile(q) for name, q in (('p50', 0.5), ('p95', 0.95))}
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            # JSON has no infinity
+            **{name: '+Inf' if bound == float('inf') else bound for name, bound in quantiles.items()},
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): total
+                        for bound, total in self.cumulative()},
+        }
+
+
+class KindMetrics:
+    """Counters for one kind of request (listing or detail)"""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.parse = Histogram(PARSE_BUCKETS)
+        self.bytes = 0
+        self.cached_bytes = 0
+        self.records = 0
+        self.errors = 0
+
+
+class CrawlMetrics:
+    """Thread-safe request, parse and record metrics for a crawl"""
+
+    def __init__(self):
+        self.kinds = {kind: KindMetrics() for kind in KINDS}
+        self.started = time.monotonic()
+        # Seconds the scraper took to get ready (loading cookies, opening stores)
+        self.startup_seconds = None
+        self._lock = threading.Lock()
+
+    def observe_request(self, kind, latency, size, cached=False):
+        """A response of size bytes that took latency seconds; a cached body was
+        not downloaded, and is counted apart from the bytes that were"""
+        with self._lock:
+            metrics = self.kinds[kind]
+            metrics.latency.observe(latency)
+            if cached:
+                metrics.cached_bytes += size
+            else:
+                metrics.bytes += size
+
+    def observe_parse(self, kind, seconds):
+        with self._lock:
+            self.kinds[kind].parse.observe(seconds)
+
+    def count_records(self, kind, records):
+        with self._lock:
+            self.kinds[kind].records += records
+
+    def count_error(self, kind):
+        with self._lock:
+            self.kinds[kind].errors += 1
+
+    def summary(self):
+        """Dict of every metric, plus records/sec since the metrics were created"""
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'startup_seconds': round(self.startup_seconds, 4) if self.startup_seconds is not None else None,
+                **{kind: {
+                    'requests': metrics.latency.count,
+                    'errors': metrics.errors,
+                    'bytes': metrics.bytes,
+                    'cached_bytes': metrics.cached_bytes,
+                    'records': metrics.records,
+                    'records_per_second': round(metrics.records / elapsed, 3) if elapsed else None,
+                    'latency_seconds': metrics.latency.summary(),
+                    'parse_seconds': metrics.parse.summary(),
+                } for kind, metrics in self.kinds.items()},
+            }
+
+    def summary_line(self):
+        """One-line summary for the end-of-run log"""
+        parts = []
+        for kind, stats in self.summary().items():
+            if kind in ('elapsed_seconds', 'startup_seconds') or not stats['requests']:
+                continue
+            latency = stats['latency_seconds']
+            cached = f" (+{stats['cached_bytes'] / 1024:.0f} KiB from cache)" if stats['cached_bytes'] else ''
+            parts.append(f"{kind}: {stats['requests']} requests ({stats['errors']} failed), "
+                         f"{stats['bytes'] / 1024:.0f} KiB{cached}, mean latency {latency['mean'] * 1000:.0f} ms "
+                         f"(p95 <= {latency['p95']}s), mean parse "
+                         f"{(stats['parse_seconds']['mean'] or 0) * 1000:.1f} ms, "
+                         f"{stats['records_per_second']:.2f} records/s")
+        return '; '.join(parts) or 'no requests'
+
+    def to_prometheus(self, prefix='magicport'):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, attribute, help_text in (
+                    ('request_duration_seconds', 'latency', 'Time from sending a request to its response'),
+                    ('parse_duration_seconds', 'parse', 'Time spent parsing a page')):
+                lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} histogram']
+                for kind, metrics in self.kinds.items():
+                    histogram = getattr(metrics, attribute)
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else bound
+                        lines.append(f'{prefix}_{name}_bucket{{kind="{kind}",le="{le}"}} {total}')
+                    lines.append(f'{prefix}_{name}_sum{{kind="{kind}"}} {histogram.sum:.6f}')
+                    lines.append(f'{prefix}_{name}_count{{kind="{kind}"}} {histogram.count}')
+            for name, attribute, help_text in (
+                    ('response_bytes_total', 'bytes', 'Bytes of response bodies downloaded'),
+                    ('cached_response_bytes_total', 'cached_bytes',
+                     'Bytes of response bodies served from the response cache after a 304'),
+                    ('records_total', 'records', 'Vessel URLs from listing pages, vessels from detail pages'),
+                    ('request_errors_total', 'errors', 'Requests that failed or could not be parsed')):
+                lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} counter']
+                for kind, metrics in self.kinds.items():
+                    lines.append(f'{prefix}_{name}{{kind="{kind}"}} {getattr(metrics, attribute)}')
+            if self.startup_seconds is not None:
+                lines += [f'# HELP {prefix}_startup_seconds Time the scraper took to get ready',
+                          f'# TYPE {prefix}_startup_seconds gauge',
+                          f'{prefix}_startup_seconds {self.startup_seconds:.6f}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the metrics to path: Prometheus text for .prom/.txt, JSON otherwise"""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2) + '\n'
+        with open(path, 'w') as f:
+            f.write(content)
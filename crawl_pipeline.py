@@ -0,0 +1,139 @@
+"""Pipelined crawl engine for the MagicPort scrapers.
+
+A producer thread walks the listing pages and pushes the vessel URLs it finds
+onto a bounded work queue, while a pool of detail workers takes URLs off the
+queue and fetches the vessel pages. Listing and detail requests therefore
+overlap instead of the crawl draining at every page boundary, and the bounded
+queue stops the producer from running far ahead of the workers.
+
+Results are handed back in listing order (page by page, card by card), so a
+pipelined run produces the same records as a page-at-a-time run.
+"""
+import logging
+import queue
+import threading
+
+# Markers placed in the result stream alongside vessel records
+PAGE_DONE = 'page_done'
+PAGE_FAILED = 'page_failed'
+RECORD = 'record'
+END = 'end'
+
+
+class PipelinedCrawl:
+    """Overlap listing-page and vessel-detail requests.
+
+    get_vessel_urls(page) must return the vessel URLs on a listing page, or
+    None if the page could not be scraped; get_vessel_details(url) must return
+    a record dict or None.
+    """
+
+    def __init__(self, get_vessel_urls, get_vessel_details, max_workers=4, queue_size=50,
+                 stop_on_failure=False, stop_when_empty=False):
+        self.get_vessel_urls = get_vessel_urls
+        self.get_vessel_details = get_vessel_details
+        self.max_workers = max(1, max_workers)
+        self.queue_size = queue_size
+        self.stop_on_failure = stop_on_failure
+        self.stop_when_empty = stop_when_empty
+        self.error = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop queueing new pages and skip vessels not yet fetched"""
+        self._stop.set()
+
+    def _produce(self, pages, work, results):
+        seq = 0
+        try:
+            for page in pages:
+                if self._stop.is_set():
+                    break
+                try:
+                    vessel_urls = self.get_vessel_urls(page)
+                except Exception as e:
+                    logging.error(f"Error scraping listing page {page}: {str(e)}")
+                    vessel_urls = None
+                if vessel_urls is None:
+                    results.put((seq, PAGE_FAILED, page))
+                    seq += 1
+                    if self.stop_on_failure:
+                        break
+                    continue
+                for vessel_url in vessel_urls:
+                    # Blocks while the workers are behind
+                    work.put((seq, vessel_url))
+                    seq += 1
+                results.put((seq, PAGE_DONE, (page, len(vessel_urls))))
+                seq += 1
+                if not vessel_urls and self.stop_when_empty:
+                    # An empty page means we've walked past the last one
+                    break
+        except Exception as e:
+            # Raised again by run() once the pages before it are handed over
+            logging.error(f"Listing producer failed: {str(e)}")
+            self.error = e
+        finally:
+            for _ in range(self.max_workers):
+                work.put(None)
+            results.put((seq, END, None))
+
+    def _consume(self, work, results):
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            seq, vessel_url = item
+            record = None
+            if not self._stop.is_set():
+                try:
+                    record = self.get_vessel_details(vessel_url)
+                except Exception as e:
+                    logging.error(f"Error scraping vessel details from {vessel_url}: {str(e)}")
+            results.put((seq, RECORD, record))
+
+    def run(self, pages, on_record, on_page_done=None, on_page_failed=None):
+        """Crawl the given listing pages.
+
+        on_record(record) is called for every vessel scraped, on_page_done(page,
+        vessel_count) once all of a page's vessels have been handed over and
+        on_page_failed(page) for listing pages that could not be scraped,
+        including pages whose get_vessel_urls raised. All callbacks run on the
+        calling thread, in listing order. If iterating over pages raises, the
+        exception is raised here after the pages before it are handed over.
+        """
+        work = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        threads = [threading.Thread(target=self._produce, args=(pages, work, results), daemon=True)]
+        threads += [threading.Thread(target=self._consume, args=(work, results), daemon=True)
+                    for _ in range(self.max_workers)]
+        for thread in threads:
+            thread.start()
+
+        # Results arrive out of order; hold them until everything before them is in
+        pending = {}
+        next_seq = 0
+        finished = False
+        while not finished:
+            seq, kind, payload = results.get()
+            pending[seq] = (kind, payload)
+            while next_seq in pending:
+                kind, payload = pending.pop(next_seq)
+                next_seq += 1
+                if kind == END:
+                    finished = True
+                    break
+                if kind == RECORD:
+                    if payload:
+                        on_record(payload)
+                elif kind == PAGE_DONE:
+                    if on_page_done:
+                        on_page_done(*payload)
+                elif kind == PAGE_FAILED:
+                    if on_page_failed:
+                        on_page_failed(payload)
+
+        for thread in threads:
+            thread.join()
+        if self.error:
+            raise self.error
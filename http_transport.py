@@ -0,0 +1,122 @@
+"""HTTP transport for the MagicPort scrapers.
+
+make_adapter builds the transport adapter MagicPortScraper mounts on its
+session (underneath the response cache, if any):
+
+- PooledAdapter: requests' urllib3 adapter with a keep-alive pool sized to
+  the number of threads making requests, so no connection is thrown away and
+  re-opened (the default pool holds 10), and a default connect/read timeout
+- Http2Adapter: sends requests through an httpx client with HTTP/2 enabled
+  (needs `pip install httpx[http2]`). HTTPS connections negotiate HTTP/2 and
+  multiplex every request over one connection; plain-HTTP hosts are spoken to
+  over HTTP/1.1 keep-alive connections
+
+Both leave cookies to the requests session, so the Chrome cookies loaded with
+browser_cookie3 are sent the same way whichever transport is used, and both
+ask for gzip and, when the brotli package is installed, brotli-compressed pages.
+"""
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+
+def _timeout_parts(timeout):
+    """(connect, read) from a requests-style timeout (a number or a tuple)"""
+    if timeout is None:
+        return DEFAULT_TIMEOUT
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with a keep-alive pool of pool_size connections per host and
+    a default timeout for requests that don't set one"""
+
+    def __init__(self, pool_size=10, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        # Blocking keeps the connection count at pool_size instead of opening
+        # (and then discarding) extra ones when every connection is busy
+        super().__init__(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or self.timeout, **kwargs)
+
+
+class Http2Adapter(BaseAdapter):
+    """Transport adapter that sends requests through an HTTP/2-capable httpx client.
+
+    Cookies set by the server are copied into cookie_jar (the session's), so
+    a refreshed login cookie is used by the following requests.
+    """
+
+    def __init__(self, pool_size=10, timeout=DEFAULT_TIMEOUT, cookie_jar=None):
+        # Imported here so that runs without HTTP/2 don't pay for loading httpx
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HTTP/2 needs httpx (pip install 'httpx[http2]')")
+        super().__init__()
+        self.httpx = httpx
+        self.timeout = timeout
+        connect, read = _timeout_parts(timeout)
+        self.cookie_jar = cookie_jar
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read, connect=connect),
+            # Redirects and cookies are handled by the requests session
+            follow_redirects=False,
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        httpx = self.httpx
+        connect, read = _timeout_parts(timeout or self.timeout)
+        try:
+            response = self.client.request(
+                request.method, request.url, headers=list(request.headers.items()), content=request.body,
+                timeout=httpx.Timeout(read, connect=connect))
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(str(e), request=request)
+        except httpx.TimeoutException as e:
+            raise requests.ReadTimeout(str(e), request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e), request=request)
+
+        if self.cookie_jar is not None:
+            for cookie in response.cookies.jar:
+                self.cookie_jar.set_cookie(cookie)
+        return self._build_response(request, response)
+
+    def _build_response(self, request, response):
+        built = requests.Response()
+        built.status_code = response.status_code
+        built.reason = response.reason_phrase
+        built.headers = CaseInsensitiveDict(response.headers.multi_items())
+        # httpx has already decoded the body
+        built.headers.pop('Content-Encoding', None)
+        built._content = response.content
+        built.url = request.url
+        built.request = request
+        built.encoding = requests.utils.get_encoding_from_headers(built.headers)
+        built.http_version = response.http_version
+        return built
+
+    def close(self):
+        self.client.close()
+
+
+def make_adapter(pool_size=10, timeout=DEFAULT_TIMEOUT, http2=False, cookie_jar=None):
+    """Transport adapter for a session making up to pool_size requests at once"""
+    if http2:
+        return Http2Adapter(pool_size, timeout, cookie_jar)
+    return PooledAdapter(pool_size, timeout)
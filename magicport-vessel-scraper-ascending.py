@@ -1,11 +1,7 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import time
 import logging
-from urllib.parse import urljoin
-import browser_cookie3 
-import re
+
+from crawl_pipeline import PipelinedCrawl
+from magicport_scraper import MagicPortScraper as BaseScraper
 
 # Set up logging
 logging.basicConfig(
@@ -13,195 +9,60 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-class MagicPortScraper:
-    def __init__(self, test_mode=False):
-        self.base_url = 'https://magicport.ai'
-        self.session = requests.Session()
-        self.vessels_data = []
-        self.test_mode = test_mode
-        
-        # Load Chrome cookies
-        chrome_cookies = browser_cookie3.chrome(domain_name='magicport.ai')
-        self.session.cookies.update(chrome_cookies)
+class MagicPortScraper(BaseScraper):
+    """Scrape every listing page in the default (ascending) order"""
 
-    def test_access(self):
-        """Test if we can access the vessels page"""
-        try:
-            response = self.session.get(f"{self.base_url}/vessels/fishing")
-            if "Log in" in response.text:
-                logging.error("Access denied - not logged in")
-                return False
-            logging.info("Successfully accessed vessels page")
-            return True
-        except Exception as e:
-            logging.error(f"Error testing access: {str(e)}")
-            return False
+    def __init__(self, log_every=100, **kwargs):
+        super().__init__(**kwargs)
+        # Log one vessel in log_every at INFO; every vessel is logged at DEBUG
+        self.log_every = log_every
+        self.vessels_added = 0
 
-    def get_vessel_details(self, vessel_url):
-        """Scrape detailed information for a single vessel"""
-        try:
-            response = self.session.get(vessel_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Initialize details dictionary with URL
-            details = {'url': vessel_url}
-            
-            # Find the General Information table
-            info_table = soup.find('table', {'class': 'table--prop'})
-            if not info_table:
-                logging.warning(f"Could not find general information table for {vessel_url}")
-                return None
-            
-            # Extract data from table rows
-            rows = info_table.find_all('tr')
-            for row in rows:
-                header = row.find('th').text.strip()
-                value = row.find('td').text.strip()
-                
-                # Clean up field names by removing special characters and spaces
-                field_name = header.lower().replace('/', '_').replace(' ', '_')
-                details[field_name] = value
-            
-            # Get vessel name from h1 title
-            name_elem = soup.find('h1')
-            if name_elem:
-                details['name'] = name_elem.text.strip()
-            
-            # Get country from flag text
-            flag_text = soup.find('p', class_='text-style questions__item-content-message', text=lambda t: t and 'flag of' in t.lower())
-            logging.info(f"Flag text element found: {flag_text is not None}")
-            
-            if flag_text:
-                text = flag_text.text.strip()
-                logging.info(f"Raw flag text: {text}")
-                
-                # Extract the capitalized text following "flag of"
-                if "flag of" in text.lower():
-                    # Get the text after "flag of"
-                    after_flag = text.split("flag of", 1)[1].strip()
-                    # Find all consecutive uppercase words
-                    country_match = re.search(r'[A-Z]+(?:\s+[A-Z]+)*', after_flag)
-                    if country_match:
-                        # Convert country to title case (first letter of each word capitalized)
-                        country = country_match.group().title()
-                        logging.info(f"Extracted country: {country}")
-                        details['country'] = country
-                    else:
-                        logging.info("No uppercase country name found")
-                        details['country'] = '-'
-                else:
-                    logging.info("No 'flag of' found in text")
-                    details['country'] = '-'
-            else:
-                logging.info("No flag text element found")
-                details['country'] = '-'
-            
-            # Get additional voyage information
-            voyage_info = soup.find('div', text='Voyage Information')
-            if voyage_info:
-                voyage_section = voyage_info.find_parent('div')
-                if voyage_section:
-                    # Extract destination
-                    dest_elem = voyage_section.find('div', text='Reported Destination')
-                    if dest_elem:
-                        details['reported_destination'] = dest_elem.find_next('div').text.strip()
-                    
-                    # Extract position
-                    pos_elem = voyage_section.find('div', text='Latitude / Longitude')
-                    if pos_elem:
-                        details['position'] = pos_elem.find_next('div').text.strip()
-                    
-                    # Extract last position update
-                    update_elem = voyage_section.find('div', text='Position Received')
-                    if update_elem:
-                        details['position_received'] = update_elem.find_next('div').text.strip()
-            
-            logging.info(f"Successfully scraped details for vessel: {details.get('name', 'Unknown')}")
-            return details
-            
-        except Exception as e:
-            logging.error(f"Error scraping vessel details from {vessel_url}: {str(e)}")
-            return None
+    def add_vessel(self, vessel_details):
+        """Store a scraped vessel"""
+        super().add_vessel(vessel_details)
+        self.vessels_added += 1
+        # Lazy %-formatting: nothing is formatted unless DEBUG is enabled
+        logging.debug("Scraped vessel: %s", vessel_details.get('name', 'Unknown'))
+        if self.vessels_added % self.log_every == 0:
+            logging.info(f"Scraped {self.vessels_added} vessels (latest: {vessel_details.get('name', 'Unknown')})")
 
     def scrape_page(self, page_num):
         """Scrape vessels from a single page"""
-        url = f"{self.base_url}/vessels/fishing?page={page_num}"
-        
-        try:
-            response = self.session.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find all vessel cards
-            vessel_cards = soup.find_all('div', {'class': 'card--vessel'})
-            
-            for card in vessel_cards:
-                # Get vessel URL from the "Show vessel" link
-                vessel_link = card.find('a', {'title': ' Vessel'})
-                if vessel_link:
-                    vessel_url = urljoin(self.base_url, vessel_link['href'])
-                    
-                    # Get detailed vessel information
-                    vessel_details = self.get_vessel_details(vessel_url)
-                    if vessel_details:
-                        self.vessels_data.append(vessel_details)
-                        logging.info(f"Scraped vessel: {vessel_details.get('name', 'Unknown')}")
-        
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error scraping page {page_num}: {str(e)}")
+        vessel_urls = self.get_vessel_urls(page_num)
+        if vessel_urls is None:
             return False
+        
+        # Get detailed vessel information, keeping the order of the cards
+        for vessel_details in self.fetch_vessel_details(vessel_urls):
+            if vessel_details:
+                self.add_vessel(vessel_details)
+        return True
 
-    def get_total_pages(self):
-        """Get total number of pages to scrape"""
-        try:
-            response = self.session.get(f"{self.base_url}/vessels/fishing")
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find last page number from pagination
-            pagination = soup.find('ul', {'class': 'pagination'})
-            if not pagination:
-                logging.error("Could not find pagination element")
-                return None
-            
-            # Find all page links
-            page_links = pagination.find_all('a', {'class': 'pagination__item-link'})
-            logging.info(f"Found {len(page_links)} pagination links")
-            
-            # Look for the last numbered page (before the locked pages)
-            for link in reversed(page_links):
-                try:
-                    page_num = int(link.text.strip())
-                    logging.info(f"Found last page number: {page_num}")
-                    return page_num
-                except ValueError:
-                    continue
-            
-            logging.error("Could not determine last page number")
-            return None
-            
-        except Exception as e:
-            logging.error(f"Error getting total pages: {str(e)}")
-            return None
-
-    def save_to_csv(self, filename='vessels.csv'):
-        """Save scraped data to CSV file"""
-        if not self.vessels_data:
-            logging.error("No data to save")
-            return
+    def crawl_pipelined(self, pages):
+        """Crawl the given listing pages, overlapping listing and detail
+        requests (see crawl_pipeline.PipelinedCrawl)"""
+        total_pages = len(pages)
+        if self.checkpoint:
+            # Resume: skip pages a previous run already finished
+            completed = self.checkpoint.completed_pages('asc')
+            if completed:
+                logging.info(f"Resuming from checkpoint: {len(completed)} pages and "
+                             f"{self.checkpoint.vessel_count()} vessels already stored")
+            pages = [page for page in pages if page not in completed]
         
-        df = pd.DataFrame(self.vessels_data)
+        def on_page_done(page_num, vessel_count):
+            if self.checkpoint:
+                self.checkpoint.mark_page_done('asc', page_num, vessel_count)
+            logging.info(f"Finished page {page_num} of {total_pages} ({vessel_count} new vessels, "
+                         f"rate: {self.session.current_rate(self.base_url):.2f} req/s)")
         
-        # Reorder columns to put name first and url last
-        cols = df.columns.tolist()
-        if 'name' in cols and 'url' in cols:
-            cols.remove('name')
-            cols.remove('url')
-            cols = ['name'] + cols + ['url']
-            df = df[cols]
+        def on_page_failed(page_num):
+            logging.error(f"Failed to scrape page {page_num}")
         
-        df.to_csv(filename, index=False)
-        logging.info(f"Data saved to {filename}")
+        crawl = PipelinedCrawl(self.get_new_vessel_urls, self.get_vessel_details,
+                               max_workers=self.max_workers)
+        crawl.run(pages, self.add_vessel, on_page_done, on_page_failed)
 
     def run(self):
         """Main scraping process"""
@@ -215,7 +76,6 @@ class MagicPortScraper:
                 success = self.scrape_page(page)
                 if not success:
                     logging.error(f"Failed to scrape test page {page}")
-                time.sleep(2)  # Be nice to the server
             self.save_to_csv('test_vessels.csv')
             logging.info("Test scraping completed")
             return
@@ -225,27 +85,23 @@ class MagicPortScraper:
             return
             
         logging.info(f"Starting scrape of {total_pages} pages")
+        self.crawl_pipelined(range(1, total_pages + 1))
+        # Retry just the pages and vessels that failed, in up to 3 passes
+        self.retry_dead_letters(passes=3)
         
-        for page in range(1, total_pages + 1):
-            logging.info(f"Scraping page {page} of {total_pages}")
-            success = self.scrape_page(page)
-            
-            if not success:
-                logging.error(f"Failed to scrape page {page}")
-                continue
-                
-            # Be nice to the server
-            time.sleep(2)
-            
-        self.save_to_csv()
-        logging.info("Scraping completed")
+        # Single export of everything collected, including earlier resumed runs
+        self.save_to_csv('magicport_fishing_vessels_full.csv')
+        logging.info(f"Scraping completed. Final rate: {self.session.current_rate(self.base_url):.2f} req/s")
+        logging.info(f"Metrics: {self.metrics.summary_line()}")
+        if self.response_cache:
+            logging.info(f"HTTP cache: {self.response_cache.stats.summary()}")
 
 if __name__ == "__main__":
     # No need for credentials when using browser cookies
-    scraper = MagicPortScraper(test_mode=False)  # Switch to full scrape mode
+    scraper = MagicPortScraper(test_mode=False, metrics_path='crawl_metrics.json')  # Switch to full scrape mode
     try:
         scraper.run()
-        if scraper.vessels_data:  # Only save if we have data
-            scraper.save_to_csv('magicport_fishing_vessels_full.csv')
     except Exception as e:
-        logging.error(f"Scraping failed: {str(e)}") 
\ No newline at end of file
+        logging.error(f"Scraping failed: {str(e)}")
+    finally:
+        scraper.close()
@@ -1,33 +1,25 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import time
 import logging
-from urllib.parse import urljoin
-import browser_cookie3 
-import re
+import itertools
 from datetime import datetime, timedelta
 
+from crawl_pipeline import PipelinedCrawl
+from magicport_scraper import MagicPortScraper as BaseScraper
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-class MagicPortScraper:
-    def __init__(self, test_mode=False):
-        self.base_url = 'https://magicport.ai'
-        self.session = requests.Session()
-        self.vessels_data = []
-        self.test_mode = test_mode
+class MagicPortScraper(BaseScraper):
+    """Scrape listing pages in descending order until target_count vessels are collected"""
+
+    def __init__(self, checkpoint_path='vessels_desc_checkpoint.sqlite', **kwargs):
+        super().__init__(checkpoint_path=checkpoint_path, **kwargs)
         self.vessels_collected = 0
         self.target_count = 1027
         self.start_time = None
         self.vessels_per_minute = 0
-        
-        # Load Chrome cookies
-        chrome_cookies = browser_cookie3.chrome(domain_name='magicport.ai')
-        self.session.cookies.update(chrome_cookies)
 
     def estimate_completion(self):
         """Calculate estimated completion time based on current rate"""
@@ -46,149 +38,88 @@ class MagicPortScraper:
                 f"Est. completion: {completion_time.strftime('%H:%M:%S')}, "
                 f"Est. time remaining: {int(estimated_minutes)} minutes")
 
-    def test_access(self):
-        """Test if we can access the vessels page"""
-        try:
-            response = self.session.get(f"{self.base_url}/vessels/fishing")
-            if "Log in" in response.text:
-                logging.error("Access denied - not logged in")
-                return False
-            logging.info("Successfully accessed vessels page")
-            return True
-        except Exception as e:
-            logging.error(f"Error testing access: {str(e)}")
+    def add_vessel(self, vessel_details):
+        """Store a scraped vessel, returns False once the target has been reached"""
+        if self.vessels_collected >= self.target_count:
             return False
+        super().add_vessel(vessel_details)
+        self.vessels_collected += 1
+        return True
 
-    def get_vessel_details(self, vessel_url):
-        """Scrape detailed information for a single vessel"""
-        try:
-            response = self.session.get(vessel_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Initialize details dictionary with URL
-            details = {'url': vessel_url}
-            
-            # Find the General Information table
-            info_table = soup.find('table', {'class': 'table--prop'})
-            if not info_table:
-                return None
-            
-            # Extract data from table rows
-            rows = info_table.find_all('tr')
-            for row in rows:
-                header = row.find('th').text.strip()
-                value = row.find('td').text.strip()
-                field_name = header.lower().replace('/', '_').replace(' ', '_')
-                details[field_name] = value
-            
-            # Get vessel name from h1 title
-            name_elem = soup.find('h1')
-            if name_elem:
-                details['name'] = name_elem.text.strip()
-            
-            # Get country from flag text
-            flag_text = soup.find('p', class_='text-style questions__item-content-message', string=lambda t: t and 'flag of' in t.lower())
-            if flag_text:
-                text = flag_text.text.strip()
-                if "flag of" in text.lower():
-                    after_flag = text.split("flag of", 1)[1].strip()
-                    country_match = re.search(r'[A-Z]+(?:\s+[A-Z]+)*', after_flag)
-                    if country_match:
-                        country = country_match.group().title()
-                        details['country'] = country
-                    else:
-                        details['country'] = '-'
-                else:
-                    details['country'] = '-'
-            else:
-                details['country'] = '-'
-            
-            # Get additional voyage information
-            voyage_info = soup.find('div', string='Voyage Information')
-            if voyage_info:
-                voyage_section = voyage_info.find_parent('div')
-                if voyage_section:
-                    # Extract destination
-                    dest_elem = voyage_section.find('div', string='Reported Destination')
-                    if dest_elem:
-                        details['reported_destination'] = dest_elem.find_next('div').text.strip()
-                    
-                    # Extract position
-                    pos_elem = voyage_section.find('div', string='Latitude / Longitude')
-                    if pos_elem:
-                        details['position'] = pos_elem.find_next('div').text.strip()
-                    
-                    # Extract last position update
-                    update_elem = voyage_section.find('div', string='Position Received')
-                    if update_elem:
-                        details['position_received'] = update_elem.find_next('div').text.strip()
-            
-            return details
-            
-        except Exception as e:
-            logging.error(f"Error scraping vessel details from {vessel_url}: {str(e)}")
-            return None
+    def log_page_progress(self, page_num, vessels_on_page):
+        """Log progress after each page"""
+        estimate = self.estimate_completion()
+        logging.info(f"Page {page_num}: Added {vessels_on_page} vessels. "
+                    f"Total: {self.vessels_collected}/{self.target_count}. {estimate}, "
+                    f"Request rate: {self.session.current_rate(self.base_url):.2f} req/s")
 
     def scrape_page(self, page_num, sort_type='desc'):
         """Scrape vessels from a single page"""
         if not self.start_time:
             self.start_time = datetime.now()
-            
-        url = f"{self.base_url}/vessels/fishing?page={page_num}&sort_type={sort_type}"
         
-        try:
-            response = self.session.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find all vessel cards
-            vessel_cards = soup.find_all('div', {'class': 'card--vessel'})
-            vessels_on_page = 0
-            
-            for card in vessel_cards:
-                if self.vessels_collected >= self.target_count:
-                    return False
-                
-                vessel_link = card.find('a', {'title': ' Vessel'})
-                if vessel_link:
-                    vessel_url = urljoin(self.base_url, vessel_link['href'])
-                    vessel_details = self.get_vessel_details(vessel_url)
-                    
-                    if vessel_details:
-                        self.vessels_data.append(vessel_details)
-                        self.vessels_collected += 1
-                        vessels_on_page += 1
-            
-            # Log progress after each page
-            estimate = self.estimate_completion()
-            logging.info(f"Page {page_num}: Added {vessels_on_page} vessels. "
-                        f"Total: {self.vessels_collected}/{self.target_count}. {estimate}")
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error scraping page {page_num}: {str(e)}")
+        vessel_urls = self.get_vessel_urls(page_num, sort_type)
+        if vessel_urls is None:
+            return False
+        
+        # Don't fetch more details than we still need to reach the target
+        remaining = self.target_count - self.vessels_collected
+        if remaining <= 0:
             return False
+        
+        vessels_on_page = 0
+        for vessel_details in self.fetch_vessel_details(vessel_urls[:remaining]):
+            if vessel_details and self.add_vessel(vessel_details):
+                vessels_on_page += 1
+        
+        self.log_page_progress(page_num, vessels_on_page)
+        return True
 
-    def save_to_csv(self, filename='vessels_desc.csv'):
-        """Save scraped data to CSV file, sorted alphabetically by name"""
-        if not self.vessels_data:
-            logging.error("No data to save")
-            return
+    def crawl_pipelined(self, sort_type='desc'):
+        """Crawl listing pages until the target is reached, overlapping listing
+        and detail requests (see crawl_pipeline.PipelinedCrawl)"""
+        if not self.start_time:
+            self.start_time = datetime.now()
+        
+        start_page = 1
+        if self.checkpoint:
+            # Resume after the last page a previous run finished
+            start_page = self.checkpoint.last_completed_page(sort_type) + 1
+            self.vessels_collected = self.checkpoint.vessel_count()
+            if self.vessels_collected:
+                logging.info(f"Resuming from checkpoint at page {start_page} with "
+                             f"{self.vessels_collected} vessels already stored")
+            if self.vessels_collected >= self.target_count:
+                return
         
-        # Convert to DataFrame and sort alphabetically by name
-        df = pd.DataFrame(self.vessels_data)
-        df = df.sort_values('name', ascending=True)
+        crawl = PipelinedCrawl(lambda page: self.get_new_vessel_urls(page, sort_type),
+                               self.get_vessel_details,
+                               max_workers=self.max_workers,
+                               stop_on_failure=True, stop_when_empty=True)
+        vessels_on_page = 0
+        target_reached = False
         
-        # Reorder columns to put name first and url last
-        cols = df.columns.tolist()
-        if 'name' in cols and 'url' in cols:
-            cols.remove('name')
-            cols.remove('url')
-            cols = ['name'] + cols + ['url']
-            df = df[cols]
+        def on_record(vessel_details):
+            nonlocal vessels_on_page, target_reached
+            if self.add_vessel(vessel_details):
+                vessels_on_page += 1
+            if self.vessels_collected >= self.target_count:
+                target_reached = True
+                crawl.stop()
+        
+        def on_page_done(page_num, vessel_count):
+            nonlocal vessels_on_page
+            # A page cut short by the target isn't finished
+            if self.checkpoint and not target_reached:
+                self.checkpoint.mark_page_done(sort_type, page_num, vessels_on_page)
+            self.log_page_progress(page_num, vessels_on_page)
+            vessels_on_page = 0
         
-        df.to_csv(filename, index=False)
-        logging.info(f"Data saved to {filename}")
+        crawl.run(itertools.count(start_page), on_record, on_page_done)
+
+    def save_to_csv(self, filename='vessels_desc.csv', sort_by='name'):
+        """Save scraped data to CSV file, sorted alphabetically by name"""
+        super().save_to_csv(filename, sort_by)
 
     def run(self):
         """Main scraping process"""
@@ -202,37 +133,38 @@ class MagicPortScraper:
                 success = self.scrape_page(page)
                 if not success:
                     break
-                time.sleep(2)
             self.save_to_csv('test_vessels.csv')
             logging.info("Test scraping completed")
             return
 
         logging.info(f"Starting descending scrape to collect {self.target_count} vessels")
-        page = 1
         while True:
-            success = self.scrape_page(page, sort_type='desc')
-            
-            if not success:
+            self.crawl_pipelined(sort_type='desc')
+            stopped_at = self.checkpoint.last_completed_page('desc') if self.checkpoint else 0
+            # Retry just the pages and vessels that failed, in up to 3 passes
+            self.retry_dead_letters(passes=3)
+            # The walk stops at a listing page that failed; once the retry has
+            # recovered that page, carry on from the page after it
+            if not self.checkpoint or self.checkpoint.last_completed_page('desc') == stopped_at:
                 break
-                
-            page += 1
-            time.sleep(2)
-            
-            if page % 20 == 0:
-                self.save_to_csv(f'vessels_desc_progress_page{page}.csv')
         
         # Log final statistics
         total_time = datetime.now() - self.start_time
         final_rate = (self.vessels_collected / total_time.total_seconds()) * 60
-        logging.info(f"Scraping completed. Total time: {total_time:.0f}, "
+        logging.info(f"Scraping completed. Total time: {total_time.total_seconds():.0f}s, "
                     f"Final rate: {final_rate:.1f} vessels/min")
+        logging.info(f"Metrics: {self.metrics.summary_line()}")
+        if self.response_cache:
+            logging.info(f"HTTP cache: {self.response_cache.stats.summary()}")
         
         # Final save of all data, sorted alphabetically
         self.save_to_csv('vessels_desc_final.csv')
 
 if __name__ == "__main__":
-    scraper = MagicPortScraper(test_mode=False)
+    scraper = MagicPortScraper(test_mode=False, metrics_path='crawl_metrics_desc.json')
     try:
         scraper.run()
     except Exception as e:
-        logging.error(f"Scraping failed: {str(e)}") 
\ No newline at end of file
+        logging.error(f"Scraping failed: {str(e)}")
+    finally:
+        scraper.close()
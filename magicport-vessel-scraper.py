@@ -1,55 +1,299 @@
+"""Collect the whole MagicPort fishing fleet in one sharded crawl.
+
+Replaces running magicport-vessel-scraper-ascending.py and
+magicport-vessel-scraper-descending.py separately and merging their CSVs by
+hand: both sort orders are planned as shards in one SQLite file (see
+crawl_engine.py), crawled by several worker processes, and exported as a
+single deduplicated CSV.
+
+    python magicport-vessel-scraper.py --processes 4
+
+To spread the crawl over several machines, run the same command on each of
+them with --store pointing at a file they all share. A run that is
+interrupted picks up where it stopped when started again.
+
+Once the fleet is collected, --refresh N re-fetches the N vessels with the
+stalest positions and updates only their voyage fields (see
+position_refresh.py):
+
+    python magicport-vessel-scraper.py --refresh 500
+
+Vessel and listing pages that still failed after retries are kept in the
+store; --retry-failed fetches just those again:
+
+    python magicport-vessel-scraper.py --retry-failed
+
+For an inventory of the fleet, --listing-only stores just what the listing
+cards show (name, MMSI, vessel type, flag and URL) at one request per listing
+page, fetching vessel pages only for vessels missing a field named in
+--fields:
+
+    python magicport-vessel-scraper.py --listing-only --fields imo,length
+
+--categories crawls several vessel categories (the names in the site's
+/vessels/<category> URLs) in one run, taking turns between them under the
+same request rate and storing a vessel listed in more than one of them once:
+
+    python magicport-vessel-scraper.py --categories fishing,tug,passenger
+"""
+import argparse
 import logging
-import time
-from datetime import datetime
-
-class VesselScraper:
-    def __init__(self, target_count, test_mode=False):
-        self.target_count = target_count
-        self.test_mode = test_mode
-        self.start_time = datetime.now()
-        self.vessels_collected = 0
-
-    def test_access(self):
-        # This method should be implemented to check if the scraping process can access the data
-        return True
-
-    def scrape_page(self, page, sort_type='desc'):
-        # This method should be implemented to scrape a page of vessels
-        return True
-
-    def save_to_csv(self, filename):
-        # This method should be implemented to save data to a CSV file
-        pass
-
-    def run(self):
-        """Main scraping process"""
-        if not self.test_access():
+import multiprocessing
+import os
+import socket
+
+from checkpoint_store import CheckpointStore
+from crawl_engine import ShardQueue, crawl_shards
+from magicport_scraper import SORT_ORDERS, MagicPortScraper
+from position_refresh import refresh_positions
+from record_sink import export_csv
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+)
+
+
+def worker_metrics_path(metrics_path, index):
+    """Each worker process writes its own metrics file: crawl_metrics.json -> crawl_metrics-0.json"""
+    if not metrics_path:
+        return None
+    stem, ext = os.path.splitext(metrics_path)
+    return f'{stem}-{index}{ext}'
+
+
+def parse_categories(value):
+    """'fishing, tug' -> ['fishing', 'tug']"""
+    return [category.strip() for category in value.split(',') if category.strip()]
+
+
+def listing_depths(scraper, categories, max_depth=None):
+    """{category: listing pages to crawl} for the categories whose page count could be read"""
+    depths = {}
+    for category in categories:
+        total_pages = scraper.get_total_pages(category)
+        if not total_pages:
+            logging.error(f"Could not read the number of {category} listing pages; leaving it out")
+            continue
+        depths[category] = min(total_pages, max_depth or total_pages)
+        logging.info(f"{category}: {total_pages} listing pages, crawling {depths[category]} in each sort order")
+    return depths
+
+
+def run_worker(store_path, worker, cookies, scraper_options, metrics_path=None):
+    """Worker process: crawl shards from the queue until none are left"""
+    scraper = MagicPortScraper(cookies=cookies, checkpoint_path=store_path, metrics_path=metrics_path,
+                               **scraper_options)
+    queue = ShardQueue(store_path)
+    try:
+        crawl_shards(scraper, queue, worker)
+        logging.info(f"Metrics: {scraper.metrics.summary_line()}")
+    except Exception as e:
+        logging.error(f"{worker} failed: {str(e)}")
+    finally:
+        queue.close()
+        scraper.close()
+
+
+def refresh(args):
+    """Refresh the stalest stored positions, then export the updated dataset"""
+    scraper = MagicPortScraper(checkpoint_path=args.store, base_url=args.base_url,
+                               max_workers=args.workers, request_rate=args.rate, max_rate=args.rate,
+                               metrics_path=args.metrics, http2=args.http2, parse_processes=args.parse_processes)
+    try:
+        if not scraper.test_access():
+            return
+        changed = refresh_positions(scraper, args.refresh, args.recheck_after * 3600)
+        logging.info(f"Refresh finished: {changed} positions changed")
+        logging.info(f"Metrics: {scraper.metrics.summary_line()}")
+        scraper.save_to_csv(args.output, sort_by='name')
+        if args.parquet:
+            scraper.save_to_parquet(args.parquet)
+    finally:
+        scraper.close()
+
+
+def retry_failed(args):
+    """Retry the URLs in the dead-letter table, then export the dataset"""
+    scraper = MagicPortScraper(checkpoint_path=args.store, base_url=args.base_url,
+                               max_workers=args.workers, request_rate=args.rate, max_rate=args.rate,
+                               metrics_path=args.metrics, http2=args.http2, parse_processes=args.parse_processes)
+    try:
+        if not scraper.test_access():
+            return
+        scraper.retry_dead_letters()
+        scraper.save_to_csv(args.output, sort_by='name')
+        if args.parquet:
+            scraper.save_to_parquet(args.parquet)
+    finally:
+        scraper.close()
+
+
+def listing_only(args):
+    """Crawl the listing cards of each category in both sort orders, then export the dataset.
+
+    The walks take turns, shard_size pages at a time, as the shards of a
+    sharded crawl do, so every category is under way from the start. Both
+    sort orders of a category stop at the first page whose vessels the other
+    one has listed, which is where they meet. After a restart the walks only
+    know what they list from then on, so they may list pages past that point
+    again before they meet.
+    """
+    fields = [field.strip() for field in args.fields.split(',') if field.strip()] if args.fields else []
+    scraper = MagicPortScraper(checkpoint_path=args.store, base_url=args.base_url,
+                               max_workers=args.workers, request_rate=args.rate, max_rate=args.rate,
+                               metrics_path=args.metrics, http2=args.http2, parse_processes=args.parse_processes)
+    try:
+        if not scraper.test_access():
+            return
+        depths = listing_depths(scraper, parse_categories(args.categories), args.max_depth)
+        if not depths:
             return
-            
-        if self.test_mode:
-            # ... test mode code remains the same ...
+        stored = {(category, sort_type): 0 for category in depths for sort_type in SORT_ORDERS}
+        listed = {category: {} for category in depths}
+        walking = list(stored)
+        for first_page in range(1, max(depths.values()) + 1, args.shard_size):
+            for category, sort_type in list(walking):
+                last_page = min(first_page + args.shard_size - 1, depths[category])
+                count, ended = scraper.crawl_listings(range(first_page, last_page + 1), sort_type, fields,
+                                                      stop_at_known=True, category=category,
+                                                      listed=listed[category])
+                stored[category, sort_type] += count
+                if ended or last_page == depths[category]:
+                    walking.remove((category, sort_type))
+        for (category, sort_type), count in stored.items():
+            logging.info(f"Stored {count} vessels from the {category} {sort_type} listing")
+        logging.info(f"Metrics: {scraper.metrics.summary_line()}")
+        scraper.save_to_csv(args.output, sort_by='name')
+        if args.parquet:
+            scraper.save_to_parquet(args.parquet)
+    finally:
+        scraper.close()
+
+
+def crawl(args):
+    """Plan the shards, crawl them with worker processes, then export the dataset
+    if no other machine is still crawling"""
+    # Each process may send its share of the machine's rate and no more
+    rate = args.rate / max(1, args.processes)
+    scraper_options = dict(base_url=args.base_url, max_workers=args.workers, http2=args.http2,
+                           parse_processes=args.parse_processes, request_rate=rate, max_rate=rate)
+
+    queue = ShardQueue(args.store)
+    try:
+        scraper = MagicPortScraper(checkpoint_path=None, **scraper_options)
+        try:
+            if not scraper.test_access():
+                return
+            # Workers get the cookies that just passed the login check
+            cookies = scraper.session.cookies.copy()
+            depths = listing_depths(scraper, parse_categories(args.categories), args.max_depth)
+        finally:
+            scraper.close()
+        if not depths:
+            return
+        planned = queue.plan(depths, SORT_ORDERS, args.shard_size)
+        if planned:
+            logging.info(f"Planned {planned} shards over {sum(depths.values())} pages in each sort order")
+        else:
+            logging.info(f"Joining the crawl in {args.store}: {queue.summary()}")
+
+        host = socket.gethostname()
+        processes = [multiprocessing.Process(target=run_worker, name=f'worker-{i}',
+                                             args=(args.store, f'{host}-{os.getpid()}-{i}', cookies,
+                                                   scraper_options, worker_metrics_path(args.metrics, i)))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        logging.info(f"Shards: {queue.summary()}")
+        if queue.unfinished():
+            logging.info("Other machines are still crawling; the last one to finish writes the CSV")
             return
+        failed_shards = queue.failed()
+        if failed_shards:
+            # --retry-failed only fetches the failed page itself, not the rest of its shard
+            logging.warning(f"{failed_shards} shards stopped at a listing page that could not be fetched, so the "
+                            f"CSV is missing their remaining pages; run the crawl again to resume them")
+    finally:
+        queue.close()
+
+    # The store holds each vessel once, whichever shard found it
+    store = CheckpointStore(args.store)
+    try:
+        failed = store.dead_letter_count()
+        if failed:
+            logging.warning(f"{failed} URLs could not be scraped; run again with --retry-failed to fetch just those")
+        count = export_csv(store.iter_vessels(), args.output, sort_by='name')
+        logging.info(f"Saved {count} vessels to {args.output}")
+        if args.parquet:
+            # Imported here so that runs writing only CSV never load pandas and pyarrow
+            from vessel_records import write_parquet
+            write_parquet(store.iter_vessels(), args.parquet)
+            logging.info(f"Saved {count} vessels to {args.parquet}")
+    finally:
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=2, help='worker processes on this machine')
+    parser.add_argument('--workers', type=int, default=4, help='detail requests in flight per process')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='most requests/sec for this machine, shared between its processes')
+    parser.add_argument('--store',
+                        help='SQLite file holding the shard queue and the scraped vessels '
+                             '(default: vessels_sharded.sqlite, vessels_listing.sqlite with --listing-only)')
+    parser.add_argument('--shard-size', type=int, default=10, help='listing pages per shard')
+    parser.add_argument('--max-depth', type=int,
+                        help='deepest listing page the site serves in each category and sort order '
+                             '(default: all pages)')
+    parser.add_argument('--output',
+                        help='CSV to export (default: magicport_fishing_vessels_full_v2.csv, '
+                             'magicport_fishing_vessels_listing.csv with --listing-only)')
+    parser.add_argument('--parquet', help='also export the dataset with typed columns to this Parquet file')
+    parser.add_argument('--categories', default='fishing',
+                        help='comma-separated vessel categories to crawl, as named in /vessels/<category> URLs')
+    parser.add_argument('--base-url', default='https://magicport.ai')
+    parser.add_argument('--http2', action='store_true', help='send requests over HTTP/2 (needs httpx[http2])')
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help='parse vessel pages in this many processes per worker, leaving the '
+                             'worker threads to download (default: parse in the worker threads)')
+    parser.add_argument('--refresh', type=int, metavar='BUDGET',
+                        help='refresh the positions of up to BUDGET stored vessels instead of crawling')
+    parser.add_argument('--listing-only', action='store_true',
+                        help='store only what the listing cards show, one request per listing page')
+    parser.add_argument('--fields',
+                        help='with --listing-only: comma-separated fields to fetch vessel pages for '
+                             'when a card does not show them, e.g. imo,length')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='retry only the vessel and listing pages that failed in earlier runs')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='write request/parse metrics to PATH (.prom for Prometheus text, else JSON); '
+                             'crawl workers add their number to the name')
+    parser.add_argument('--recheck-after', type=float, default=6,
+                        help='hours before a refreshed vessel is due again')
+    args = parser.parse_args()
+    # Listing-only records are partial, so they are kept apart from full crawls
+    if args.store is None:
+        args.store = 'vessels_listing.sqlite' if args.listing_only else 'vessels_sharded.sqlite'
+    if args.output is None:
+        args.output = ('magicport_fishing_vessels_listing.csv' if args.listing_only
+                       else 'magicport_fishing_vessels_full_v2.csv')
+
+    if args.refresh is not None:
+        refresh(args)
+        return
+    if args.retry_failed:
+        retry_failed(args)
+        return
+    if args.listing_only:
+        listing_only(args)
+        return
+    crawl(args)
+
 
-        logging.info(f"Starting descending scrape to collect {self.target_count} vessels")
-        page = 1
-        while True:
-            success = self.scrape_page(page, sort_type='desc')
-            
-            if not success:
-                break
-                
-            page += 1
-            time.sleep(2)
-            
-            if page % 20 == 0:
-                self.save_to_csv(f'vessels_desc_progress_page{page}.csv')
-        
-        # Log final statistics with proper time formatting
-        total_time = datetime.now() - self.start_time
-        minutes = total_time.total_seconds() / 60
-        final_rate = (self.vessels_collected / total_time.total_seconds()) * 60
-        logging.info(f"Scraping completed. Total time: {int(minutes)} minutes, "
-                    f"Final rate: {final_rate:.1f} vessels/min")
-        
-        # Final save of all data, sorted alphabetically
-        self.save_to_csv('vessels_desc_final.csv') 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
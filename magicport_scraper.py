@@ -0,0 +1,499 @@
+"""MagicPortScraper: fetching, parsing and storing MagicPort vessels.
+
+Shared by the scraper scripts: magicport-vessel-scraper-ascending.py and
+magicport-vessel-scraper-descending.py add their own crawl loops on top of it,
+and magicport-vessel-scraper.py runs it from the sharded crawl engine.
+"""
+import itertools
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoint_store import CheckpointStore
+from cookie_cache import CookieCache, chrome_cookies
+from crawl_metrics import CrawlMetrics
+from crawl_pipeline import PipelinedCrawl
+from http_transport import ACCEPT_ENCODING, DEFAULT_TIMEOUT, make_adapter
+from rate_limiter import ThrottledSession
+from record_sink import export_csv, open_sink
+from response_cache import REVALIDATED, UNCHANGED, CachingAdapter, ResponseCache
+from vessel_parsers import (CARD_FIELDS, default_backend, mmsi_from_url, parse_total_pages, parse_vessel_cards,
+                            parse_vessel_details, parse_vessel_urls)
+
+# Listing pages are ascending by name unless another sort_type is requested
+SORT_ORDERS = ('asc', 'desc')
+# Vessel category listed at /vessels/<category> when none is given
+DEFAULT_CATEGORY = 'fishing'
+LISTING_CATEGORY = re.compile(r'/vessels/([^/?#]+)/?(?:[?#]|$)')
+
+
+def listing_category(listing_url):
+    """The category of a listing page URL (".../vessels/fishing?page=2" -> "fishing"), or None"""
+    category_match = LISTING_CATEGORY.search(listing_url)
+    return category_match.group(1) if category_match else None
+
+
+def crawl_sort_order(crawl):
+    """(sort_type, listing_only) of a checkpointed crawl name: 'tug:desc-listing' -> ('desc', True)"""
+    walk = crawl.rsplit(':', 1)[-1]
+    if walk.endswith('-listing'):
+        return walk[:-len('-listing')], True
+    return walk, False
+
+
+def is_login_page(response):
+    """Whether the site answered with its login page, i.e. the session has run out"""
+    # Searched in the raw bytes, so that pages parsed in a ParsePool are never decoded here
+    return b"Log in" in response.content
+
+
+class LoggedOutError(Exception):
+    """A page was answered with the login page instead of its content"""
+
+    def __init__(self, url):
+        super().__init__(f"Redirected to the login page from {url}")
+
+
+class MagicPortScraper:
+    def __init__(self, test_mode=False, max_workers=4, base_url='https://magicport.ai', cookies=None,
+                 request_rate=2.0, max_rate=None, cache_path='http_cache.sqlite', parser_backend=None,
+                 output_path=None, checkpoint_path='vessels_checkpoint.sqlite', metrics_path=None,
+                 http2=False, timeout=DEFAULT_TIMEOUT, cookie_cache_path='magicport_cookies.json',
+                 category=DEFAULT_CATEGORY, parse_processes=0):
+        startup_start = time.perf_counter()
+        self.base_url = base_url
+        # Listing methods crawl this category unless they are given another
+        self.category = category
+        # Every request goes through an adaptive per-host rate limiter, which
+        # never climbs above max_rate when one is given
+        limits = dict(rate=request_rate)
+        if max_rate:
+            limits['max_rate'] = max_rate
+        self.session = ThrottledSession(**limits)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        # Keep-alive pool with a connection for each detail worker and the listing producer
+        adapter = make_adapter(pool_size=max_workers + 1, timeout=timeout, http2=http2,
+                               cookie_jar=self.session.cookies)
+        # Vessel pages are cached on disk and revalidated on later runs
+        self.response_cache = ResponseCache(cache_path) if cache_path else None
+        if self.response_cache:
+            adapter = CachingAdapter(self.response_cache, inner=adapter)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.vessels_data = []
+        self.test_mode = test_mode
+        self.max_workers = max_workers
+        self.parser_backend = parser_backend or default_backend()
+        # With parse_processes, vessel pages are parsed in a pool of processes
+        # while the detail workers only download them (see parse_pool)
+        self.parse_pool = None
+        if parse_processes:
+            from parse_pool import ParsePool
+            self.parse_pool = ParsePool(parse_processes, self.parser_backend)
+        # Scraped vessels and finished pages are checkpointed so a crashed run can resume
+        self.checkpoint = CheckpointStore(checkpoint_path) if checkpoint_path and not test_mode else None
+        # Optional .jsonl/.csv/.parquet file every record is streamed to as it is scraped
+        self.output_sink = open_sink(output_path) if output_path else None
+        # Request, parse and record metrics; written to metrics_path (.json or .prom) on close
+        self.metrics = CrawlMetrics()
+        self.metrics_path = metrics_path
+        # Set once get_vessel_cards has warned that cards show none of CARD_FIELDS
+        self.card_fields_warned = False
+
+        # Unless a cookie jar was handed in, use the cookies cached by an
+        # earlier run, reading them from Chrome only when there are none
+        self.cookie_cache = CookieCache(cookie_cache_path) if cookie_cache_path and cookies is None else None
+        self.cookie_source = 'given'
+        if cookies is None:
+            cookies = self.cookie_cache.load() if self.cookie_cache else None
+            self.cookie_source = 'cache'
+        if cookies is None:
+            self.reload_chrome_cookies()
+        else:
+            self.session.cookies.update(cookies)
+
+        self.metrics.startup_seconds = time.perf_counter() - startup_start
+        logging.info(f"Scraper ready in {self.metrics.startup_seconds:.2f}s (cookies: {self.cookie_source})")
+
+    def reload_chrome_cookies(self):
+        """Replace the session's cookies with Chrome's, and cache them for later runs"""
+        cookies = chrome_cookies()
+        self.session.cookies.clear()
+        self.session.cookies.update(cookies)
+        self.cookie_source = 'chrome'
+        if self.cookie_cache:
+            self.cookie_cache.save(cookies)
+
+    def test_access(self):
+        """Test if we can access the vessels page"""
+        try:
+            response = self.session.get(f"{self.base_url}/vessels/{self.category}")
+            if is_login_page(response):
+                if self.cookie_source == 'cache':
+                    # The site has logged the cached cookies out; Chrome may have newer ones
+                    logging.info("Cached cookies were rejected, reloading them from Chrome")
+                    self.reload_chrome_cookies()
+                    return self.test_access()
+                logging.error("Access denied - not logged in")
+                return False
+            logging.info("Successfully accessed vessels page")
+            return True
+        except Exception as e:
+            logging.error(f"Error testing access: {str(e)}")
+            return False
+
+    def _observe_response(self, kind, response):
+        """Record a response's latency and size; a body the cache served after a 304
+        was not downloaded, so it is counted as cached bytes"""
+        cached = getattr(response, 'cache_status', None) == REVALIDATED
+        self.metrics.observe_request(kind, response.elapsed.total_seconds(), len(response.content), cached)
+
+    def get_vessel_details(self, vessel_url, fields=None):
+        """Scrape detailed information for a single vessel; fields are the ones a
+        listing-only crawl fetched the page for, kept with the URL if it fails"""
+        try:
+            response = self.session.get(vessel_url)
+            self._observe_response('detail', response)
+            response.raise_for_status()
+            if is_login_page(response):
+                raise LoggedOutError(vessel_url)
+
+            # Unchanged page: reuse the record parsed from it last time
+            cache_status = getattr(response, 'cache_status', None)
+            if self.response_cache and cache_status in (REVALIDATED, UNCHANGED):
+                cached_details, parse_seconds = self.response_cache.get_record(vessel_url)
+                if cached_details:
+                    self.response_cache.stats.note_parse_skipped(parse_seconds)
+                    self.metrics.count_records('detail', 1)
+                    return cached_details
+
+            if self.parse_pool:
+                details, parse_seconds = self.parse_pool.parse(response.content, response.encoding, vessel_url)
+            else:
+                parse_start = time.perf_counter()
+                details = parse_vessel_details(response.text, vessel_url, self.parser_backend)
+                parse_seconds = time.perf_counter() - parse_start
+            self.metrics.observe_parse('detail', parse_seconds)
+            if details is None:
+                self.metrics.count_error('detail')
+                logging.warning(f"Could not find general information table for {vessel_url}")
+                self.dead_letter('vessel', vessel_url, 'no general information table', fields=fields)
+                return None
+            self.metrics.count_records('detail', 1)
+            if self.response_cache and cache_status is not None:
+                self.response_cache.put_record(vessel_url, details, parse_seconds)
+            return details
+
+        except Exception as e:
+            self.metrics.count_error('detail')
+            logging.error(f"Error scraping vessel details from {vessel_url}: {str(e)}")
+            self.dead_letter('vessel', vessel_url, str(e), fields=fields)
+            return None
+
+    def fetch_vessel_details(self, vessel_urls):
+        """Fetch details for several vessels, up to max_workers at a time.
+
+        Results come back in the same order as vessel_urls, with None for
+        vessels that could not be scraped.
+        """
+        if self.max_workers <= 1 or len(vessel_urls) <= 1:
+            return [self.get_vessel_details(url) for url in vessel_urls]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(vessel_urls))) as executor:
+            return list(executor.map(self.get_vessel_details, vessel_urls))
+
+    def listing_url(self, page_num, sort_type='asc', category=None):
+        """URL of a listing page of a category (the scraper's own by default) in the given sort order"""
+        url = f"{self.base_url}/vessels/{category or self.category}?page={page_num}"
+        if sort_type != 'asc':
+            url += f"&sort_type={sort_type}"
+        return url
+
+    def _get_listing(self, page_num, sort_type, parse, category=None, crawl_name=None, fields=None):
+        """Fetch a listing page and parse it with parse (see vessel_parsers), or None on failure.
+
+        A failed page is dead-lettered under crawl_name (the page's walk by
+        default) with the fields its crawl wants from the vessel pages.
+        """
+        listing_url = self.listing_url(page_num, sort_type, category)
+        try:
+            response = self.session.get(listing_url)
+            self._observe_response('listing', response)
+            response.raise_for_status()
+            # An empty card list from the login page would look like the end of the listing
+            if is_login_page(response):
+                raise LoggedOutError(listing_url)
+            parse_start = time.perf_counter()
+            items = parse(response.text, self.base_url, self.parser_backend)
+            self.metrics.observe_parse('listing', time.perf_counter() - parse_start)
+            self.metrics.count_records('listing', len(items))
+            return items
+
+        except Exception as e:
+            self.metrics.count_error('listing')
+            logging.error(f"Error scraping page {page_num} of {category or self.category}: {str(e)}")
+            self.dead_letter('page', listing_url, str(e), crawl_name or self.page_crawl(sort_type, category),
+                             page_num, fields)
+            return None
+
+    def get_vessel_urls(self, page_num, sort_type='asc', category=None):
+        """Get the vessel page URLs listed on a single page, or None on failure"""
+        return self._get_listing(page_num, sort_type, parse_vessel_urls, category)
+
+    def get_vessel_cards(self, page_num, sort_type='asc', category=None, fields=()):
+        """Get the records the vessel cards on a single page show (name, type,
+        flag, MMSI and URL; see parse_vessel_cards), or None on failure.
+        fields are the ones the listing-only crawl wants, see crawl_listings"""
+        cards = self._get_listing(page_num, sort_type, parse_vessel_cards, category,
+                                  self.listing_crawl(sort_type, category), fields)
+        card_fields = [key for key, _ in CARD_FIELDS]
+        if cards and not self.card_fields_warned and not any(key in card for card in cards for key in card_fields):
+            # The card selectors are unverified against the live site; don't store URL/MMSI-only records quietly
+            logging.warning(f"Listing page {page_num} has cards but none shows any of {', '.join(card_fields)}; "
+                            f"the card markup may have changed, so records will hold only the MMSI and URL "
+                            f"plus any --fields fetched from vessel pages")
+            self.card_fields_warned = True
+        return cards
+
+    def get_new_vessel_urls(self, page_num, sort_type='asc', category=None):
+        """Like get_vessel_urls, but leaves out vessels already in the checkpoint"""
+        vessel_urls = self.get_vessel_urls(page_num, sort_type, category)
+        if vessel_urls is None or not self.checkpoint:
+            return vessel_urls
+        return [vessel_url for vessel_url in vessel_urls
+                if not self.checkpoint.has_vessel(vessel_url, mmsi_from_url(vessel_url))]
+
+    def complete_card(self, card, fields=()):
+        """A listing card's record, completed from the vessel page if the card
+        doesn't show every one of fields (a failed fetch leaves it as it is)"""
+        if all(field in card for field in fields):
+            return card
+        vessel_details = self.get_vessel_details(card['url'], fields)
+        return {**card, **vessel_details} if vessel_details else card
+
+    def page_crawl(self, sort_type, category=None):
+        """Name the pages of a walk are checkpointed under: the sort order, prefixed
+        by the category unless it is the scraper's own"""
+        if category in (None, self.category):
+            return sort_type
+        return f'{category}:{sort_type}'
+
+    def listing_crawl(self, sort_type, category=None):
+        """Name the pages of a listing-only walk are checkpointed under"""
+        return f'{self.page_crawl(sort_type, category)}-listing'
+
+    def crawl_listings(self, pages, sort_type='asc', fields=(), stop_at_known=False, category=None, listed=None):
+        """Listing-only crawl: store the records the vessel cards provide, one
+        request per listing page, and fetch vessel pages only for cards
+        missing any of fields.
+
+        Vessels already stored are skipped. With stop_at_known the crawl stops
+        at the first page whose vessels are all stored, e.g. where a walk in
+        the other sort order left off. listed, a {sort_type: set of vessel URLs}
+        shared by the walks of one category, narrows that to vessels another
+        sort order has listed, so vessels stored from other categories don't
+        end the walk; the crawl adds the URLs it lists to its own order's set.
+
+        Returns (vessels stored, whether the walk ended): it ends at an empty
+        page or, with stop_at_known, at a page of known vessels, and pages
+        after that are not worth crawling.
+        """
+        crawl_name = self.listing_crawl(sort_type, category)
+        if self.checkpoint:
+            completed = self.checkpoint.completed_pages(crawl_name)
+            pages = (page for page in pages if page not in completed)
+        stored = 0
+        # Set once there is no point going deeper; vessels already queued are still fetched
+        last_page_reached = False
+
+        def get_new_cards(page_num):
+            nonlocal last_page_reached
+            cards = self.get_vessel_cards(page_num, sort_type, category, fields)
+            if cards is None:
+                return None
+            new_cards = cards
+            if self.checkpoint:
+                new_cards = [card for card in cards
+                             if not self.checkpoint.has_vessel(card['url'], card.get('mmsi'))]
+            if listed is None:
+                known = self.checkpoint is not None and not new_cards
+            else:
+                other_walks = [urls for order, urls in listed.items() if order != sort_type]
+                known = all(any(card['url'] in urls for urls in other_walks) for card in cards)
+                listed.setdefault(sort_type, set()).update(card['url'] for card in cards)
+            # An empty page means we've walked past the last one
+            last_page_reached = not cards or (stop_at_known and known)
+            return new_cards
+
+        def on_record(record):
+            nonlocal stored
+            self.add_vessel(record)
+            stored += 1
+
+        def on_page_done(page_num, vessel_count):
+            if self.checkpoint:
+                self.checkpoint.mark_page_done(crawl_name, page_num, vessel_count)
+            logging.info(f"Listing page {page_num} ({category or self.category}, {sort_type}): "
+                         f"{vessel_count} new vessels")
+
+        crawl = PipelinedCrawl(get_new_cards, lambda card: self.complete_card(card, fields),
+                               max_workers=self.max_workers)
+        crawl.run(itertools.takewhile(lambda page: not last_page_reached, pages), on_record, on_page_done)
+        return stored, last_page_reached
+
+    def add_vessel(self, vessel_details):
+        """Store a scraped vessel"""
+        # With a checkpoint, records go straight to disk instead of piling up in memory
+        if self.checkpoint:
+            self.checkpoint.add_vessel(vessel_details)
+        else:
+            self.vessels_data.append(vessel_details)
+        if self.output_sink:
+            self.output_sink.write(vessel_details)
+
+    def dead_letter(self, kind, url, error, crawl_name=None, page_num=None, fields=None):
+        """Keep a URL that failed after all retries, for retry_dead_letters"""
+        if self.checkpoint:
+            self.checkpoint.add_dead_letter(kind, url, error, crawl_name, page_num, fields)
+
+    def retry_dead_letters(self, max_attempts=None, passes=1):
+        """Retry only the vessel and listing pages that failed earlier.
+
+        With passes > 1, whatever still fails is retried again, for up to that
+        many passes in all, since a page that failed twice may still be a
+        passing fault. Returns (recovered, still failing) over all passes.
+        """
+        recovered = still_failing = 0
+        for _ in range(passes):
+            recovered_now, still_failing = self._retry_dead_letters_pass(max_attempts)
+            recovered += recovered_now
+            if not still_failing:
+                break
+        return recovered, still_failing
+
+    def _retry_dead_letters_pass(self, max_attempts=None):
+        """One pass over the dead-letter table.
+
+        Listing pages are fetched again and their vessels that are not stored
+        yet are scraped; vessels are fetched again unless they have been
+        stored since. Pages and vessels of a listing-only crawl are retried the
+        same way it crawls them: cards are stored and completed from the vessel
+        pages only where they lack the fields that crawl asked for. URLs that
+        fail again stay in the dead-letter table with one more attempt counted.
+        Returns (recovered, still failing).
+        """
+        if not self.checkpoint:
+            return 0, 0
+        letters = self.checkpoint.dead_letters(max_attempts=max_attempts)
+        if not letters:
+            return 0, 0
+        logging.info(f"Retrying {len(letters)} failed URLs")
+
+        recovered = []
+        pages_done = []
+        vessel_urls = []
+        # (card, fields) of listing-only records to complete from their vessel pages
+        cards = []
+        for url, kind, crawl_name, page_num, _, fields in letters:
+            if kind == 'page':
+                category = listing_category(url)
+                sort_type, listing_only = crawl_sort_order(crawl_name)
+                if listing_only:
+                    page_cards = self.get_vessel_cards(page_num, sort_type, category, fields)
+                    if page_cards is not None:
+                        new_cards = [card for card in page_cards
+                                     if not self.checkpoint.has_vessel(card['url'], card.get('mmsi'))]
+                        recovered.append(url)
+                        pages_done.append((crawl_name, page_num, len(new_cards)))
+                        cards += [(card, fields) for card in new_cards]
+                    continue
+                page_urls = self.get_new_vessel_urls(page_num, sort_type, category)
+                if page_urls is not None:
+                    recovered.append(url)
+                    pages_done.append((crawl_name, page_num, len(page_urls)))
+                    vessel_urls += page_urls
+            elif fields:
+                # The card was stored without the fields its vessel page was fetched for
+                cards.append((self.checkpoint.get_vessel(url) or {'url': url}, fields))
+            elif self.checkpoint.has_vessel(url, mmsi_from_url(url)):
+                recovered.append(url)
+            else:
+                vessel_urls.append(url)
+
+        vessel_urls = list(dict.fromkeys(vessel_urls))
+        for vessel_url, vessel_details in zip(vessel_urls, self.fetch_vessel_details(vessel_urls)):
+            if vessel_details:
+                self.add_vessel(vessel_details)
+                recovered.append(vessel_url)
+
+        def complete(card_fields):
+            """(record, whether every vessel page it needed was fetched)"""
+            card, fields = card_fields
+            if all(field in card for field in fields):
+                return card, True
+            vessel_details = self.get_vessel_details(card['url'], fields)
+            return ({**card, **vessel_details}, True) if vessel_details else (card, False)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            for record, completed in executor.map(complete, cards):
+                # Cards are stored even when incomplete, as crawl_listings does
+                self.add_vessel(record)
+                if completed:
+                    recovered.append(record['url'])
+        for crawl_name, page_num, vessel_count in pages_done:
+            self.checkpoint.mark_page_done(crawl_name, page_num, vessel_count)
+        self.checkpoint.resolve_dead_letters(recovered)
+
+        retried = {url for url, *_ in letters}
+        recovered_count = len(retried.intersection(recovered))
+        still_failing = self.checkpoint.dead_letter_count()
+        logging.info(f"Recovered {recovered_count} of {len(letters)} failed URLs, {still_failing} still failing")
+        return recovered_count, still_failing
+
+    def get_total_pages(self, category=None):
+        """Get total number of pages to scrape in a category (the scraper's own by default)"""
+        try:
+            response = self.session.get(f"{self.base_url}/vessels/{category or self.category}")
+            return parse_total_pages(response.text, self.parser_backend)
+
+        except Exception as e:
+            logging.error(f"Error getting total pages: {str(e)}")
+            return None
+
+    def save_to_csv(self, filename='vessels.csv', sort_by=None):
+        """Save scraped data to CSV file
+
+        Records are streamed from the checkpoint in chunks (merge-sorted when
+        sort_by is given), so memory use stays flat however large the crawl.
+        """
+        vessels = self.checkpoint.iter_vessels() if self.checkpoint else self.vessels_data
+        # Columns are ordered with name first and url last
+        if not export_csv(vessels, filename, sort_by=sort_by):
+            logging.error("No data to save")
+            return
+        logging.info(f"Data saved to {filename}")
+
+    def save_to_parquet(self, filename='vessels.parquet'):
+        """Save scraped data to a Parquet file with typed columns (see vessel_records)"""
+        # Imported here so that runs writing only CSV never load pandas and pyarrow
+        from vessel_records import write_parquet
+
+        vessels = self.checkpoint.iter_vessels() if self.checkpoint else self.vessels_data
+        if not write_parquet(vessels, filename):
+            logging.error("No data to save")
+            return
+        logging.info(f"Data saved to {filename}")
+
+    def close(self):
+        """Flush buffered records to the checkpoint and output file, write the
+        metrics and close open connections"""
+        if self.metrics_path:
+            self.metrics.write(self.metrics_path)
+        self.session.close()
+        if self.parse_pool:
+            self.parse_pool.close()
+        if self.output_sink:
+            self.output_sink.close()
+        if self.checkpoint:
+            self.checkpoint.close()
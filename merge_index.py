@@ -0,0 +1,258 @@
+"""Merge scraped vessel CSVs into one deduplicated dataset.
+
+Runs of the scrapers leave overlapping files behind (the ascending run, the
+descending progress snapshots, the v2 full file, ...). MergeIndex keeps a
+persistent SQLite index of every vessel seen so far and upserts each new
+batch into it with pandas, looking up only the vessels in the batch, so
+merging another file costs time proportional to that file, not to the
+dataset.
+
+Vessels are identified by MMSI. Rows without a usable MMSI fall back to
+their IMO number, then to their URL, and are matched to a stored vessel
+through any of those.
+
+When the same vessel appears more than once, fields are merged one by one:
+- an empty value ('', '-') never replaces a non-empty one
+- between two non-empty values, the one observed most recently wins; a file's
+  modification time is when it was observed, and within a file or on equal
+  times the later row wins
+
+The merged CSV has the scrapers' columns in their usual order (see
+record_sink.VESSEL_COLUMNS) and the site's '-' wherever no file had a value.
+
+    python merge_index.py magicport_fishing_vessels_ascending.csv \\
+        vessels_desc_progress_page*.csv --output vessels_merged.csv
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from record_sink import VESSEL_COLUMNS, export_csv
+
+EMPTY_VALUES = ['', '-', 'nan', 'None']
+# Written for fields no merged file had a value for, as on the site
+MISSING = '-'
+ID_COLUMNS = ('mmsi', 'imo', 'url')
+
+
+def normalize_batch(df):
+    """Strip values and turn the site's empty markers into NaN"""
+    df = df.astype(str).apply(lambda column: column.str.strip())
+    return df.mask(df.isin(EMPTY_VALUES))
+
+
+def _id_column(df, name):
+    """A column of identifiers, NaN where missing or not a valid number"""
+    if name not in df:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    values = df[name]
+    if name == 'url':
+        return values
+    # MMSI and IMO numbers are all digits; 0 is a placeholder
+    valid = values.str.fullmatch(r'\d+', na=False) & (values.str.strip('0') != '')
+    return values.where(valid)
+
+
+class MergeIndex:
+    """Persistent MMSI-keyed index of merged vessel records"""
+
+    def __init__(self, path='vessels_index.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                mmsi TEXT,
+                data TEXT NOT NULL,
+                observed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                rows INTEGER NOT NULL,
+                merged_at REAL NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    def _select_in(self, sql, values, chunk_size=500):
+        """Run sql (with a single `IN ({})`) over values in chunks, returning all rows"""
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            rows += self.conn.execute(sql.format(','.join('?' * len(chunk))), chunk).fetchall()
+        return rows
+
+    def _resolve_keys(self, df):
+        """Index key of every row: an existing vessel it matches, or a new key"""
+        mmsi, imo, url = (_id_column(df, name) for name in ID_COLUMNS)
+        aliases = {'mmsi': 'mmsi:' + mmsi, 'imo': 'imo:' + imo, 'url': 'url:' + url}
+        wanted = pd.concat(aliases.values()).dropna().unique()
+        known = dict(self._select_in('SELECT alias, key FROM aliases WHERE alias IN ({})', wanted))
+        found = {name: alias.map(known) for name, alias in aliases.items()}
+
+        # An IMO or URL match only counts for rows with an MMSI if the stored vessel has none
+        fallback = found['imo'].fillna(found['url'])
+        has_mmsi = mmsi.notna()
+        if has_mmsi.any() and fallback[has_mmsi].notna().any():
+            candidates = fallback[has_mmsi].dropna().unique()
+            with_mmsi = {key for key, stored_mmsi in
+                         self._select_in('SELECT key, mmsi FROM records WHERE key IN ({})', candidates)
+                         if stored_mmsi}
+            fallback = fallback.where(~(has_mmsi & fallback.isin(with_mmsi)))
+
+        keys = found['mmsi'].fillna(fallback).fillna(aliases['mmsi'])
+
+        # Rows without an MMSI can also match a vessel with one earlier in the batch
+        for name in ('imo', 'url'):
+            in_batch = pd.Series(keys[has_mmsi].to_numpy(), index=aliases[name][has_mmsi].to_numpy())
+            in_batch = in_batch[in_batch.index.notna() & ~in_batch.index.duplicated()]
+            keys = keys.fillna(aliases[name].map(in_batch))
+        return keys.fillna(aliases['imo']).fillna(aliases['url'])
+
+    def merge_frame(self, df, observed_at=None):
+        """Upsert a batch of scraped rows; returns (new vessels, updated vessels)"""
+        observed_at = time.time() if observed_at is None else observed_at
+        df = normalize_batch(df.reset_index(drop=True))
+        identified = pd.concat([_id_column(df, name) for name in ID_COLUMNS], axis=1).notna().any(axis=1)
+        if not identified.all():
+            logging.warning(f"Skipping {(~identified).sum()} rows without an MMSI, IMO or URL")
+            df = df[identified]
+        if df.empty:
+            return 0, 0
+
+        # Within the batch, later rows win and empty values never do
+        df = df.assign(_key=self._resolve_keys(df))
+        batch = df.groupby('_key', sort=False).last()
+
+        stored = self._select_in('SELECT key, data, observed_at FROM records WHERE key IN ({})', batch.index)
+        columns = list(batch.columns)
+        old_data = pd.DataFrame([json.loads(data) for _, data, _ in stored],
+                                index=[key for key, _, _ in stored], dtype=object)
+        columns += [column for column in old_data.columns if column not in columns]
+        old_seen = pd.Series({key: seen for key, _, seen in stored}, dtype=float).reindex(batch.index).to_numpy()
+
+        new = batch.reindex(columns=columns)
+        old = old_data.reindex(index=batch.index, columns=columns)
+        # New vessels have no observation time and count as older than the batch
+        newer = ~(old_seen > observed_at)
+        take_new = new.notna().to_numpy() & (old.isna().to_numpy() | newer[:, None])
+        merged = old.mask(take_new, new)
+        merged_seen = np.fmax(old_seen, observed_at)
+
+        rows = []
+        aliases = []
+        for key, record, seen in zip(merged.index, merged.to_dict('records'), merged_seen):
+            record = {field: value for field, value in record.items() if isinstance(value, str)}
+            rows.append((key, record.get('mmsi'), json.dumps(record), seen))
+            aliases += [(f'{name}:{record[name]}', key) for name in ID_COLUMNS if record.get(name)]
+        self.conn.executemany(
+            'INSERT INTO records (key, mmsi, data, observed_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET mmsi = excluded.mmsi, data = excluded.data, '
+            'observed_at = excluded.observed_at', rows)
+        self.conn.executemany('INSERT OR IGNORE INTO aliases (alias, key) VALUES (?, ?)', aliases)
+        self.conn.commit()
+        return len(batch) - len(stored), len(stored)
+
+    def merge_records(self, records, observed_at=None):
+        """Upsert a list of record dicts, e.g. straight from a scraper run"""
+        return self.merge_frame(pd.DataFrame(records, dtype=object), observed_at)
+
+    def merge_file(self, path, chunk_size=20000, force=False):
+        """Merge a .csv or .jsonl file in chunks; unchanged files already merged are skipped.
+
+        Returns (new vessels, updated vessels).
+        """
+        stat = os.stat(path)
+        seen = self.conn.execute('SELECT size, mtime FROM sources WHERE path = ?',
+                                 (os.path.abspath(path),)).fetchone()
+        if seen == (stat.st_size, stat.st_mtime) and not force:
+            logging.info(f"{path} is already merged")
+            return 0, 0
+
+        if path.endswith('.jsonl'):
+            chunks = pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size)
+        else:
+            chunks = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        added = updated = rows = 0
+        for chunk in chunks:
+            chunk_added, chunk_updated = self.merge_frame(chunk, observed_at=stat.st_mtime)
+            added += chunk_added
+            updated += chunk_updated
+            rows += len(chunk)
+
+        self.conn.execute('INSERT OR REPLACE INTO sources (path, size, mtime, rows, merged_at) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (os.path.abspath(path), stat.st_size, stat.st_mtime, rows, time.time()))
+        self.conn.commit()
+        logging.info(f"Merged {path}: {rows} rows, {added} new vessels, {updated} updated")
+        return added, updated
+
+    def vessel_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def iter_records(self, batch_size=1000):
+        """Yield merged records in the order the vessels were first merged"""
+        cursor = self.conn.execute('SELECT data FROM records ORDER BY rowid')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for (data,) in rows:
+                yield json.loads(data)
+
+    def columns(self):
+        """Fields of the merged records: the scrapers' columns in order, then any others as first seen"""
+        fields = {}
+        for record in self.iter_records():
+            fields.update(dict.fromkeys(record))
+        return [column for column in VESSEL_COLUMNS if column in fields] + \
+            [field for field in fields if field not in VESSEL_COLUMNS]
+
+    def export_csv(self, filename, sort_by='name'):
+        """Write the merged dataset to a CSV, returns the number of vessels"""
+        columns = self.columns()
+        records = ({column: record.get(column, MISSING) for column in columns} for record in self.iter_records())
+        return export_csv(records, filename, sort_by=sort_by)
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='scraped .csv or .jsonl files, merged in the order given')
+    parser.add_argument('--index', default='vessels_index.sqlite', help='persistent merge index')
+    parser.add_argument('--output', help='write the merged dataset to this CSV')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='rows upserted per batch')
+    parser.add_argument('--force', action='store_true', help='merge files again even if unchanged')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = MergeIndex(args.index)
+    try:
+        for path in args.files:
+            index.merge_file(path, args.chunk_size, args.force)
+        logging.info(f"Index holds {index.vessel_count()} vessels")
+        if args.output:
+            count = index.export_csv(args.output)
+            logging.info(f"Saved {count} vessels to {args.output}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
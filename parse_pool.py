@@ -0,0 +1,130 @@
+"""Process pool that parses vessel pages away from the network threads.
+
+Parsing a vessel page is CPU-bound and holds the GIL, so however many detail
+workers fetch pages concurrently, one core caps how many pages a second the
+scraper can parse. With a ParsePool the detail workers only download the page
+bytes and hand them to worker processes, which decode and parse them and send
+back the finished records.
+
+Sending a page to another process costs pickling it both ways, so:
+- pages are sent in batches: a batch goes as soon as batch_size pages are
+  waiting, or after max_wait seconds with however many there are
+- pages smaller than min_bytes (error and placeholder pages) are parsed in
+  the calling thread, where that costs less than the round trip
+"""
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+
+from vessel_parsers import parse_vessel_details
+
+
+def parse_batch(pages, backend):
+    """Worker process: [(record or None, parse seconds)] for [(content, encoding, url)]"""
+    results = []
+    for content, encoding, vessel_url in pages:
+        start = time.perf_counter()
+        html = content.decode(encoding or 'utf-8', errors='replace')
+        details = parse_vessel_details(html, vessel_url, backend)
+        results.append((details, time.perf_counter() - start))
+    return results
+
+
+def parse_inline(content, encoding, vessel_url, backend):
+    return parse_batch([(content, encoding, vessel_url)], backend)[0]
+
+
+class ParsePool:
+    """Batches vessel pages from any number of threads into a pool of parser processes"""
+
+    def __init__(self, processes=None, backend='html.parser', batch_size=4, max_wait=0.005, min_bytes=4096):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.min_bytes = min_bytes
+        # spawn rather than fork: the scraper's network threads are already
+        # running, and a forked child could inherit a lock one of them held
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        self.pages_pooled = 0
+        self.pages_inline = 0
+        self.batches = 0
+        self._pending = []
+        self._oldest = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name='parse-pool-flusher', daemon=True)
+        self._flusher.start()
+
+    def parse(self, content, encoding, vessel_url):
+        """(record or None, parse seconds) for a downloaded vessel page; blocks until parsed"""
+        if len(content) < self.min_bytes:
+            with self._lock:
+                self.pages_inline += 1
+            return parse_inline(content, encoding, vessel_url, self.backend)
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ParsePool is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+                self._wake.notify()
+            self._pending.append(((content, encoding, vessel_url), future))
+            self.pages_pooled += 1
+            if len(self._pending) >= self.batch_size:
+                self._submit()
+        return future.result()
+
+    def _submit(self):
+        """Send the pending pages as one batch; called with the lock held"""
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        futures = [future for _, future in batch]
+
+        def deliver(batch_future):
+            try:
+                results = batch_future.result()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        try:
+            batch_future = self.executor.submit(parse_batch, [page for page, _ in batch], self.backend)
+        except Exception as e:
+            # A broken pool (a parser process died) or one shut down: fail the pages, not the caller
+            for future in futures:
+                future.set_exception(e)
+            return
+        batch_future.add_done_callback(deliver)
+
+    def _flush_loop(self):
+        """Send a partial batch once its oldest page has waited max_wait"""
+        with self._lock:
+            while not self._closed:
+                if not self._pending:
+                    self._wake.wait()
+                    continue
+                remaining = self._oldest + self.max_wait - time.monotonic()
+                if remaining > 0:
+                    self._wake.wait(remaining)
+                    continue
+                self._submit()
+
+    def stats(self):
+        with self._lock:
+            return {'pooled': self.pages_pooled, 'inline': self.pages_inline, 'batches': self.batches,
+                    'mean_batch': round(self.pages_pooled / self.batches, 2) if self.batches else None}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._pending:
+                self._submit()
+            self._wake.notify()
+        self._flusher.join()
+        self.executor.shutdown()
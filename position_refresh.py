@@ -0,0 +1,107 @@
+"""Refresh the positions of stored vessels, stalest first.
+
+Only the voyage block of a vessel page (reported destination, position and
+when that position was received) changes between runs, so instead of
+crawling the whole fleet again a refresh run re-fetches a budgeted number of
+vessel pages and updates just those fields in the checkpoint store.
+
+Vessels are taken from a priority queue ordered by when their position was
+last observed: the fetch time minus the "N hours ago" age shown on the page.
+Vessels that were never refreshed come first (oldest reported position
+first), and a vessel checked recently is left alone for recheck_after
+seconds even if it has not reported a new position.
+"""
+import heapq
+import logging
+import re
+import time
+
+# Fields refreshed in place; everything else on the page is static
+VOLATILE_FIELDS = ('reported_destination', 'position', 'position_received')
+
+AGE_UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+    'month': 30 * 86400,
+    'year': 365 * 86400,
+}
+AGE_PATTERN = re.compile(r'(\d+|an?|one)\s+(second|minute|hour|day|week|month|year)s?\s+ago', re.IGNORECASE)
+
+
+def parse_age(text):
+    """Seconds since a position was received, from e.g. "5 hours ago"; None if unknown"""
+    if not text:
+        return None
+    text = text.strip().lower()
+    if text in ('just now', 'now'):
+        return 0
+    if text == 'yesterday':
+        return AGE_UNITS['day']
+    age_match = AGE_PATTERN.search(text)
+    if not age_match:
+        return None
+    count, unit = age_match.groups()
+    count = int(count) if count.isdigit() else 1
+    return count * AGE_UNITS[unit.lower()]
+
+
+def refresh_queue(position_state, now, recheck_after=6 * 3600):
+    """Heap of (priority, url) for the vessels due a refresh; smallest is stalest.
+
+    position_state rows are (url, position_received, observed_at, checked_at),
+    as returned by CheckpointStore.position_state().
+    """
+    queue = []
+    for url, position_received, observed_at, checked_at in position_state:
+        if checked_at is not None and now - checked_at < recheck_after:
+            continue
+        if checked_at is None:
+            # Never refreshed: ahead of every timestamp, oldest reported position first
+            age = parse_age(position_received)
+            priority = (0, -(age if age is not None else float('inf')))
+        else:
+            # A position of unknown age is treated as observed when it was checked
+            priority = (1, observed_at if observed_at is not None else checked_at)
+        queue.append((priority, url))
+    heapq.heapify(queue)
+    return queue
+
+
+def refresh_positions(scraper, budget=500, recheck_after=6 * 3600, batch_size=50):
+    """Re-fetch up to budget vessel pages, stalest position first, and update
+    the volatile fields in the scraper's checkpoint store.
+
+    Returns the number of vessels whose position changed.
+    """
+    store = scraper.checkpoint
+    state = store.position_state()
+    last_observed = {url: observed_at for url, _, observed_at, _ in state}
+    queue = refresh_queue(state, time.time(), recheck_after)
+    logging.info(f"{len(queue)} vessels due a position refresh, budget {budget}")
+    due = [heapq.heappop(queue)[1] for _ in range(min(budget, len(queue)))]
+
+    changed = 0
+    for start in range(0, len(due), batch_size):
+        batch = due[start:start + batch_size]
+        checked_at = time.time()
+        updates = []
+        for vessel_url, details in zip(batch, scraper.fetch_vessel_details(batch)):
+            if not details:
+                continue
+            stored = store.get_vessel(vessel_url) or {}
+            fields = {field: details.get(field, '-') for field in VOLATILE_FIELDS}
+            age = parse_age(fields['position_received'])
+            observed_at = checked_at - age if age is not None else None
+            if all(stored.get(field) == value for field, value in fields.items()):
+                # Same voyage block as stored (e.g. served from the response cache)
+                if last_observed.get(vessel_url) is not None:
+                    observed_at = last_observed[vessel_url]
+            else:
+                changed += 1
+            updates.append((vessel_url, fields, observed_at, checked_at))
+        store.update_positions(updates)
+        logging.info(f"Refreshed {start + len(batch)}/{len(due)} vessels, {changed} positions changed")
+    return changed
@@ -0,0 +1,270 @@
+"""Adaptive per-host rate limiting for the MagicPort scrapers.
+
+Every request made through a ThrottledSession first takes a token from the
+bucket of the host it is going to. The bucket's refill rate adapts AIMD-style:
+it creeps up while the host answers quickly and is cut back sharply when the
+host gets slow or answers 429/503, which also pauses the host for as long as
+its Retry-After header asks.
+
+Requests that fail outright (connection errors, timeouts, HTTP 500/502/504)
+are retried with jittered exponential backoff, and a per-host circuit breaker
+pauses every request to a host that keeps failing, for a cooldown that
+doubles each time the breaker trips again.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+THROTTLE_STATUSES = (429, 503)
+# Server errors worth retrying; other 4xx/5xx answers are returned as they are
+RETRY_STATUSES = (500, 502, 504)
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Seconds to wait before retry number attempt (0-based): "full jitter"
+    exponential backoff, uniform between 0 and base * 2**attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value, max_wait=300):
+    """Return the wait in seconds asked for by a Retry-After header, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), max_wait)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket with an AIMD-adjusted refill rate (requests per second)"""
+
+    def __init__(self, rate=2.0, min_rate=0.1, max_rate=10.0, burst=2,
+                 increase=0.1, decrease=0.5, latency_target=2.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.latency = None  # moving average of response times
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now < self._paused_until:
+            self._tokens = 0.0
+        else:
+            elapsed = now - max(self._last_refill, self._paused_until)
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back all requests for the next `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _back_off(self, now):
+        # Responses already in flight report the same congestion, so only
+        # cut the rate once per round trip
+        if now - self._last_decrease < max(1.0 / self.rate, self.latency or 0):
+            return False
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._last_decrease = now
+        return True
+
+    def record(self, status_code, latency, retry_after=None):
+        """Feed back the outcome of a request; returns True if the rate was cut"""
+        with self._lock:
+            now = time.monotonic()
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if status_code in THROTTLE_STATUSES:
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                return self._back_off(now)
+            if self.latency > self.latency_target:
+                return self._back_off(now)
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            return False
+
+    def record_error(self):
+        """Feed back a request that failed without a response"""
+        with self._lock:
+            return self._back_off(time.monotonic())
+
+
+class CircuitBreaker:
+    """Trips after failure_threshold consecutive failed requests to a host.
+
+    record_failure returns how long the host should be paused when the
+    breaker trips: cooldown seconds at first, doubling (up to max_cooldown)
+    while requests after the pause keep failing. One success closes it again.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.trips = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        """Count a failed request; returns the pause in seconds if the breaker trips, else None"""
+        with self._lock:
+            self.failures += 1
+            now = time.monotonic()
+            # Requests already in flight when it tripped don't trip it again
+            if self.failures < self.failure_threshold or now < self._open_until:
+                return None
+            pause = self.cooldown
+            self._open_until = now + pause
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self.trips += 1
+            return pause
+
+
+class ThrottledSession(requests.Session):
+    """requests.Session that sends every request through a per-host limiter.
+
+    Responses with a 429/503 status are retried up to max_throttle_retries
+    times once the host's Retry-After pause has passed. Connection errors,
+    timeouts and 500/502/504 answers are retried up to max_retries times
+    after a jittered exponential backoff, and trip the host's circuit breaker
+    when they keep coming.
+    """
+
+    def __init__(self, max_throttle_retries=3, max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, **limiter_kwargs):
+        super().__init__()
+        self.max_throttle_retries = max_throttle_retries
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_kwargs = dict(failure_threshold=breaker_threshold, cooldown=breaker_cooldown)
+        self.limiter_kwargs = limiter_kwargs
+        self.limiters = {}
+        self.breakers = {}
+        self._limiters_lock = threading.Lock()
+
+    def limiter_for(self, url):
+        """Return the rate limiter for the host of url"""
+        host = urlparse(url).netloc
+        with self._limiters_lock:
+            if host not in self.limiters:
+                self.limiters[host] = AdaptiveRateLimiter(**self.limiter_kwargs)
+            return self.limiters[host]
+
+    def breaker_for(self, url):
+        """Return the circuit breaker for the host of url"""
+        host = urlparse(url).netloc
+        with self._limiters_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(**self.breaker_kwargs)
+            return self.breakers[host]
+
+    def _failed(self, url, limiter, breaker, attempt, reason):
+        """Handle a failed attempt; returns True if the request should be retried"""
+        pause = breaker.record_failure()
+        if pause:
+            logging.warning(f"Circuit breaker tripped after {breaker.failures} failures in a row, "
+                            f"pausing requests to {urlparse(url).netloc} for {pause:.0f}s")
+            limiter.pause(pause)
+        if attempt >= self.max_retries:
+            return False
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+        logging.warning(f"{reason} from {url}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        time.sleep(delay)
+        return True
+
+    def current_rate(self, url):
+        """Current allowed request rate for the host of url, in requests/sec"""
+        return self.limiter_for(url).rate
+
+    def request(self, method, url, *args, **kwargs):
+        limiter = self.limiter_for(url)
+        breaker = self.breaker_for(url)
+        attempt = 0
+        retries = 0
+        while True:
+            limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if limiter.record_error():
+                    logging.warning(f"Request to {url} failed, rate lowered to {limiter.rate:.2f} req/s")
+                if not self._failed(url, limiter, breaker, retries, type(e).__name__):
+                    raise
+                retries += 1
+                continue
+            except requests.RequestException:
+                if limiter.record_error():
+                    logging.warning(f"Request to {url} failed, rate lowered to {limiter.rate:.2f} req/s")
+                raise
+            latency = time.monotonic() - start
+
+            status = response.status_code
+            retry_after = None
+            if status in THROTTLE_STATUSES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if limiter.record(status, latency, retry_after):
+                logging.warning(f"Host pushing back (HTTP {status}, {latency:.1f}s), "
+                                f"rate lowered to {limiter.rate:.2f} req/s")
+
+            if status in RETRY_STATUSES:
+                if self._failed(url, limiter, breaker, retries, f"HTTP {status}"):
+                    retries += 1
+                    continue
+                return response
+            if status < 500:
+                breaker.record_success()
+
+            if status not in THROTTLE_STATUSES or attempt >= self.max_throttle_retries:
+                return response
+            attempt += 1
+            if retry_after:
+                logging.warning(f"Server asked to retry {url} after {retry_after:.0f}s")
+            else:
+                # No Retry-After: wait a couple of token intervals before retrying
+                limiter.pause(2.0 / limiter.rate)
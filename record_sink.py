@@ -0,0 +1,225 @@
+"""Streaming output for scraped vessel records.
+
+Sinks write each record as it is produced, buffering rows and writing them in
+bulk, so a crawl's memory use doesn't grow with the number of vessels and a
+crashed run keeps everything written so far:
+
+- JsonlSink: one JSON object per line, keeps every field as scraped
+- CsvSink: CSV with a fixed column order (name first, url last)
+- ParquetSink: Parquet row groups of typed columns (needs pyarrow, see vessel_records)
+
+export_csv writes the final CSV from any iterable of records in chunks: each
+chunk is (optionally) sorted and spilled to a temporary run file, then the runs
+are merged into the output. Only one chunk is ever held in memory.
+"""
+import csv
+import heapq
+import json
+import logging
+import os
+import tempfile
+
+# Column order of the scraped CSVs: name first, url last
+VESSEL_COLUMNS = [
+    'name', 'mmsi', 'imo', 'call_sign', 'vessel_type__sub_type', 'gross_tonnage', 'deadweight',
+    'length', 'year_built', 'built_at_(shipyard)', 'country', 'reported_destination', 'position',
+    'position_received', 'url',
+]
+
+
+def column_order(fields):
+    """Order fields like save_to_csv does: as first seen, but name first and url last"""
+    fields = list(dict.fromkeys(fields))
+    if 'name' in fields and 'url' in fields:
+        fields.remove('name')
+        fields.remove('url')
+        fields = ['name'] + fields + ['url']
+    return fields
+
+
+class RecordSink:
+    """Base class for buffered record writers; use as a context manager"""
+
+    def __init__(self, path, buffer_size=500):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.records_written = 0
+        self._buffer = []
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self.records_written += len(self._buffer)
+            self._buffer = []
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlSink(RecordSink):
+    """Append records to a JSON Lines file"""
+
+    def __init__(self, path, buffer_size=500):
+        super().__init__(path, buffer_size)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _write_batch(self, records):
+        self._file.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        self._file.flush()
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class _FixedColumnSink(RecordSink):
+    """Sink with a column set fixed up front; fields outside it are dropped with a warning"""
+
+    def __init__(self, path, columns=None, buffer_size=500):
+        super().__init__(path, buffer_size)
+        self.columns = column_order(columns or VESSEL_COLUMNS)
+        self._known = set(self.columns)
+        self._warned = set()
+
+    def _check_fields(self, records):
+        for record in records:
+            for field in record.keys() - self._known - self._warned:
+                logging.warning(f"Field {field!r} is not a column of {self.path} and will not be written")
+                self._warned.add(field)
+
+
+class CsvSink(_FixedColumnSink):
+    """Append records to a CSV file with a stable column order"""
+
+    def __init__(self, path, columns=None, buffer_size=500):
+        super().__init__(path, columns, buffer_size)
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore',
+                                      lineterminator='\n')
+        if write_header:
+            self._writer.writeheader()
+
+    def _write_batch(self, records):
+        self._check_fields(records)
+        self._writer.writerows(records)
+        self._file.flush()
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class ParquetSink(RecordSink):
+    """Write records to a Parquet file in the typed schema of vessel_records,
+    one row group per buffered batch"""
+
+    def __init__(self, path, buffer_size=5000):
+        # Imported here so that only Parquet output loads pyarrow and pandas
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("ParquetSink needs pyarrow (pip install pyarrow)")
+        import vessel_records
+
+        super().__init__(path, buffer_size)
+        self._arrow_table = vessel_records.arrow_table
+        self._schema = vessel_records.arrow_schema()
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_batch(self, records):
+        self._writer.write_table(self._arrow_table(records, self._schema))
+
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+def open_sink(path, **kwargs):
+    """Open the sink matching the file extension (.jsonl, .csv or .parquet)"""
+    if path.endswith('.jsonl'):
+        return JsonlSink(path, **kwargs)
+    if path.endswith('.csv'):
+        return CsvSink(path, **kwargs)
+    if path.endswith('.parquet'):
+        return ParquetSink(path, **kwargs)
+    raise ValueError(f"Don't know how to stream records to {path} (use .jsonl, .csv or .parquet)")
+
+
+def _sort_key(field):
+    # Like pandas sort_values: missing values sort last
+    def key(record):
+        value = record.get(field)
+        return (value is None, value or '')
+    return key
+
+
+def _write_csv(records, filename, fields):
+    with open(filename, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, fieldnames=column_order(fields), lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def export_csv(records, filename, sort_by=None, chunk_size=50000):
+    """Write records to a CSV in column order, optionally sorted, in bounded memory.
+
+    Returns the number of records written.
+    """
+    key = _sort_key(sort_by) if sort_by else None
+    fields = {}
+    count = 0
+    runs = []
+    chunk = []
+    with tempfile.TemporaryDirectory(prefix='vessels_export_') as tmp:
+
+        def spill(chunk):
+            if key:
+                chunk.sort(key=key)
+            run_path = os.path.join(tmp, f'run{len(runs)}.jsonl')
+            with open(run_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + '\n' for r in chunk)
+            runs.append(run_path)
+
+        for record in records:
+            fields.update(dict.fromkeys(record))
+            chunk.append(record)
+            count += 1
+            if len(chunk) >= chunk_size:
+                spill(chunk)
+                chunk = []
+        if not count:
+            return 0
+
+        if not runs:
+            # Everything fit in one chunk, no need to go through a run file
+            if key:
+                chunk.sort(key=key)
+            _write_csv(chunk, filename, fields)
+            return count
+
+        if chunk:
+            spill(chunk)
+        files = [open(run_path, encoding='utf-8') for run_path in runs]
+        try:
+            streams = [map(json.loads, f) for f in files]
+            merged = heapq.merge(*streams, key=key) if key else (r for s in streams for r in s)
+            _write_csv(merged, filename, fields)
+        finally:
+            for f in files:
+                f.close()
+    return count
@@ -0,0 +1,279 @@
+"""Persistent HTTP response cache for MagicPort vessel pages.
+
+CachingAdapter is mounted on the scraper's session and keeps the body of every
+vessel page it fetches in a SQLite file, together with the page's ETag /
+Last-Modified validators and a hash of its content. On the next run the page is
+revalidated with If-None-Match / If-Modified-Since; a 304 answer is served from
+the cache without downloading the body again. When the server sends no
+validators the body is downloaded, and if its hash matches the cached copy the
+response is marked unchanged so the scraper can reuse the record it parsed last
+time instead of running BeautifulSoup again.
+
+Entries older than max_age or beyond max_bytes (least recently used first)
+are evicted.
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Only vessel detail pages are cached; listing pages change with every new vessel
+VESSEL_PAGE_PATTERN = re.compile(r'/vessels/[^/?#]+/[^/?#]+-mmsi-\d+$')
+
+# Cache status set on responses that went through the adapter
+MISS = 'miss'
+REVALIDATED = 'revalidated'  # 304 Not Modified, body served from cache
+UNCHANGED = 'unchanged'      # downloaded again, but identical to the cached body
+
+
+class CacheStats:
+    """Counters for the run summary"""
+
+    def __init__(self):
+        self.requests = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.unchanged = 0
+        self.bytes_saved = 0
+        self.parses_skipped = 0
+        self.parse_seconds_saved = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, status, body_size=0):
+        with self._lock:
+            self.requests += 1
+            if status == MISS:
+                self.misses += 1
+            elif status == REVALIDATED:
+                self.revalidated += 1
+                self.bytes_saved += body_size
+            elif status == UNCHANGED:
+                self.unchanged += 1
+
+    def note_parse_skipped(self, parse_seconds):
+        """Record a page whose parse was skipped, and how long that parse took last time"""
+        with self._lock:
+            self.parses_skipped += 1
+            self.parse_seconds_saved += parse_seconds
+
+    def summary(self):
+        hits = self.revalidated + self.unchanged
+        hit_rate = hits / self.requests * 100 if self.requests else 0
+        return (f"{self.requests} cacheable requests, {hits} hits ({hit_rate:.0f}%: "
+                f"{self.revalidated} not modified, {self.unchanged} unchanged by hash), "
+                f"{self.misses} misses, {self.bytes_saved / 1024:.0f} KiB not downloaded, "
+                f"{self.parses_skipped} parses skipped ({self.parse_seconds_saved:.2f}s saved)")
+
+
+class ResponseCache:
+    """SQLite store of cached page bodies, validators and parsed records"""
+
+    def __init__(self, path='http_cache.sqlite', max_age=7 * 24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._stores_since_evict = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                record TEXT,
+                parse_seconds REAL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        ''')
+        self.conn.commit()
+        self.evict()
+
+    def get(self, url):
+        """Return the cached entry for url as a dict, or None"""
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    'SELECT etag, last_modified, content_hash, headers, body, stored_at '
+                    'FROM responses WHERE url = ?', (url,)).fetchone()
+        except sqlite3.Error as e:
+            # Another process may hold the file; a cache that can't be read is a miss
+            logging.warning(f"Could not read cache entry for {url}: {str(e)}")
+            return None
+        if row is None:
+            return None
+        etag, last_modified, content_hash, headers, body, stored_at = row
+        if time.time() - stored_at > self.max_age:
+            return None
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+        }
+
+    def put(self, url, response, content_hash):
+        """Store a fresh 200 response, dropping any record parsed from an older body"""
+        compressed = zlib.compress(response.content)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, etag, last_modified, content_hash, headers, body, size, stored_at, last_used, '
+                'record, parse_seconds) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)',
+                (url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                 content_hash, json.dumps(dict(response.headers)), compressed, len(compressed), now, now))
+            self.conn.commit()
+            self._stores_since_evict += 1
+            evict_now = self._stores_since_evict >= 500
+        if evict_now:
+            self.evict()
+
+    def refresh(self, url):
+        """Mark an entry as confirmed current, restarting its age"""
+        now = time.time()
+        try:
+            with self._lock:
+                self.conn.execute('UPDATE responses SET last_used = ?, stored_at = ? WHERE url = ?',
+                                  (now, now, url))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not refresh cache entry for {url}: {str(e)}")
+
+    def get_record(self, url):
+        """Return (record, parse_seconds) previously parsed from the cached body of url,
+        or (None, 0)"""
+        try:
+            with self._lock:
+                row = self.conn.execute('SELECT record, parse_seconds FROM responses WHERE url = ?',
+                                        (url,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read cached record for {url}: {str(e)}")
+            return None, 0.0
+        if row is None or row[0] is None:
+            return None, 0.0
+        return json.loads(row[0]), row[1] or 0.0
+
+    def put_record(self, url, record, parse_seconds=0.0):
+        """Remember the record parsed from the cached body of url and how long parsing took"""
+        try:
+            with self._lock:
+                self.conn.execute('UPDATE responses SET record = ?, parse_seconds = ? WHERE url = ?',
+                                  (json.dumps(record), parse_seconds, url))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not cache the record for {url}: {str(e)}")
+
+    def evict(self):
+        """Drop expired entries, then the least recently used until under max_bytes"""
+        with self._lock:
+            self._stores_since_evict = 0
+            self.conn.execute('DELETE FROM responses WHERE stored_at < ?', (time.time() - self.max_age,))
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                stale = []
+                for url, size in self.conn.execute('SELECT url, size FROM responses ORDER BY last_used'):
+                    if freed >= excess:
+                        break
+                    stale.append((url,))
+                    freed += size
+                self.conn.executemany('DELETE FROM responses WHERE url = ?', stale)
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _response_from_cache(request, entry, not_modified):
+    """Build a 200 response from a cached entry and the 304 that confirmed it"""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    # Validators and dates sent with the 304 supersede the stored ones
+    response.headers.update(not_modified.headers)
+    response.headers['Content-Length'] = str(len(entry['body']))
+    response.headers.pop('Content-Encoding', None)
+    response._content = entry['body']
+    response.url = request.url
+    response.request = request
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.connection = not_modified.connection
+    response.elapsed = not_modified.elapsed
+    return response
+
+
+class CachingAdapter(BaseAdapter):
+    """Transport adapter that serves vessel pages through a ResponseCache.
+
+    Wraps another adapter (a plain HTTPAdapter by default) that does the
+    actual network I/O. Responses get a `cache_status` attribute.
+    """
+
+    def __init__(self, cache, inner=None, should_cache=None):
+        super().__init__()
+        self.cache = cache
+        self.inner = inner or HTTPAdapter()
+        self.should_cache = should_cache or (lambda url: bool(VESSEL_PAGE_PATTERN.search(url.split('?', 1)[0])))
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET' or not self.should_cache(request.url):
+            return self.inner.send(request, **kwargs)
+
+        entry = self.cache.get(request.url)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.inner.send(request, **kwargs)
+
+        if entry and response.status_code == 304:
+            response.close()
+            self.cache.refresh(request.url)
+            cached = _response_from_cache(request, entry, response)
+            cached.cache_status = REVALIDATED
+            self.cache.stats.count(REVALIDATED, len(entry['body']))
+            return cached
+
+        if response.status_code != 200:
+            response.cache_status = MISS
+            return response
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if entry and entry['content_hash'] == content_hash:
+            self.cache.refresh(request.url)
+            response.cache_status = UNCHANGED
+        else:
+            try:
+                self.cache.put(request.url, response, content_hash)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not cache {request.url}: {str(e)}")
+            response.cache_status = MISS
+        self.cache.stats.count(response.cache_status)
+        return response
+
+    def close(self):
+        self.inner.close()
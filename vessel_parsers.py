@@ -0,0 +1,384 @@
+"""HTML parsing for MagicPort listing and vessel pages.
+
+The scrapers call parse_vessel_details, parse_vessel_urls, parse_vessel_cards
+and parse_total_pages with the name of a parser backend:
+
+- 'html.parser': BeautifulSoup with Python's built-in parser over the whole
+  page. This is the reference implementation the other backends must match.
+- 'lxml': BeautifulSoup on the lxml tree builder with partial parsing. Only the
+  parts of the page the scraper reads are turned into a tree: the
+  table--prop table, h1 and paragraphs via a SoupStrainer, and the Voyage
+  Information section by parsing just that slice of the page.
+- 'selectolax': the lexbor-based selectolax parser, re-implementing the same
+  lookups with CSS selectors.
+
+lxml and selectolax are optional; default_backend() picks lxml when it is
+installed and falls back to html.parser otherwise. Every backend produces
+identical records on the fixtures in benchmarks/fixtures (see
+benchmarks/check_parser_parity.py).
+"""
+import bisect
+import logging
+import re
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+BACKENDS = ('html.parser', 'lxml', 'selectolax')
+
+FLAG_CLASS = 'text-style questions__item-content-message'
+VOYAGE_FIELDS = (
+    ('reported_destination', 'Reported Destination'),
+    ('position', 'Latitude / Longitude'),
+    ('position_received', 'Position Received'),
+)
+# Fields shown on a listing card, by the class of the element holding them.
+# These classes are those of the stand-in server's cards (benchmarks/
+# stand_in_server.py) and have not been checked against a recorded live
+# listing page; MagicPortScraper.get_vessel_cards warns when none match.
+CARD_FIELDS = (
+    ('name', 'card__title'),
+    ('vessel_type__sub_type', 'card__type'),
+    ('country', 'card__flag'),
+)
+MMSI_IN_URL = re.compile(r'-mmsi-(\d+)')
+
+
+def _has_class(class_name):
+    # While parsing, a strainer sees the raw class attribute string, not a list
+    def match(value):
+        if value is None:
+            return False
+        return class_name in (value.split() if isinstance(value, str) else value)
+    return match
+
+
+# Elements get_vessel_details reads outside the voyage section
+DETAIL_STRAINER = SoupStrainer(['table', 'h1', 'p'])
+LISTING_STRAINER = SoupStrainer('div', {'class': _has_class('card--vessel')})
+PAGINATION_STRAINER = SoupStrainer('ul', {'class': _has_class('pagination')})
+
+VOYAGE_LABEL = re.compile(r'<(?i:div)\b[^>]*>Voyage Information</(?i:div)\s*>')
+DIV_TAG = re.compile(r'<(/?)div\b[^>]*>', re.IGNORECASE)
+# Markup inside these is raw text to an HTML parser, not elements
+RAW_TEXT = re.compile(r'<!--.*?-->|<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+
+def available_backends():
+    """Backends whose parser library is installed"""
+    backends = ['html.parser']
+    if lxml is not None:
+        backends.append('lxml')
+    if LexborHTMLParser is not None:
+        backends.append('selectolax')
+    return backends
+
+
+def default_backend():
+    """Fastest backend that is known to match html.parser on real pages"""
+    return 'lxml' if lxml is not None else 'html.parser'
+
+
+def mmsi_from_url(vessel_url):
+    """The MMSI in a vessel page URL (".../name-mmsi-123456789"), or None"""
+    mmsi_match = MMSI_IN_URL.search(vessel_url)
+    return mmsi_match.group(1) if mmsi_match else None
+
+
+def _card_record(fields, vessel_url):
+    """Record of a listing card: its fields, the MMSI from the URL slug and the URL"""
+    record = dict(fields)
+    mmsi = mmsi_from_url(vessel_url)
+    if mmsi:
+        record['mmsi'] = mmsi
+    record['url'] = vessel_url
+    return record
+
+
+def _check_backend(backend):
+    if backend not in available_backends():
+        raise ValueError(f"Parser backend {backend!r} is not available "
+                         f"(installed: {', '.join(available_backends())})")
+
+
+def country_from_flag_text(text):
+    """Extract the country from a "... flag of COUNTRY" sentence, '-' if none"""
+    text = text.strip()
+    if "flag of" not in text.lower():
+        return '-'
+    after_flag = text.split("flag of", 1)[1].strip()
+    # The country is the run of uppercase words following "flag of"
+    country_match = re.search(r'[A-Z]+(?:\s+[A-Z]+)*', after_flag)
+    if not country_match:
+        return '-'
+    return country_match.group().title()
+
+
+def field_name(header):
+    """Turn a table--prop header into a record field name"""
+    return header.lower().replace('/', '_').replace(' ', '_')
+
+
+def voyage_section_html(html):
+    """Slice out the div enclosing the "Voyage Information" label, or None.
+
+    Mirrors soup.find('div', string='Voyage Information').find_parent('div')
+    without building a tree for the rest of the page.
+    """
+    raw_spans = [m.span() for m in RAW_TEXT.finditer(html)]
+    raw_starts = [start for start, _ in raw_spans]
+
+    def in_raw_text(pos):
+        i = bisect.bisect_right(raw_starts, pos) - 1
+        return i >= 0 and pos < raw_spans[i][1]
+
+    label = next((m for m in VOYAGE_LABEL.finditer(html) if not in_raw_text(m.start())), None)
+    if label is None:
+        return None
+
+    # Walk back to the nearest div that is still open at the label
+    depth = 0
+    start = None
+    for tag in reversed([t for t in DIV_TAG.finditer(html, 0, label.start()) if not in_raw_text(t.start())]):
+        if tag.group(1):
+            depth += 1
+        elif depth:
+            depth -= 1
+        else:
+            start = tag.start()
+            break
+    if start is None:
+        return None
+
+    # Then forward to its closing tag
+    depth = 0
+    for tag in DIV_TAG.finditer(html, start):
+        if in_raw_text(tag.start()):
+            continue
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[start:tag.end()]
+    return html[start:]
+
+
+def _details_from_soup(soup, voyage_soup, vessel_url):
+    """Shared BeautifulSoup lookups for the html.parser and lxml backends"""
+    details = {'url': vessel_url}
+
+    # Find the General Information table
+    info_table = soup.find('table', {'class': 'table--prop'})
+    if not info_table:
+        return None
+
+    for row in info_table.find_all('tr'):
+        header = row.find('th').text.strip()
+        value = row.find('td').text.strip()
+        details[field_name(header)] = value
+
+    # Get vessel name from h1 title
+    name_elem = soup.find('h1')
+    if name_elem:
+        details['name'] = name_elem.text.strip()
+
+    # Get country from flag text
+    flag_text = soup.find('p', class_=FLAG_CLASS, string=lambda t: t and 'flag of' in t.lower())
+    details['country'] = country_from_flag_text(flag_text.text) if flag_text else '-'
+    logging.debug("Country for %s: %s", vessel_url, details['country'])
+
+    # Get additional voyage information
+    voyage_info = voyage_soup.find('div', string='Voyage Information') if voyage_soup else None
+    if voyage_info:
+        voyage_section = voyage_info.find_parent('div')
+        if voyage_section:
+            for key, label in VOYAGE_FIELDS:
+                label_elem = voyage_section.find('div', string=label)
+                if label_elem:
+                    details[key] = label_elem.find_next('div').text.strip()
+
+    return details
+
+
+def _single_string(node):
+    """selectolax equivalent of BeautifulSoup's Tag.string"""
+    while True:
+        children = list(node.iter(include_text=True))
+        if len(children) != 1:
+            return None
+        child = children[0]
+        if child.tag == '-text':
+            return child.text_content
+        if child.tag == '-comment':
+            return child.comment_content
+        node = child
+
+
+def _descendants(node, selector):
+    # Unlike BeautifulSoup's find, selectolax includes the node itself
+    return [n for n in node.css(selector) if n.mem_id != node.mem_id]
+
+
+def _details_from_selectolax(html, vessel_url):
+    tree = LexborHTMLParser(html)
+    details = {'url': vessel_url}
+
+    info_table = tree.css_first('table.table--prop')
+    if info_table is None:
+        return None
+
+    for row in _descendants(info_table, 'tr'):
+        header = row.css_first('th').text().strip()
+        value = row.css_first('td').text().strip()
+        details[field_name(header)] = value
+
+    name_elem = tree.css_first('h1')
+    if name_elem is not None:
+        details['name'] = name_elem.text().strip()
+
+    flag_text = None
+    for p in tree.css('p'):
+        if ' '.join((p.attributes.get('class') or '').split()) != FLAG_CLASS:
+            continue
+        string = _single_string(p)
+        if string and 'flag of' in string.lower():
+            flag_text = p
+            break
+    details['country'] = country_from_flag_text(flag_text.text()) if flag_text is not None else '-'
+    logging.debug("Country for %s: %s", vessel_url, details['country'])
+
+    all_divs = tree.css('div')
+    voyage_info = next((d for d in all_divs if _single_string(d) == 'Voyage Information'), None)
+    if voyage_info is not None:
+        voyage_section = voyage_info.parent
+        while voyage_section is not None and voyage_section.tag != 'div':
+            voyage_section = voyage_section.parent
+        if voyage_section is not None:
+            positions = {d.mem_id: i for i, d in enumerate(all_divs)}
+            section_divs = _descendants(voyage_section, 'div')
+            for key, label in VOYAGE_FIELDS:
+                label_elem = next((d for d in section_divs if _single_string(d) == label), None)
+                if label_elem is not None:
+                    # find_next('div'): the next div in document order
+                    value_elem = all_divs[positions[label_elem.mem_id] + 1]
+                    details[key] = value_elem.text().strip()
+
+    return details
+
+
+def parse_vessel_details(html, vessel_url, backend='html.parser'):
+    """Extract the record for one vessel page, or None if it has no details table"""
+    _check_backend(backend)
+    if backend == 'selectolax':
+        return _details_from_selectolax(html, vessel_url)
+    if backend == 'lxml':
+        soup = BeautifulSoup(html, 'lxml', parse_only=DETAIL_STRAINER)
+        section = voyage_section_html(html)
+        voyage_soup = BeautifulSoup(section, 'lxml') if section else None
+        return _details_from_soup(soup, voyage_soup, vessel_url)
+    soup = BeautifulSoup(html, 'html.parser')
+    return _details_from_soup(soup, soup, vessel_url)
+
+
+def parse_vessel_urls(html, base_url, backend='html.parser'):
+    """Absolute URLs of the vessels listed on a listing page, in card order"""
+    _check_backend(backend)
+    if backend == 'selectolax':
+        vessel_urls = []
+        for card in LexborHTMLParser(html).css('div.card--vessel'):
+            vessel_link = next((a for a in _descendants(card, 'a') if a.attributes.get('title') == ' Vessel'), None)
+            if vessel_link is not None:
+                vessel_urls.append(urljoin(base_url, vessel_link.attributes['href']))
+        return vessel_urls
+
+    if backend == 'lxml':
+        soup = BeautifulSoup(html, 'lxml', parse_only=LISTING_STRAINER)
+    else:
+        soup = BeautifulSoup(html, 'html.parser')
+    vessel_urls = []
+    for card in soup.find_all('div', {'class': 'card--vessel'}):
+        # Get vessel URL from the "Show vessel" link
+        vessel_link = card.find('a', {'title': ' Vessel'})
+        if vessel_link:
+            vessel_urls.append(urljoin(base_url, vessel_link['href']))
+    return vessel_urls
+
+
+def parse_vessel_cards(html, base_url, backend='html.parser'):
+    """Records of the vessels listed on a listing page, in card order.
+
+    Each holds what the card itself shows (name, vessel type, flag country),
+    the MMSI from the vessel URL and the URL. Fields a card doesn't show are
+    left out.
+    """
+    _check_backend(backend)
+    cards = []
+    if backend == 'selectolax':
+        for card in LexborHTMLParser(html).css('div.card--vessel'):
+            vessel_link = next((a for a in _descendants(card, 'a') if a.attributes.get('title') == ' Vessel'), None)
+            if vessel_link is None:
+                continue
+            fields = {}
+            for key, class_name in CARD_FIELDS:
+                elem = card.css_first(f'.{class_name}')
+                if elem is not None:
+                    fields[key] = elem.text().strip()
+            cards.append(_card_record(fields, urljoin(base_url, vessel_link.attributes['href'])))
+        return cards
+
+    if backend == 'lxml':
+        soup = BeautifulSoup(html, 'lxml', parse_only=LISTING_STRAINER)
+    else:
+        soup = BeautifulSoup(html, 'html.parser')
+    for card in soup.find_all('div', {'class': 'card--vessel'}):
+        vessel_link = card.find('a', {'title': ' Vessel'})
+        if not vessel_link:
+            continue
+        fields = {}
+        for key, class_name in CARD_FIELDS:
+            elem = card.find(class_=class_name)
+            if elem:
+                fields[key] = elem.text.strip()
+        cards.append(_card_record(fields, urljoin(base_url, vessel_link['href'])))
+    return cards
+
+
+def parse_total_pages(html, backend='html.parser'):
+    """Last numbered page in the pagination (before the locked pages), or None"""
+    _check_backend(backend)
+    if backend == 'selectolax':
+        pagination = LexborHTMLParser(html).css_first('ul.pagination')
+        if pagination is None:
+            logging.error("Could not find pagination element")
+            return None
+        link_texts = [a.text() for a in _descendants(pagination, 'a.pagination__item-link')]
+    else:
+        if backend == 'lxml':
+            soup = BeautifulSoup(html, 'lxml', parse_only=PAGINATION_STRAINER)
+        else:
+            soup = BeautifulSoup(html, 'html.parser')
+        pagination = soup.find('ul', {'class': 'pagination'})
+        if not pagination:
+            logging.error("Could not find pagination element")
+            return None
+        link_texts = [a.text for a in pagination.find_all('a', {'class': 'pagination__item-link'})]
+
+    logging.info(f"Found {len(link_texts)} pagination links")
+    for text in reversed(link_texts):
+        try:
+            page_num = int(text.strip())
+            logging.info(f"Found last page number: {page_num}")
+            return page_num
+        except ValueError:
+            continue
+
+    logging.error("Could not determine last page number")
+    return None
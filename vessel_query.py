@@ -0,0 +1,267 @@
+"""In-memory query index over scraped vessels: bounding box, country and vessel type.
+
+Filtering a scraped CSV with pandas means scanning every row and parsing
+every "lat / lon" position string again for each query. VesselIndex parses
+each record once as it is added:
+
+- positions go into latitude / longitude float64 arrays (see
+  vessel_records.parse_position), plus a grid of cell_size-degree cells
+  listing the vessels in each cell
+- country and vessel_type__sub_type values become integer codes, with an
+  inverted index from each value to its vessels
+
+A query starts from whichever index gives it the fewest candidates (the grid
+cells under the box or the vessels of the requested countries or types) and
+filters those with vectorized comparisons on the arrays. Boxes covering more
+than max_cells grid cells are answered with one scan over the position arrays,
+which is cheaper than visiting that many cells.
+
+Records are keyed by MMSI (their URL if there is none): adding a batch that
+contains vessels already indexed, such as a position refresh, updates them in
+place and moves them between cells and postings.
+
+    python vessel_query.py magicport_fishing_vessels_full_v2.csv vessels_refreshed.csv \\
+        --bbox 35,-10,60,5 --country Spain,France --type "Fishing / FISHING" --output nearby.csv
+"""
+import argparse
+import itertools
+import logging
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from record_sink import export_csv
+from vessel_records import parse_position, parse_text
+
+ATTRIBUTES = ('country', 'vessel_type__sub_type')
+NO_VALUE = -1
+
+
+def vessel_id(record):
+    """Identity of a vessel across batches: its MMSI, or its URL if there is none"""
+    return parse_text(record.get('mmsi')) or record.get('url')
+
+
+def _values(value):
+    """A query value as a list of casefolded strings: 'Spain' or ['Spain', 'France']"""
+    if isinstance(value, str):
+        value = [value]
+    return list(dict.fromkeys(v.strip().casefold() for v in value))
+
+
+class VesselIndex:
+    """Vessel records with a position grid and inverted indexes on country and vessel type"""
+
+    def __init__(self, cell_size=1.0, max_cells=2000):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.records = []
+        self.ids = {}
+        self._capacity = 1024
+        self.latitude = np.full(self._capacity, np.nan)
+        self.longitude = np.full(self._capacity, np.nan)
+        self.codes = {attribute: np.full(self._capacity, NO_VALUE, dtype=np.int32) for attribute in ATTRIBUTES}
+        # attribute -> {casefolded value: code}, and code -> set of rows
+        self.dictionaries = {attribute: {} for attribute in ATTRIBUTES}
+        self.postings = {attribute: [] for attribute in ATTRIBUTES}
+        # (row, column) of a grid cell -> set of rows
+        self.cells = {}
+        self._cell_of = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        while self._capacity < size:
+            self._capacity *= 2
+        for name in ('latitude', 'longitude'):
+            grown = np.full(self._capacity, np.nan)
+            grown[:len(self.records)] = getattr(self, name)[:len(self.records)]
+            setattr(self, name, grown)
+        for attribute, codes in self.codes.items():
+            grown = np.full(self._capacity, NO_VALUE, dtype=np.int32)
+            grown[:len(self.records)] = codes[:len(self.records)]
+            self.codes[attribute] = grown
+
+    def _cell(self, lat, lon):
+        rows = math.ceil(180 / self.cell_size)
+        columns = math.ceil(360 / self.cell_size)
+        return (min(max(int((lat + 90) // self.cell_size), 0), rows - 1),
+                min(max(int((lon + 180) // self.cell_size), 0), columns - 1))
+
+    def _code(self, attribute, value):
+        """Code of an attribute value, adding it to the dictionary if new"""
+        value = parse_text(value)
+        if value is None:
+            return NO_VALUE
+        dictionary = self.dictionaries[attribute]
+        key = value.casefold()
+        if key not in dictionary:
+            dictionary[key] = len(dictionary)
+            self.postings[attribute].append(set())
+        return dictionary[key]
+
+    def add(self, records):
+        """Index a batch of records, updating vessels indexed before. Returns (added, updated)"""
+        records = list(records)
+        self._grow(len(self.records) + len(records))
+        added = updated = 0
+        for record in records:
+            key = vessel_id(record)
+            row = self.ids.get(key) if key else None
+            if row is None:
+                row = len(self.records)
+                self.records.append(record)
+                self._cell_of.append(None)
+                if key:
+                    self.ids[key] = row
+                added += 1
+            else:
+                self._unindex(row)
+                self.records[row] = record
+                updated += 1
+            self._index(row, record)
+        return added, updated
+
+    def _index(self, row, record):
+        lat, lon = parse_position(record.get('position'))
+        if lat is None:
+            self.latitude[row] = self.longitude[row] = np.nan
+        else:
+            self.latitude[row], self.longitude[row] = lat, lon
+            cell = self._cell(lat, lon)
+            self.cells.setdefault(cell, set()).add(row)
+            self._cell_of[row] = cell
+        for attribute in ATTRIBUTES:
+            code = self._code(attribute, record.get(attribute))
+            self.codes[attribute][row] = code
+            if code != NO_VALUE:
+                self.postings[attribute][code].add(row)
+
+    def _unindex(self, row):
+        cell = self._cell_of[row]
+        if cell is not None:
+            self.cells[cell].discard(row)
+            self._cell_of[row] = None
+        for attribute in ATTRIBUTES:
+            code = self.codes[attribute][row]
+            if code != NO_VALUE:
+                self.postings[attribute][code].discard(row)
+
+    def add_file(self, path, chunk_size=20000):
+        """Index a scraped .csv or .jsonl file in chunks, returns (added, updated)"""
+        if path.endswith('.jsonl'):
+            chunks = pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size)
+        else:
+            chunks = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        added = updated = 0
+        for chunk in chunks:
+            chunk_added, chunk_updated = self.add(chunk.to_dict('records'))
+            added += chunk_added
+            updated += chunk_updated
+        logging.info(f"Indexed {path}: {added} new vessels, {updated} updated")
+        return added, updated
+
+    def _box_cells(self, south, west, north, east):
+        """Grid cells overlapping a box, or None if there are more than max_cells"""
+        bottom, left = self._cell(south, west)
+        top, right = self._cell(north, east)
+        column_ranges = [range(left, right + 1)]
+        if west > east:
+            # The box crosses the antimeridian
+            column_ranges = [range(left, self._cell(0, 180)[1] + 1), range(0, right + 1)]
+        if (top - bottom + 1) * sum(len(columns) for columns in column_ranges) > self.max_cells:
+            return None
+        return [self.cells[(r, c)] for r in range(bottom, top + 1)
+                for columns in column_ranges for c in columns if (r, c) in self.cells]
+
+    def _in_box(self, rows, south, west, north, east):
+        lat, lon = self.latitude[rows], self.longitude[rows]
+        inside = (lat >= south) & (lat <= north)
+        if west <= east:
+            return inside & (lon >= west) & (lon <= east)
+        return inside & ((lon >= west) | (lon <= east))
+
+    def match(self, bbox=None, country=None, vessel_type=None):
+        """Sorted row numbers of the vessels matching every filter given.
+
+        bbox is (south, west, north, east) in degrees, west > east for a box
+        across the antimeridian; country and vessel_type are a value or a
+        list of values, matched case-insensitively.
+        """
+        filters = {attribute: _values(value) for attribute, value in
+                   (('country', country), ('vessel_type__sub_type', vessel_type)) if value is not None}
+        # Candidate sources: (size, sets of rows, attribute the sets come from)
+        sources = []
+        for attribute, values in filters.items():
+            dictionary = self.dictionaries[attribute]
+            postings = [self.postings[attribute][dictionary[v]] for v in values if v in dictionary]
+            sources.append((sum(len(p) for p in postings), postings, attribute))
+        cells = self._box_cells(*bbox) if bbox is not None else None
+        if cells is not None:
+            sources.append((sum(len(cell) for cell in cells), cells, 'bbox'))
+
+        if sources:
+            _, sets, driver = min(sources, key=lambda source: source[0])
+            rows = np.fromiter(itertools.chain.from_iterable(sets), dtype=np.int64)
+        else:
+            driver = None
+            rows = np.arange(len(self.records))
+        if bbox is not None and len(rows):
+            rows = rows[self._in_box(rows, *bbox)]
+        for attribute, values in filters.items():
+            if attribute == driver or not len(rows):
+                continue
+            dictionary = self.dictionaries[attribute]
+            codes = [dictionary[v] for v in values if v in dictionary]
+            rows = rows[np.isin(self.codes[attribute][rows], codes)]
+        rows.sort()
+        return rows
+
+    def query(self, bbox=None, country=None, vessel_type=None):
+        """Records of the vessels matching every filter given (see match)"""
+        return [self.records[row] for row in self.match(bbox, country, vessel_type)]
+
+    def count(self, bbox=None, country=None, vessel_type=None):
+        return len(self.match(bbox, country, vessel_type))
+
+
+def parse_bbox(value):
+    """'south,west,north,east' -> tuple of floats"""
+    bbox = tuple(float(part) for part in value.split(','))
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError('expected south,west,north,east')
+    return bbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='scraped .csv or .jsonl files, indexed in the order given')
+    parser.add_argument('--bbox', type=parse_bbox, help='south,west,north,east in degrees')
+    parser.add_argument('--country', help='comma-separated countries')
+    parser.add_argument('--type', dest='vessel_type', help='comma-separated vessel types, e.g. "Fishing / FISHING"')
+    parser.add_argument('--cell-size', type=float, default=1.0, help='grid cell size in degrees')
+    parser.add_argument('--output', help='write the matching vessels to this CSV')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = VesselIndex(cell_size=args.cell_size)
+    for path in args.files:
+        index.add_file(path)
+
+    start = time.perf_counter()
+    matches = index.query(args.bbox, args.country.split(',') if args.country else None,
+                          args.vessel_type.split(',') if args.vessel_type else None)
+    elapsed = time.perf_counter() - start
+    logging.info(f"{len(matches)} of {len(index)} vessels match ({elapsed * 1000:.2f} ms)")
+    if args.output:
+        count = export_csv(matches, args.output, sort_by='name')
+        logging.info(f"Saved {count} vessels to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Typed, columnar form of scraped vessel records.
+
+The scrapers produce records of display strings ("32 m", "5,500 MTs", "-"
+for missing values, the same few hundred country names over and over).
+to_frame turns a batch of them into a pandas DataFrame with one typed column
+per field:
+
+- length, gross_tonnage, deadweight: float32 (metres, tonnes), NaN if missing
+- mmsi, imo, year_built: nullable unsigned integers
+- position: split into latitude / longitude float64 columns
+- country, vessel type, shipyard, destination, position age: categoricals
+- name, call_sign, url: strings, with "-" turned into missing values
+
+write_parquet streams records into a Parquet file chunk by chunk with a
+fixed Arrow schema (categoricals stored dictionary-encoded), and
+read_parquet loads it back with the same dtypes, without re-parsing any
+strings. Needs pyarrow.
+"""
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EMPTY_VALUES = ('', '-')
+
+# Field kinds, in output column order
+MEASURE_FIELDS = ('gross_tonnage', 'deadweight', 'length')
+INTEGER_FIELDS = {'mmsi': 'UInt32', 'imo': 'UInt32', 'year_built': 'UInt16'}
+CATEGORY_FIELDS = ('vessel_type__sub_type', 'built_at_(shipyard)', 'country', 'reported_destination',
+                   'position_received')
+STRING_FIELDS = ('name', 'call_sign', 'url')
+TYPED_COLUMNS = [
+    'name', 'mmsi', 'imo', 'call_sign', 'vessel_type__sub_type', 'gross_tonnage', 'deadweight', 'length',
+    'year_built', 'built_at_(shipyard)', 'country', 'reported_destination', 'latitude', 'longitude',
+    'position_received', 'url',
+]
+
+NUMBER = re.compile(r'-?\d[\d,]*(?:\.\d+)?')
+
+
+def parse_text(value):
+    """A string field, None for the site's empty markers"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value in EMPTY_VALUES else value
+
+
+def parse_measure(value):
+    """"32 m" -> 32.0, "5,500 MTs" -> 5500.0, "-" -> None"""
+    value = parse_text(value)
+    if value is None:
+        return None
+    number = NUMBER.search(value)
+    return float(number.group().replace(',', '')) if number else None
+
+
+def parse_integer(value, limit=2 ** 32):
+    """"2019" -> 2019; None unless the value is all digits and below limit"""
+    value = parse_text(value)
+    if value is None or not value.isdigit() or int(value) >= limit:
+        return None
+    return int(value)
+
+
+def parse_position(value):
+    """"12.34567 / -45.6789" -> (12.34567, -45.6789), (None, None) if missing or invalid"""
+    value = parse_text(value)
+    if value is None or '/' not in value:
+        return None, None
+    lat_text, lon_text = value.split('/', 1)
+    try:
+        lat, lon = float(lat_text), float(lon_text)
+    except ValueError:
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, None
+    return lat, lon
+
+
+def to_frame(records):
+    """Typed DataFrame (TYPED_COLUMNS) from an iterable of scraped record dicts"""
+    columns = {column: [] for column in TYPED_COLUMNS}
+    unknown = set()
+    for record in records:
+        for field in STRING_FIELDS + CATEGORY_FIELDS:
+            columns[field].append(parse_text(record.get(field)))
+        for field in MEASURE_FIELDS:
+            columns[field].append(parse_measure(record.get(field)))
+        for field, dtype in INTEGER_FIELDS.items():
+            columns[field].append(parse_integer(record.get(field), 2 ** 16 if dtype == 'UInt16' else 2 ** 32))
+        lat, lon = parse_position(record.get('position'))
+        columns['latitude'].append(lat)
+        columns['longitude'].append(lon)
+        unknown.update(record.keys() - columns.keys() - {'position'})
+    if unknown:
+        logging.warning(f"Fields {sorted(unknown)} have no typed column and were left out")
+
+    frame = {}
+    for column, values in columns.items():
+        if column in MEASURE_FIELDS:
+            frame[column] = np.array([np.nan if v is None else v for v in values], dtype='float32')
+        elif column in ('latitude', 'longitude'):
+            frame[column] = np.array([np.nan if v is None else v for v in values], dtype='float64')
+        elif column in INTEGER_FIELDS:
+            frame[column] = pd.array(values, dtype=INTEGER_FIELDS[column])
+        elif column in CATEGORY_FIELDS:
+            frame[column] = pd.Categorical(values)
+        else:
+            frame[column] = pd.array(values, dtype='string')
+    return pd.DataFrame(frame, columns=TYPED_COLUMNS)
+
+
+def arrow_schema():
+    """Arrow schema of the typed columns, identical for every chunk written"""
+    fields = []
+    for column in TYPED_COLUMNS:
+        if column in MEASURE_FIELDS:
+            field_type = pa.float32()
+        elif column in ('latitude', 'longitude'):
+            field_type = pa.float64()
+        elif column in INTEGER_FIELDS:
+            field_type = pa.uint16() if INTEGER_FIELDS[column] == 'UInt16' else pa.uint32()
+        elif column in CATEGORY_FIELDS:
+            field_type = pa.dictionary(pa.int32(), pa.string())
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(column, field_type))
+    return pa.schema(fields)
+
+
+def arrow_table(records, schema=None):
+    """pyarrow Table of a batch of records, in the typed schema"""
+    return pa.Table.from_pandas(to_frame(records), schema=schema or arrow_schema(), preserve_index=False)
+
+
+def write_parquet(records, filename, chunk_size=50000):
+    """Write records to a Parquet file in chunks, returns the number written"""
+    if pa is None:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = arrow_schema()
+    count = 0
+    writer = None
+    chunk = []
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                writer = writer or pq.ParquetWriter(filename, schema)
+                writer.write_table(arrow_table(chunk, schema))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer = writer or pq.ParquetWriter(filename, schema)
+            writer.write_table(arrow_table(chunk, schema))
+            count += len(chunk)
+    finally:
+        if writer:
+            writer.close()
+    return count
+
+
+def read_parquet(filename):
+    """Load a Parquet file written by write_parquet as a typed DataFrame"""
+    if pa is None:
+        raise ImportError("Parquet loading needs pyarrow (pip install pyarrow)")
+    # Keep missing integers and strings as pandas NA rather than floats and None
+    dtypes = {pa.uint32(): pd.UInt32Dtype(), pa.uint16(): pd.UInt16Dtype(), pa.string(): pd.StringDtype()}
+    return pq.read_table(filename).to_pandas(types_mapper=dtypes.get)